@@ -0,0 +1,203 @@
+import heapq
+import math
+import random
+import numpy as np
+from ipsampler import CidrTable, HeavyHitters
+from samplegen import high_risk_cidrs, malicious_patterns
+
+TIME_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_seconds(value):
+    """
+    Parse a duration: a number of seconds or a string such as "90s", "10m", "2h".
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    if value[-1] in TIME_UNITS:
+        return float(value[:-1]) * TIME_UNITS[value[-1]]
+    return float(value)
+
+def parse_window(value):
+    # A duration, or a [min, max] range to draw from
+    if isinstance(value, (list, tuple)):
+        low, high = (parse_seconds(v) for v in value)
+        return low, high
+    seconds = parse_seconds(value)
+    return seconds, seconds
+
+class Campaign:
+    """
+    One attack campaign: a set of malicious patterns sent from a set of
+    source addresses, between `start` and `end`.
+
+    Attacks either follow a Poisson process at `rate` per hour, or are
+    spaced by a uniformly drawn `interval` (min, max) in seconds.
+
+    Args:
+        name (str): Label used in the log output.
+        patterns (list): Entries of samplegen.malicious_patterns.
+        sources (callable): Returns one client IP per call.
+        start (float): Unix time of the first attack.
+        end (float): Unix time after which the campaign stops.
+        rate (float): Attacks per hour.
+        interval (tuple): (min, max) seconds between attacks.
+    """
+
+    def __init__(self, name, patterns, sources, start, end=math.inf, rate=None, interval=None):
+        if not rate and not interval:
+            raise ValueError(f"Campaign {name}: set a rate or an interval")
+        self.name = name
+        self.patterns = patterns
+        self.sources = sources
+        self.start = start
+        self.end = end
+        self.rate = rate
+        self.interval = interval
+        self.attacks = 0
+
+    def next_after(self, moment, rand):
+        if self.rate:
+            return moment + rand.expovariate(self.rate / 3600)
+        return moment + rand.uniform(*self.interval)
+
+class AttackScheduler:
+    """
+    Priority queue of attack campaigns, keyed by each one's next attack.
+
+    `due()` is called once per chunk of events with the pacer's (or the
+    simulated) clock. When no attack is due that is a single comparison
+    with the head of the heap, so any number of overlapping campaigns adds
+    no per-event cost.
+
+    Args:
+        campaigns (list): Campaign objects.
+        rand (random.Random): Source of the attack timing and patterns.
+        log (callable): Receives the campaign start and finish messages.
+    """
+
+    def __init__(self, campaigns, rand=random, log=print):
+        self.rand = rand
+        self.log = log
+        self.campaigns = campaigns
+        self.heap = [(campaign.start, index, campaign)
+                     for index, campaign in enumerate(campaigns) if campaign.start < campaign.end]
+        heapq.heapify(self.heap)
+
+    @property
+    def next_time(self):
+        return self.heap[0][0] if self.heap else math.inf
+
+    def due(self, now, limit):
+        """
+        Pop the attacks scheduled up to `now`.
+
+        Args:
+            now (float): Current Unix time, real or simulated.
+            limit (int): Most attacks to return; the rest stay due and
+                come out on the next call.
+
+        Returns:
+            list: (campaign, pattern, client IP) per attack.
+        """
+        heap = self.heap
+        if not heap or heap[0][0] > now:
+            return []
+
+        rand = self.rand
+        attacks = []
+        while heap and heap[0][0] <= now and len(attacks) < limit:
+            moment, index, campaign = heapq.heappop(heap)
+            if campaign.attacks == 0:
+                self.log(f"Attack campaign {campaign.name} started")
+            campaign.attacks += 1
+            attacks.append((campaign, rand.choice(campaign.patterns), campaign.sources()))
+
+            following = campaign.next_after(moment, rand)
+            if following < campaign.end:
+                heapq.heappush(heap, (following, index, campaign))
+            else:
+                self.log(f"Attack campaign {campaign.name} finished after {campaign.attacks:,} attack(s)")
+        return attacks
+
+def select_patterns(spec):
+    # All patterns, or those whose URI is listed
+    if not spec or spec == "all":
+        return list(malicious_patterns)
+    by_uri = {pattern[0]: pattern for pattern in malicious_patterns}
+    unknown = [uri for uri in spec if uri not in by_uri]
+    if unknown:
+        raise ValueError(f"Unknown attack pattern(s): {', '.join(unknown)}")
+    return [by_uri[uri] for uri in spec]
+
+def source_sampler(table, population, skew, rand):
+    """
+    Return a callable producing client IPs from `table`: uniform over the
+    table, or, with a `population`, Zipf-skewed over that many addresses.
+    """
+    if population:
+        return HeavyHitters(table, int(population), float(skew), np.random.default_rng(rand.getrandbits(64)))
+    return lambda: table.sample(rand)
+
+def default_campaigns(start, rand=random):
+    """
+    The built-in background campaign: any pattern from a high-risk country,
+    first 5–10 minutes into the run, then every 40–60 minutes.
+    """
+    table = CidrTable(high_risk_cidrs)
+    return [Campaign("background", list(malicious_patterns), lambda: table.sample(rand),
+                     start + rand.uniform(300, 600), interval=(2400, 3600))]
+
+def load_campaigns(config, start, duration, rand=random):
+    """
+    Build the campaigns in `attack_campaigns`, or the default one.
+
+    Each entry accepts:
+        name: Label (default "campaign-N").
+        patterns: URIs from malicious_patterns, or "all" (default).
+        cidrs: Source CIDRs (default: the high-risk country blocks).
+        sources, skew: Draw from this many source addresses, Zipf-skewed.
+        rate: Attacks per hour (Poisson), or
+        interval: Seconds between attacks, a number or [min, max].
+        start: Offset of the first attack from the start of the run, a
+            duration ("10m") or a [min, max] range (default 0).
+        duration: How long the campaign lasts (default: the whole run).
+        copies: Run this many independent copies, each with its own start
+            and sources (default 1).
+
+    Args:
+        config (dict): Configuration settings.
+        start (float): Unix time the run starts at (simulated in backfill).
+        duration (float): Length of the run in seconds.
+        rand (random.Random): Random source.
+
+    Returns:
+        list: Campaign objects.
+    """
+    specs = config.get("attack_campaigns")
+    if specs is None:
+        return default_campaigns(start, rand)
+
+    campaigns = []
+    for number, spec in enumerate(specs):
+        patterns = select_patterns(spec.get("patterns"))
+        table = CidrTable(spec.get("cidrs") or high_risk_cidrs)
+        rate = float(spec["rate"]) if spec.get("rate") else None
+        interval = parse_window(spec["interval"]) if spec.get("interval") is not None else None
+        first, last = parse_window(spec.get("start", 0))
+        length = parse_seconds(spec["duration"]) if spec.get("duration") else duration
+        copies = int(spec.get("copies", 1))
+        name = spec.get("name", f"campaign-{number + 1}")
+
+        for copy in range(copies):
+            begin = start + rand.uniform(first, last)
+            campaigns.append(Campaign(
+                f"{name}#{copy + 1}" if copies > 1 else name,
+                patterns,
+                source_sampler(table, spec.get("sources"), spec.get("skew", 1.1), rand),
+                begin,
+                begin + length,
+                rate = rate,
+                interval = interval,
+            ))
+    return campaigns
@@ -1,5 +1,5 @@
-import ipaddress
 import random
+from ipsampler import cidr_table
 
 def generate_random_ip(network):
     """
@@ -11,10 +11,9 @@ def generate_random_ip(network):
     Returns:
         str: A random IP address within the network.
     """
-    net = ipaddress.ip_network(network)
-    # Skip the first and last address to avoid network and broadcast addresses
-    ip = net.network_address + random.randint(1, net.num_addresses - 2)
-    return str(ip)
+    # The range is compiled once per network; the first and last
+    # addresses (network and broadcast) are skipped
+    return cidr_table((network,)).sample()
 
 # AWS US East (N. Virginia) IP ranges
 us_east_ranges = [
@@ -28,22 +27,18 @@ us_west_ranges = [
     "52.32.0.0/14"
 ]
 
-def simulate_ips_for_region(region_ranges, count=5):
+def simulate_ips_for_region(region_ranges, count=5, rand=random):
     """
     Simulate a list of random IP addresses for a given AWS region.
     
     Args:
         region_ranges (list): List of IP ranges for the region.
         count (int): Number of IP addresses to generate.
+        rand (random.Random): Random source; seed it for a fixed set.
         
     Returns:
         list: A list of random IP addresses.
     """
-    ips = []
-    for _ in range(count):
-        # Randomly choose a network range
-        selected_network = random.choice(region_ranges)
-        # Generate a random IP within the selected range
-        random_ip = generate_random_ip(selected_network)
-        ips.append(random_ip)
-    return ips
+    # Each call picks a range at random, then an address within it
+    table = cidr_table(tuple(region_ranges))
+    return [table.sample(rand) for _ in range(count)]
@@ -0,0 +1,384 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime as dt, timezone
+from dispatcher import percentile
+
+# Stages in run order. pool_build writes the pool cache that later stages load.
+STAGES = (
+    "pool_build",
+    "pool_load",
+    "generate_event",
+    "draw",
+    "serialize_json",
+    "encode",
+    "batch",
+    "dispatch_event",
+    "end_to_end_file",
+    "end_to_end_http",
+)
+
+def rss_bytes():
+    # Current resident set size, from /proc on Linux
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+def peak_rss_bytes():
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+def chunked(total, chunk):
+    while total > 0:
+        n = min(chunk, total)
+        yield n
+        total -= n
+
+class Bench:
+    """
+    Fixtures shared by the stage functions, built from the command line.
+
+    Everything random is seeded from `seed`, so two runs of the same commit
+    do the same work.
+    """
+
+    def __init__(self, args, workdir):
+        import numpy as np
+        from aws_ip_generator import simulate_ips_for_region, us_east_ranges, us_west_ranges
+
+        self.args = args
+        self.events = args.events
+        self.chunk = args.chunk
+        self.workdir = workdir
+        self.cache_dir = os.path.join(workdir, "pool")
+        random.seed(args.seed)
+        self.rng = np.random.default_rng(args.seed)
+        self.config = {
+            "webhook_url": None,
+            "auth_token": "bench",
+            "server_ips": simulate_ips_for_region(us_east_ranges) + simulate_ips_for_region(us_west_ranges),
+            "content_encoding": args.content_encoding,
+            "max_in_flight": args.max_in_flight,
+            "profile": args.profile,
+        }
+
+    def pool(self):
+        from samplepool import cached_sample_pool
+        return cached_sample_pool(self.args.pool_size, self.args.seed, self.cache_dir)
+
+    def encoder(self):
+        from encoder import open_encoder
+        return open_encoder(self.config, self.pool(), "bench")
+
+    def rows(self, encoder):
+        # What draws the rows: the encoder, or a client population
+        if not self.args.sessions:
+            return encoder
+        from sessions import SessionEngine
+        return SessionEngine(encoder, self.pool(), self.args.sessions, self.rng)
+
+    def timed(self, work, total=None):
+        """
+        Run work(n) over `total` events in chunks, timing each chunk.
+
+        Returns:
+            tuple: (seconds, bytes returned by work, per-event latencies).
+        """
+        latencies = []
+        size = 0
+        clock = time.perf_counter
+        start = clock()
+        for n in chunked(self.events if total is None else total, self.chunk):
+            began = clock()
+            size += work(n) or 0
+            latencies.append((clock() - began) / n)
+        return clock() - start, size, latencies
+
+    def receiver(self):
+        from receiver import Receiver
+        server = Receiver(("127.0.0.1", 0), token=self.config["auth_token"])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+def stage_pool_build(bench):
+    from samplepool import build_sample_pool, cache_path, save_sample_pool
+    start = time.perf_counter()
+    pool = build_sample_pool(bench.args.pool_size, bench.args.seed)
+    seconds = time.perf_counter() - start
+    save_sample_pool(pool, cache_path(bench.cache_dir, bench.args.pool_size, bench.args.seed),
+                     bench.args.pool_size, bench.args.seed)
+    values = pool.unique_values()
+    return {"events": values, "seconds": seconds, "latencies": [seconds / values]}
+
+def stage_pool_load(bench):
+    from samplepool import cached_sample_pool
+    start = time.perf_counter()
+    pool = cached_sample_pool(bench.args.pool_size, bench.args.seed, bench.cache_dir)
+    # Decode every mapped string, as a long run eventually does
+    for table in pool.tables.values():
+        for i in range(len(table)):
+            table[i]
+    seconds = time.perf_counter() - start
+    values = pool.unique_values()
+    return {"events": values, "seconds": seconds, "latencies": [seconds / values]}
+
+def stage_generate_event(bench):
+    # Dict-building path, still used for attack events
+    from eventgen import generate_event
+    next_sample = bench.pool().sampler(bench.rng)
+    config = bench.config
+
+    def work(n):
+        for _ in range(n):
+            generate_event(next_sample(), config)
+
+    seconds, _, latencies = bench.timed(work)
+    return {"events": bench.events, "seconds": seconds, "latencies": latencies}
+
+def stage_draw(bench):
+    source = bench.rows(bench.encoder())
+    seconds, _, latencies = bench.timed(lambda n: source.draw(n, bench.rng) and 0)
+    return {"events": bench.events, "seconds": seconds, "latencies": latencies}
+
+def stage_serialize_json(bench):
+    from eventgen import generate_event
+    next_sample = bench.pool().sampler(bench.rng)
+    events = [generate_event(next_sample(), bench.config) for _ in range(bench.events)]
+    position = 0
+
+    def work(n):
+        nonlocal position
+        size = 0
+        for event in events[position:position + n]:
+            size += len(json.dumps(event).encode("utf-8"))
+        position += n
+        return size
+
+    seconds, size, latencies = bench.timed(work)
+    return {"events": bench.events, "bytes": size, "seconds": seconds, "latencies": latencies}
+
+def stage_encode(bench):
+    encoder = bench.encoder()
+    rows = bench.rows(encoder).draw(bench.events, bench.rng)
+    position = 0
+
+    def work(n):
+        nonlocal position
+        lines = encoder.encode(rows[position:position + n])
+        position += n
+        return sum(map(len, lines))
+
+    seconds, size, latencies = bench.timed(work)
+    return {"events": bench.events, "bytes": size, "seconds": seconds, "latencies": latencies}
+
+def stage_batch(bench):
+    from compression import payload_factory
+    from pipeline import batcher_from_config
+    encoder = bench.encoder()
+    lines = encoder.encode(encoder.draw(bench.events, bench.rng))
+    batcher = batcher_from_config(bench.config, payload_factory(bench.config))
+    position = 0
+
+    def work(n):
+        nonlocal position
+        size = 0
+        for line in lines[position:position + n]:
+            bundle = batcher.add(line)
+            if bundle is not None:
+                size += len(bundle.finish())
+        position += n
+        return size
+
+    seconds, size, latencies = bench.timed(work)
+    start = time.perf_counter()
+    bundle = batcher.flush()
+    if bundle is not None:
+        size += len(bundle.finish())
+    seconds += time.perf_counter() - start
+    return {"events": bench.events, "bytes": size, "seconds": seconds, "latencies": latencies}
+
+def stage_dispatch_event(bench):
+    from dispatcher import Dispatcher
+    from eventgen import dispatch_event, generate_event
+    server = bench.receiver()
+    config = dict(bench.config, webhook_url=server.url)
+    next_sample = bench.pool().sampler(bench.rng)
+    batch = bench.args.batch_events
+    events = [generate_event(next_sample(), config) for _ in range(batch)]
+
+    dispatcher = Dispatcher(config)
+    start = time.perf_counter()
+    for n in chunked(bench.events, batch):
+        dispatch_event(events[:n], config, dispatcher)
+    dispatcher.close()
+    seconds = time.perf_counter() - start
+    server.shutdown()
+
+    stats = dispatcher.stats()
+    return {"events": stats["events"], "bytes": stats["bytes"], "seconds": seconds,
+            "p50_ms": stats["latency_p50_ms"] / batch, "p99_ms": stats["latency_p99_ms"] / batch,
+            "batch_p50_ms": stats["latency_p50_ms"], "batch_p99_ms": stats["latency_p99_ms"],
+            "failed": stats["failed"]}
+
+def run_end_to_end(bench, config):
+    # The full generate -> serialize -> batch -> send pipeline, unpaced
+    from compression import payload_factory
+    from filesink import open_sink, sink_payload_config
+    from pipeline import Pipeline, TokenBucket, batcher_from_config
+    encoder = bench.encoder()
+    source = bench.rows(encoder)
+    sink = open_sink(config)
+    pipeline = Pipeline(
+        send = sink.submit,
+        serialize = encoder.encode,
+        batcher = batcher_from_config(config, payload_factory(sink_payload_config(config))),
+    )
+    start = time.perf_counter()
+    pipeline.run([(0, bench.events)], lambda n, now: source.draw(n, bench.rng), TokenBucket(0))
+    sink.close()
+    seconds = time.perf_counter() - start
+    return pipeline, sink.stats(), seconds
+
+def stage_end_to_end_file(bench):
+    config = dict(bench.config, output="file", file_dir=os.path.join(bench.workdir, "output"),
+                  file_compression=bench.args.content_encoding)
+    pipeline, stats, seconds = run_end_to_end(bench, config)
+    return {"events": stats["events"], "bytes": pipeline.sent_bytes, "seconds": seconds}
+
+def stage_end_to_end_http(bench):
+    server = bench.receiver()
+    config = dict(bench.config, webhook_url=server.url)
+    pipeline, stats, seconds = run_end_to_end(bench, config)
+    server.shutdown()
+    return {"events": stats["events"], "bytes": stats["bytes"], "seconds": seconds,
+            "batch_p50_ms": stats["latency_p50_ms"], "batch_p99_ms": stats["latency_p99_ms"],
+            "failed": stats["failed"]}
+
+def _run_stage(name, args, workdir, results):
+    baseline = rss_bytes()
+    bench = Bench(args, workdir)
+    result = globals()[f"stage_{name}"](bench)
+    result["baseline_rss_bytes"] = baseline
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    results.send(result)
+
+def run_stage(name, args, workdir):
+    """
+    Run one stage in a fresh process, so peak RSS is measured per stage.
+
+    Returns:
+        dict: Events/s, bytes/s, per-event latency percentiles and RSS.
+    """
+    context = multiprocessing.get_context("fork")
+    receive, send = context.Pipe(duplex=False)
+    worker = context.Process(target=_run_stage, args=(name, args, workdir, send), name=f"bench-{name}")
+    worker.start()
+    send.close()
+    try:
+        result = receive.recv()
+    except EOFError:
+        worker.join()
+        raise RuntimeError(f"Benchmark stage {name} failed (exit code {worker.exitcode})")
+    worker.join()
+
+    latencies = result.pop("latencies", None)
+    if latencies:
+        result["p50_ms"] = percentile(latencies, 50) * 1000
+        result["p99_ms"] = percentile(latencies, 99) * 1000
+    seconds = result["seconds"]
+    result["events_per_sec"] = result["events"] / seconds if seconds else 0
+    if "bytes" in result:
+        result["bytes_per_sec"] = result["bytes"] / seconds if seconds else 0
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_result(name, result):
+    line = f"{name:<18} {result['events_per_sec']:>14,.0f} events/s"
+    if "bytes_per_sec" in result:
+        line += f" {result['bytes_per_sec'] / 1024**2:>9,.1f} MB/s"
+    else:
+        line += " " * 15
+    if "p50_ms" in result:
+        line += f"  p50 {result['p50_ms'] * 1000:>9,.2f} µs  p99 {result['p99_ms'] * 1000:>9,.2f} µs"
+    return line + f"  peak RSS {result['peak_rss_bytes'] / 1024**2:,.0f} MB"
+
+def compare(results, baseline_path):
+    # Events/s change per stage against an earlier results file
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    for name, result in results["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before or not before.get("events_per_sec"):
+            continue
+        change = (result["events_per_sec"] / before["events_per_sec"] - 1) * 100
+        flag = " [!]" if change <= -10 else ""
+        print(f"{name:<18} {before['events_per_sec']:>14,.0f} -> {result['events_per_sec']:>14,.0f} events/s ({change:+.1f} %){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each generator stage and the full pipeline.")
+    parser.add_argument("--events", type=int, default=200000, help="Events per stage")
+    parser.add_argument("--pool-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--chunk", type=int, default=256, help="Events per timed chunk")
+    parser.add_argument("--batch-events", type=int, default=2000, help="Events per dispatch_event call")
+    parser.add_argument("--content-encoding", choices=("gzip", "zstd"), help="Compress batches and files")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--profile", default="hec", choices=("hec", "ods", "record"),
+                        help="Output profile for the encode, batch and end-to-end stages")
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="Draw rows from a population of this many clients (see sessions.py)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    import numpy as np
+    results = {
+        "commit": git_commit(),
+        "date": dt.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": vars(args),
+        "stages": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="eventgen-bench-") as workdir:
+        for name in sorted(stages, key=STAGES.index):
+            result = run_stage(name, args, workdir)
+            results["stages"][name] = result
+            print(format_result(name, result), flush=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[✓] Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__=="__main__":
+    main()
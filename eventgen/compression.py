@@ -0,0 +1,94 @@
+import zlib
+
+# zstd support is optional; only needed when content_encoding is "zstd"
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Default compression level per Content-Encoding
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+class PayloadBuilder:
+    """
+    Build a newline-delimited request body one serialized event at a time.
+
+    With a `content_encoding` of "gzip" or "zstd", each event is fed to a
+    streaming compressor as it is added, so the uncompressed bundle never
+    has to exist as one string before it is sent.
+
+    Args:
+        content_encoding (str): None/"identity", "gzip" or "zstd".
+        level (int): Compression level; defaults per encoding.
+    """
+
+    def __init__(self, content_encoding=None, level=None):
+        self.content_encoding = normalize_encoding(content_encoding)
+        self.events = 0
+        self.raw_bytes = 0
+        self.chunks = []
+
+        if self.content_encoding == "gzip":
+            level = DEFAULT_LEVELS["gzip"] if level is None else level
+            # wbits=31 selects the gzip container
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif self.content_encoding == "zstd":
+            level = DEFAULT_LEVELS["zstd"] if level is None else level
+            self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self.compressor = None
+
+    def add(self, line):
+        """
+        Append one serialized event (bytes, without a trailing newline).
+        """
+        if self.events:
+            line = b"\n" + line
+        self.events += 1
+        self.raw_bytes += len(line)
+
+        if self.compressor is None:
+            self.chunks.append(line)
+        else:
+            chunk = self.compressor.compress(line)
+            if chunk:
+                self.chunks.append(chunk)
+
+    def finish(self):
+        """
+        Return the complete request body.
+
+        Returns:
+            bytes: The (possibly compressed) payload.
+        """
+        if self.compressor is not None:
+            self.chunks.append(self.compressor.flush())
+            self.compressor = None
+        return b"".join(self.chunks)
+
+def normalize_encoding(content_encoding):
+    """
+    Validate a configured Content-Encoding.
+
+    Args:
+        content_encoding (str): Value from config.json.
+
+    Returns:
+        str: "gzip", "zstd", or None for an uncompressed body.
+    """
+    if content_encoding in (None, "", "identity", "none"):
+        return None
+    encoding = content_encoding.lower()
+    if encoding not in DEFAULT_LEVELS:
+        raise ValueError(f"Unsupported content_encoding '{content_encoding}'. Use 'gzip' or 'zstd'.")
+    if encoding == "zstd" and zstandard is None:
+        raise ValueError("content_encoding 'zstd' requires the zstandard package (pip install zstandard).")
+    return encoding
+
+def payload_factory(config):
+    """
+    Return a callable that starts a new PayloadBuilder for `config`.
+    """
+    content_encoding = normalize_encoding(config.get("content_encoding"))
+    level = config.get("compression_level")
+    return lambda: PayloadBuilder(content_encoding, level)
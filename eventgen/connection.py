@@ -0,0 +1,206 @@
+import ipaddress
+import os
+import ssl
+import threading
+from urllib.parse import urlparse, urlunparse
+import requests
+from requests.adapters import HTTPAdapter
+
+def verify_setting(config):
+    """
+    Return the `verify` value for requests from the TLS settings.
+
+    Args:
+        config (dict): Configuration settings (`tls_verify`,
+            `tls_ca_bundle`).
+
+    Returns:
+        bool or str: False to skip certificate checks, a CA bundle path,
+            or True for the default bundle.
+    """
+    if not config.get("tls_verify", True):
+        return False
+    return config.get("tls_ca_bundle") or True
+
+def default_ca_bundle():
+    # The bundle requests itself would pick
+    return os.environ.get("REQUESTS_CA_BUNDLE") or os.environ.get("CURL_CA_BUNDLE") or requests.certs.where()
+
+class ResumableSocket(ssl.SSLSocket):
+    # Hands its TLS session back to the context before closing; TLS 1.3
+    # tickets only arrive after the handshake, with the first response
+    def close(self):
+        self.context.remember(self)
+        super().close()
+
+class ResumableContext(ssl.SSLContext):
+    """
+    Client TLS context that resumes the last session it saw.
+
+    Python only resumes a session that is passed in explicitly, so every
+    new connection through this context offers the most recent session
+    from an earlier one (preflight's handshake, then the pooled dispatch
+    connections). A resumed handshake skips the certificate exchange and
+    the key agreement's public-key operations.
+
+    Args:
+        verify (bool or str): As requests' `verify`: True checks
+            certificates against the bundle requests would use, a path
+            against that bundle, and False not at all.
+    """
+
+    def __new__(cls, verify=True, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, verify=True, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.session = None
+        self.sslsocket_class = ResumableSocket
+        if verify is False:
+            self.check_hostname = False
+            self.verify_mode = ssl.CERT_NONE
+        else:
+            self.load_verify_locations(default_ca_bundle() if verify is True else verify)
+
+    def remember(self, sock):
+        try:
+            session = sock.session
+        except (ValueError, OSError):
+            return
+        if session is not None and (session.has_ticket or session.id):
+            self.session = session
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if kwargs.get("session") is None and self.session is not None:
+            kwargs["session"] = self.session
+        ssock = super().wrap_socket(sock, *args, **kwargs)
+        self.remember(ssock)
+        return ssock
+
+class ConnectionContext:
+    """
+    What preflight learned about the endpoint, kept for dispatch.
+
+    Dispatch connects to the address preflight resolved and checked
+    instead of resolving the host again, and resumes preflight's TLS
+    session. The URL keeps its host name for SNI, certificate checks and
+    the Host header.
+
+    Args:
+        url (str): The endpoint URL.
+        address (str): Resolved IP address to connect to.
+        ssl_context (ResumableContext): TLS context with the session of
+            preflight's handshake; None for plain HTTP.
+    """
+
+    def __init__(self, url, address, ssl_context=None):
+        parsed = urlparse(url)
+        self.scheme = parsed.scheme
+        self.hostname = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.address = address
+        self.ssl_context = ssl_context
+
+    def serves(self, url):
+        """
+        Return True if `url` is on the endpoint this context was made for.
+        """
+        parsed = urlparse(url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        return (parsed.scheme, parsed.hostname, port) == (self.scheme, self.hostname, self.port)
+
+    def pin(self, url):
+        """
+        Return `url` with its host replaced by the resolved address.
+        """
+        parsed = urlparse(url)
+        host = self.address
+        if ipaddress.ip_address(host).version == 6:
+            host = f"[{host}]"
+        netloc = f"{host}:{parsed.port}" if parsed.port else host
+        return urlunparse(parsed._replace(netloc=netloc))
+
+    @property
+    def host_header(self):
+        default = 443 if self.scheme == "https" else 80
+        return self.hostname if self.port == default else f"{self.hostname}:{self.port}"
+
+    def adapter(self, **kwargs):
+        """
+        Return an HTTPAdapter for pinned URLs, see PinnedAdapter.
+        """
+        return PinnedAdapter(self, **kwargs)
+
+    def session(self):
+        """
+        Return a requests.Session that sends pinned URLs to this endpoint.
+        """
+        session = requests.Session()
+        session.mount(f"{self.scheme}://", self.adapter())
+        session.headers["Host"] = self.host_header
+        return session
+
+class PinnedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter for URLs rewritten by ConnectionContext.pin: TLS uses the
+    original host name for SNI and certificate checks, and the context's
+    resumable TLS context.
+    """
+
+    def __init__(self, connection, **kwargs):
+        self.connection = connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.connection.scheme == "https":
+            pool_kwargs["server_hostname"] = self.connection.hostname
+            if self.connection.ssl_context is not None:
+                pool_kwargs["ssl_context"] = self.connection.ssl_context
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+def warm_pool(session, url, count, timeout=5, verify=True):
+    """
+    Open `count` keep-alive connections to `url` in `session`'s pool, in
+    parallel, so the first batches don't wait for TCP and TLS handshakes.
+
+    Args:
+        session (requests.Session): Session the batches will be sent with.
+        url (str): Where they will be sent.
+        count (int): Connections to open; capped at the pool size.
+        timeout (float): Connect timeout per connection, in seconds.
+        verify (bool or str): Certificate checks, as requests' `verify`.
+
+    Returns:
+        int: Connections opened.
+    """
+    adapter = session.get_adapter(url)
+    settings = session.merge_environment_settings(url, {}, None, verify, None)
+    if hasattr(adapter, "get_connection_with_tls_context"):
+        request = session.prepare_request(requests.Request("POST", url))
+        pool = adapter.get_connection_with_tls_context(request, settings["verify"], settings["proxies"], settings["cert"])
+    else:
+        pool = adapter.get_connection(url, settings["proxies"])
+
+    # urllib3 has no public call to open idle connections: check them out
+    # of the pool, connect them, and put them back
+    connections = [pool._get_conn() for _ in range(min(count, pool.pool.maxsize))]
+    opened = []
+
+    def connect(conn):
+        try:
+            conn.timeout = timeout
+            conn.connect()
+            opened.append(conn)
+        except Exception as e:
+            conn.close()
+            print(f"[!] Could not pre-open a connection: {e}")
+
+    threads = [threading.Thread(target=connect, args=(conn,)) for conn in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # A failed connection goes back as an empty slot, which the pool
+    # fills with a fresh connection when it is needed
+    for conn in connections:
+        pool._put_conn(conn if conn in opened else None)
+    return len(opened)
@@ -0,0 +1,515 @@
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from compression import normalize_encoding
+from connection import verify_setting, warm_pool
+from metrics import Histogram, metric
+from pipeline import parse_batch_bytes
+from spool import open_spool
+
+# Statuses worth retrying; anything else that is not 2xx is a rejected batch
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+def percentile(values, pct):
+    """
+    Return the `pct` percentile of `values` using nearest-rank.
+
+    Args:
+        values (list): Numbers to summarize.
+        pct (float): Percentile between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0 for an empty list.
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date.
+
+    Returns:
+        float: Seconds to wait, or None if the header is absent or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class AimdController:
+    """
+    Additive-increase, multiplicative-decrease control of the dispatch
+    window (batches in flight) and of the batch size, as TCP congestion
+    avoidance does with its congestion window.
+
+    Every fast, successful response grows the window by 1/window and the
+    batch size by increase_bytes/window, i.e. by one batch and by
+    `increase_bytes` per round trip of a full window. A 429, 413, 5xx, a
+    timeout or connection error, or a response much slower than the recent
+    best, cuts both by `decrease`. The no-queueing latency of a batch is
+    estimated as the best recent latency plus its size times the best
+    recent time per byte, so growing batches alone don't read as
+    congestion. Only one cut is made per round trip:
+    responses to batches sent before the last cut say nothing about the
+    new window. The window settles around the most the endpoint sustains.
+
+    Args:
+        window (float): Starting batches in flight.
+        max_window (int): Most batches in flight.
+        batch_bytes (int): Starting batch size (uncompressed bytes).
+        min_batch_bytes, max_batch_bytes (int): Bounds of the batch size.
+        increase_bytes (int): Batch growth per round trip.
+        decrease (float): Factor applied on congestion.
+        latency_factor (float): A response slower than this many times
+            the estimate from the last LATENCY_WINDOW responses counts as
+            congestion.
+    """
+
+    # Responses kept for the latency baseline
+    LATENCY_WINDOW = 64
+    # Latency never counts as congestion below this, in seconds
+    MIN_SLOW = 0.05
+
+    def __init__(self, window=4, max_window=64, batch_bytes=1024**2, min_batch_bytes=64 * 1024,
+                 max_batch_bytes=8 * 1024**2, increase_bytes=64 * 1024, decrease=0.5, latency_factor=3.0):
+        self.window = float(window)
+        self.max_window = int(max_window)
+        self.batch_bytes = float(batch_bytes)
+        self.min_batch_bytes = min_batch_bytes
+        self.max_batch_bytes = max_batch_bytes
+        self.increase_bytes = increase_bytes
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self.cut_at = 0.0
+        self.cuts = 0
+        self.batchers = []
+        self.lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        return max(1, int(self.window))
+
+    def attach(self, batcher):
+        """
+        Let the controller set `batcher.max_bytes`.
+        """
+        self.batchers.append(batcher)
+        batcher.max_bytes = int(self.batch_bytes)
+
+    def on_response(self, sent_at, latency, size, congested):
+        """
+        Update the window and batch size from one response.
+
+        Args:
+            sent_at (float): time.perf_counter() when the batch was sent.
+            latency (float): Seconds until the response.
+            size (int): Request body bytes.
+            congested (bool): The endpoint signalled overload or failed.
+        """
+        with self.lock:
+            slow = False
+            if len(self.latencies) >= 8:
+                expected = (min(latency for latency, _ in self.latencies)
+                            + size * min(per_byte for _, per_byte in self.latencies))
+                slow = latency > max(expected * self.latency_factor, self.MIN_SLOW)
+            if not congested:
+                self.latencies.append((latency, latency / max(size, 1)))
+
+            if not congested and not slow:
+                self.window = min(self.max_window, self.window + 1 / self.window)
+                self.batch_bytes = min(self.max_batch_bytes, self.batch_bytes + self.increase_bytes / self.window)
+            elif sent_at >= self.cut_at:
+                self.window = max(1.0, self.window * self.decrease)
+                self.batch_bytes = max(self.min_batch_bytes, self.batch_bytes * self.decrease)
+                self.cut_at = time.perf_counter()
+                self.cuts += 1
+            batch_bytes = int(self.batch_bytes)
+
+        for batcher in self.batchers:
+            batcher.max_bytes = batch_bytes
+
+    def summary(self):
+        return f"window {self.window:.1f}, batch {self.batch_bytes / 1024**2:.2f} MB, {self.cuts:,} cut(s)"
+
+def aimd_from_config(config, max_in_flight):
+    """
+    Build the AimdController for `"aimd": true`, or return None.
+    """
+    if not config.get("aimd"):
+        return None
+    return AimdController(
+        window = max_in_flight,
+        max_window = int(config.get("aimd_max_in_flight", 64)),
+        batch_bytes = parse_batch_bytes(config.get("batch_max_bytes", 1024**2)),
+        min_batch_bytes = parse_batch_bytes(config.get("aimd_min_batch_bytes", 64 * 1024)),
+        max_batch_bytes = parse_batch_bytes(config.get("aimd_max_batch_bytes", 8 * 1024**2)),
+        latency_factor = float(config.get("aimd_latency_factor", 3.0)),
+    )
+
+class Dispatcher:
+    """
+    Pooled, concurrent HTTP dispatcher for event bundles.
+
+    A single `requests.Session` keeps keep-alive connections open, so TLS is
+    negotiated once per connection instead of once per batch, and up to
+    `max_in_flight` batches are on the wire at once.
+
+    Every batch is first written to a spool (durable when `spool_dir` is
+    configured) and only acknowledged once the endpoint accepts it. Failed
+    batches stay in the spool and are retried with exponential backoff and
+    jitter, honouring `Retry-After` on 429/503. While a backlog exists the
+    dispatcher drains it with `drain_factor` times the usual concurrency.
+
+    With a preflight ConnectionContext under `connection` in the config,
+    batches go to the address preflight resolved and new connections
+    resume its TLS session. `warm_connections` connections (by default
+    `max_in_flight` after a preflight check) are opened up front, so the
+    first batches don't pay for the handshakes.
+
+    With `"aimd": true` an AimdController sets the number of batches in
+    flight, and the batch size of any batcher attached to it, from the
+    endpoint's responses; `max_in_flight` is then only the starting point.
+
+    Args:
+        config (dict): Generator configuration (`webhook_url`, `auth_token`).
+        max_in_flight (int): Batches allowed on the wire at once.
+        timeout (float): Per-request timeout in seconds.
+        spool (Spool): Overrides the spool selected by `spool_dir`.
+    """
+
+    def __init__(self, config, max_in_flight=None, timeout=None, spool=None):
+        self.webhook_url = config["webhook_url"]
+        self.max_in_flight = int(max_in_flight or config.get("max_in_flight", 4))
+        self.timeout = float(timeout or config.get("request_timeout", 30))
+        self.drain_factor = max(1, int(config.get("drain_factor", 2)))
+        self.backoff_base = float(config.get("retry_backoff_base", 0.5))
+        self.backoff_max = float(config.get("retry_backoff_max", 60))
+
+        self.controller = aimd_from_config(config, self.max_in_flight)
+        workers = self.controller.max_window if self.controller else self.max_in_flight * self.drain_factor
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {config["auth_token"]}'
+        })
+        # Passed per request: requests lets REQUESTS_CA_BUNDLE override
+        # a session-wide setting
+        self.verify = verify_setting(config)
+        connection = config.get("connection")
+        if connection is not None and connection.serves(self.webhook_url):
+            adapter = connection.adapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+            self.url = connection.pin(self.webhook_url)
+            self.session.headers["Host"] = connection.host_header
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+            self.url = self.webhook_url
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Opt-in compressed bodies; payloads must be built to match
+        self.content_encoding = normalize_encoding(config.get("content_encoding"))
+
+        self.spool = spool or open_spool(config)
+        # A durable spool may grow up to spool_max_bytes during an outage;
+        # an in-memory one only holds a couple of batches per connection
+        self.max_pending_bytes = (int(config.get("spool_max_bytes", 1024**3)) if self.spool.durable
+                                  else None)
+
+        self.cond = threading.Condition()
+        self.pending = deque(self.spool.pending())
+        self.in_flight = 0
+        self.retry_at = 0.0
+        self.consecutive_failures = 0
+        self.closing = False
+        self.error = None
+
+        # Per-batch results
+        self.batches = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.events = 0
+        self.bytes = 0
+        # Latencies of the most recent batches, for percentiles
+        self.latencies = deque(maxlen=4096)
+        self.latency_histogram = Histogram()
+        # Responses by HTTP status, or "error" when no response came back
+        self.statuses = {}
+
+        # Warm up by default only after a preflight check, i.e. in a run
+        warm = int(config.get("warm_connections", self.max_in_flight if connection is not None else 0))
+        if warm > 0:
+            self.warm(warm)
+
+        self.threads = [threading.Thread(target=self._worker, name=f"dispatch-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def warm(self, count):
+        """
+        Open `count` pooled connections now, before the first batch.
+        """
+        began = time.perf_counter()
+        opened = warm_pool(self.session, self.url, count, min(self.timeout, 10), self.verify)
+        if opened:
+            print(f"[✓] Opened {opened} connection(s) to {urlparse(self.webhook_url).netloc} "
+                  f"in {(time.perf_counter() - began) * 1000:.0f} ms")
+
+    def submit(self, payload, event_count=0):
+        """
+        Spool a serialized bundle and queue it for delivery.
+
+        Blocks while the backlog is over its limit, which propagates
+        backpressure to the pipeline stages feeding the dispatcher.
+
+        Args:
+            payload (bytes): Newline-joined events, encoded to match
+                the configured content_encoding.
+            event_count (int): Number of events in the bundle.
+        """
+        with self.cond:
+            while not self._has_room() and not self.error:
+                self.cond.wait(0.5)
+        if self.error:
+            raise self.error
+
+        record = self.spool.append(payload, event_count, self.content_encoding)
+        with self.cond:
+            self.pending.append(record)
+            self.cond.notify()
+
+    def _has_room(self):
+        if self.max_pending_bytes is None:
+            window = self.controller.concurrency if self.controller else self.max_in_flight
+            return len(self.pending) + self.in_flight < window * 2
+        return self.spool.pending_bytes < self.max_pending_bytes
+
+    def _concurrency(self):
+        if self.controller:
+            return self.controller.concurrency
+        # Drain a backlog faster than the steady-state rate
+        if len(self.pending) > self.max_in_flight:
+            return self.max_in_flight * self.drain_factor
+        return self.max_in_flight
+
+    def _next_record(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.closing:
+                    return None
+                if self.pending and self.in_flight < self._concurrency() and now >= self.retry_at:
+                    self.in_flight += 1
+                    return self.pending.popleft()
+                # Sleep out a backoff, or until a batch or a slot frees up
+                self.cond.wait(self.retry_at - now if self.pending and self.retry_at > now else None)
+
+    def _worker(self):
+        try:
+            while True:
+                record = self._next_record()
+                if record is None:
+                    return
+                try:
+                    self._deliver(record)
+                finally:
+                    with self.cond:
+                        self.in_flight -= 1
+                        self.cond.notify_all()
+        except BaseException as e:
+            self.error = e
+            with self.cond:
+                self.cond.notify_all()
+
+    def _deliver(self, record):
+        payload = self.spool.read(record)
+        headers = {"Content-Encoding": record.content_encoding} if record.content_encoding else None
+        retry_after = None
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=payload, headers=headers, timeout=self.timeout,
+                                         verify=self.verify)
+            status = response.status_code
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response.close()
+        except requests.RequestException as e:
+            print(f"Failed to send data: {e}")
+            status = None
+        latency = time.perf_counter() - start
+
+        if self.controller:
+            congested = status is None or status in RETRYABLE_STATUS or status == 413
+            self.controller.on_response(start, latency, record.length, congested)
+        self.latency_histogram.observe(latency)
+        with self.cond:
+            self.latencies.append(latency)
+            key = "error" if status is None else str(status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+            if status is not None and 200 <= status < 300:
+                self.spool.ack(record)
+                self.batches += 1
+                self.events += record.events
+                self.bytes += record.length
+                self.consecutive_failures = 0
+                return
+
+            self.failed += 1
+            if status is not None and status not in RETRYABLE_STATUS:
+                # The endpoint rejected the batch itself; resending won't help
+                self.spool.ack(record)
+                self.dropped += 1
+                print(f"Failed to send data. Status code: {status}. Dropping batch of {record.events} event(s).")
+                return
+
+            # Keep the batch at the head of the backlog and back off
+            self.pending.appendleft(record)
+            self.retries += 1
+            self.consecutive_failures += 1
+            delay = self._backoff(retry_after if status in (429, 503) else None)
+            self.retry_at = max(self.retry_at, time.monotonic() + delay)
+
+        if status is not None:
+            print(f"Failed to send data. Status code: {status}. Retrying in {delay:.1f} s.")
+
+    def _backoff(self, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Exponential backoff with "equal jitter"
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self.consecutive_failures - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every spooled batch has been delivered.
+
+        Returns:
+            bool: False if `timeout` expired with batches still pending.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while (self.pending or self.in_flight) and not self.error:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(0.5 if remaining is None else min(0.5, remaining))
+        if self.error:
+            raise self.error
+        return True
+
+    def close(self, timeout=None):
+        """
+        Drain the backlog (for up to `timeout` seconds) and release resources.
+
+        Batches left in a durable spool are resent by the next run.
+        """
+        drained = False
+        try:
+            drained = self.flush(timeout)
+        finally:
+            with self.cond:
+                self.closing = True
+                # Whatever is left stays on disk for the next run when
+                # the spool is durable, and is abandoned otherwise
+                unsent = len(self.pending)
+                self.pending.clear()
+                self.cond.notify_all()
+            for thread in self.threads:
+                thread.join()
+            self.session.close()
+            self.spool.close()
+        if not drained:
+            where = "remain in the spool" if self.spool.durable else "were discarded"
+            print(f"[!] Dispatch did not drain within {timeout} s; {unsent:,} unsent batch(es) {where}.")
+        return drained
+
+    def stats(self):
+        """
+        Summarize dispatch results so far.
+
+        Returns:
+            dict: Batch counts, delivered events/bytes and latency in ms.
+        """
+        with self.cond:
+            latencies = list(self.latencies)
+            stats = {
+                "batches": self.batches,
+                "failed": self.failed,
+                "retries": self.retries,
+                "dropped": self.dropped,
+                "backlog": len(self.pending),
+                "backlog_bytes": self.spool.pending_bytes,
+                "events": self.events,
+                "bytes": self.bytes,
+                "in_flight": self.in_flight,
+            }
+        stats.update({
+            "latency_avg_ms": (sum(latencies) / len(latencies) * 1000) if latencies else 0,
+            "latency_p50_ms": percentile(latencies, 50) * 1000,
+            "latency_p99_ms": percentile(latencies, 99) * 1000,
+            "latency_last_ms": latencies[-1] * 1000 if latencies else 0,
+        })
+        return stats
+
+    def metrics(self):
+        """
+        Collector for a metrics Registry.
+        """
+        with self.cond:
+            statuses = dict(self.statuses)
+            values = (self.batches, self.failed, self.retries, self.dropped, self.events, self.bytes,
+                      len(self.pending), self.spool.pending_bytes, self.in_flight)
+        batches, failed, retries, dropped, events, sent_bytes, backlog, backlog_bytes, in_flight = values
+        return [
+            metric("eventgen_dispatch_batches_total", "counter", "Batches by outcome.", samples=[
+                ("", {"result": "delivered"}, batches),
+                ("", {"result": "failed"}, failed),
+                ("", {"result": "retried"}, retries),
+                ("", {"result": "dropped"}, dropped),
+            ]),
+            metric("eventgen_dispatch_events_total", "counter", "Events accepted by the endpoint.", events),
+            metric("eventgen_dispatch_bytes_total", "counter", "Request body bytes accepted by the endpoint.", sent_bytes),
+            metric("eventgen_dispatch_responses_total", "counter", "Responses by HTTP status.",
+                   samples=[("", {"code": code}, count) for code, count in sorted(statuses.items())]),
+            metric("eventgen_dispatch_backlog", "gauge", "Batches waiting to be sent.", backlog),
+            metric("eventgen_dispatch_backlog_bytes", "gauge", "Bytes waiting to be sent.", backlog_bytes),
+            metric("eventgen_dispatch_in_flight", "gauge", "Batches on the wire.", in_flight),
+            metric("eventgen_dispatch_concurrency", "gauge", "Batches allowed on the wire.",
+                   self.controller.window if self.controller else self.max_in_flight),
+            metric("eventgen_dispatch_latency_seconds", "histogram", "Batch POST latency.",
+                   samples=self.latency_histogram.samples()),
+        ] + self._controller_metrics()
+
+    def _controller_metrics(self):
+        if not self.controller:
+            return []
+        return [
+            metric("eventgen_dispatch_batch_bytes_target", "gauge", "Batch size set by the AIMD controller.",
+                   int(self.controller.batch_bytes)),
+            metric("eventgen_dispatch_congestion_cuts_total", "counter", "AIMD window cuts.", self.controller.cuts),
+        ]
+
+    def summary(self):
+        stats = self.stats()
+        return (f"{stats['batches']:,} batch(es), {stats['failed']:,} failed, "
+                f"{stats['backlog']:,} spooled, {stats['in_flight']} in flight, "
+                f"batch latency avg {stats['latency_avg_ms']:.0f} ms "
+                f"p50 {stats['latency_p50_ms']:.0f} ms p99 {stats['latency_p99_ms']:.0f} ms"
+                + (f", {self.controller.summary()}" if self.controller else ""))
@@ -0,0 +1,347 @@
+import json
+import os
+import re
+import time
+import numpy as np
+
+# Output layout of generate_event() as serialized by json.dumps (the "hec"
+# profile). Every %b slot takes an already JSON-encoded fragment;
+# everything else is written once here instead of being rebuilt and
+# re-escaped for every event.
+EVENT_FORMAT = (
+    b'{"event": {"message": %b, "severity": %b}, "time": %b, "host": %b, '
+    b'"source": "Python Generator", "sourcetype": "http-access-record", "index": "", "fields": {}, '
+    b'"protocol": %b, "client_ip": %b, "server_ip": %b, "method": %b, "uri": %b, '
+    b'"response_code": %b, "duration": %b, '
+    b'"request_headers": {"Host": %b, "User-Agent": %b, "Content-Type": %b}, '
+    b'"response_headers": {"Content-Type": "application/json", "Content-Length": %b}, '
+    b'"content_type": "application/json", "user": %b}'
+)
+
+# The hand-picked record the case-01 trigger scripts post on HTTP_RESPONSE
+# (the "ods" profile), in their field order and as compact as
+# JSON.stringify writes it. Headers are what HTTP.findHeaders returns:
+# arrays of name/value objects.
+ODS_FORMAT = (
+    b'{"protocol":%b,"client_ip":%b,"server_ip":%b,"method":%b,"uri":%b,'
+    b'"request_headers":[{"name":"Host","value":%b},{"name":"User-Agent","value":%b},'
+    b'{"name":"Content-Type","value":%b}],'
+    b'"response_headers":%b,"user_agent":%b,"content_type":%b,"referrer":null,'
+    b'"response_code":%b,"duration":%b}'
+)
+
+# An ExtraHop HTTP record, as posted from HTTP.commitRecord (the "record"
+# profile)
+RECORD_FORMAT = (
+    b'{"clientAddr":%b,"clientPort":%b,"serverAddr":%b,"serverPort":%b,"encryptionProtocol":%b,'
+    b'"method":%b,"uri":%b,"host":%b,"statusCode":%b,"userAgent":%b,"referer":null,'
+    b'"reqContentType":%b,"contentType":"application/json","rspSize":%b,"roundTripTime":%b,'
+    b'"isSQLi":false,"isXSS":false,"isPipelined":false,"isRspAborted":false}'
+)
+
+# Separators of JSON.stringify, which the trigger scripts post with
+COMPACT = (",", ":")
+
+# Range of the round-trip time that generate_event() assigns
+RTT_RANGE = (20, 501)
+# Range of the Content-Length response header in benign samples
+CONTENT_LENGTH_RANGE = (0, 10001)
+# Ephemeral client ports of the "record" profile
+CLIENT_PORTS = (49152, 65536)
+
+def bake(fmt, fixed):
+    """
+    Write constant fragments into some %b slots of a format once.
+
+    Args:
+        fmt (bytes): Format with %b slots.
+        fixed (dict): Slot position -> bytes written into that slot.
+
+    Returns:
+        bytes: Format with only the remaining slots left as %b.
+    """
+    parts = fmt.split(b"%b")
+    baked = parts[0]
+    for slot, part in enumerate(parts[1:]):
+        baked += fixed[slot].replace(b"%", b"%%") if slot in fixed else b"%b"
+        baked += part
+    return baked
+
+def json_fragments(values):
+    """
+    JSON-encode every value of a table once.
+
+    Returns:
+        list: UTF-8 encoded JSON fragment per value, in table order.
+    """
+    return [json.dumps(values[i]).encode("utf-8") for i in range(len(values))]
+
+class EventEncoder:
+    """
+    Compiled serializer for benign events drawn from a SamplePool.
+
+    Each pool column is pre-encoded into JSON fragments and the record
+    envelope is baked into a single bytes format. Per event, only the
+    variable fragments (time, IPs, RTT, request fields) are selected by
+    index and spliced into the format, which produces what
+    `json.dumps(generate_event(...))` would, without building any dicts.
+    The constant message, severity and host are baked into the format up
+    front, and `time` is written with millisecond precision.
+
+    Rows are plain tuples of column indices, so they are cheap to draw in
+    the generation stage and to hand to the serialization stage.
+
+    This is the "hec" output profile. The other profiles (see PROFILES)
+    subclass it: they draw the same rows from the same tables and only
+    bake a different layout, so every profile serializes at the same speed
+    and a seed gives the same traffic in every format.
+
+    Args:
+        pool (SamplePool): Source of the column values.
+        server_ips (list): Server addresses, as in `config["server_ips"]`.
+        host (str): Value of the envelope `host` field.
+    """
+
+    def __init__(self, pool, server_ips, host=None):
+        tables = pool.tables
+        self.protocol = json_fragments(tables["protocol"])
+        self.client_ip = json_fragments(tables["client_ip"])
+        self.server_ip = json_fragments(server_ips)
+        self.method = json_fragments(tables["method"])
+        self.uri = json_fragments(tables["uri"])
+        self.status_code = json_fragments(tables["status_code"])
+        self.host_header = json_fragments(tables["host"])
+        self.user_agent = json_fragments(tables["user_agent"])
+        self.content_type = json_fragments(tables["content_type"])
+        self.user = json_fragments(tables["user"])
+        self.rtt = [str(value).encode() for value in range(RTT_RANGE[1])]
+        self.content_length = [b'"%d"' % value for value in range(CONTENT_LENGTH_RANGE[1])]
+
+        self.host = json.dumps(host or os.uname()[1]).encode("utf-8")
+        self.message = json.dumps("Common incoming request.").encode("utf-8")
+        self.severity = b"1"
+        self.format = bake(EVENT_FORMAT, {0: self.message, 1: self.severity, 3: self.host})
+
+        self.columns = [
+            ("protocol", len(self.protocol)),
+            ("client_ip", len(self.client_ip)),
+            ("server_ip", len(self.server_ip)),
+            ("method", len(self.method)),
+            ("uri", len(self.uri)),
+            ("status_code", len(self.status_code)),
+            ("host", len(self.host_header)),
+            ("user_agent", len(self.user_agent)),
+            ("content_type", len(self.content_type)),
+            ("user", len(self.user)),
+        ]
+
+    def draw(self, n, rng):
+        """
+        Draw `n` rows of column indices in one vectorized pass per column.
+
+        Args:
+            n (int): Number of rows.
+            rng (numpy.random.Generator): Random source.
+
+        Returns:
+            list: Row tuples, see `encode`.
+        """
+        columns = [rng.integers(0, size, size=n, dtype=np.int32).tolist() for _, size in self.columns]
+        columns.append(rng.integers(*RTT_RANGE, size=n, dtype=np.int32).tolist())
+        columns.append(rng.integers(*CONTENT_LENGTH_RANGE, size=n, dtype=np.int32).tolist())
+        return list(zip(*columns))
+
+    def encode(self, rows, times=None):
+        """
+        Serialize rows (and any prebuilt event dicts mixed in) to JSON lines.
+
+        Args:
+            rows (list): Row tuples from `draw`, or event dicts, which are
+                passed through json.dumps.
+            times (list): Per-row `time` values (backfill); defaults to
+                the current time as each row is encoded.
+
+        Returns:
+            list: One UTF-8 encoded JSON line (bytes) per row.
+        """
+        fmt = self.format
+        protocol, client_ip, server_ip = self.protocol, self.client_ip, self.server_ip
+        method, uri, status_code = self.method, self.uri, self.status_code
+        host_header, user_agent, content_type = self.host_header, self.user_agent, self.content_type
+        user, rtt, content_length = self.user, self.rtt, self.content_length
+
+        clock = time.time
+        lines = []
+        append = lines.append
+        for i, row in enumerate(rows):
+            timestamp = clock() if times is None else times[i]
+            if type(row) is dict:
+                append(json.dumps(self.reshape(row, timestamp)).encode("utf-8"))
+                continue
+            (p, c, s, m, u, sc, h, ua, ct, us, d, cl) = row
+            append(fmt % (
+                b"%.3f" % timestamp,
+                protocol[p], client_ip[c], server_ip[s], method[m], uri[u],
+                status_code[sc], rtt[d],
+                host_header[h], user_agent[ua], content_type[ct],
+                content_length[cl], user[us],
+            ))
+        return lines
+
+    def reshape(self, event, timestamp):
+        """
+        Turn an event dict built by generate_event (attacks) into this
+        profile's layout.
+        """
+        event["time"] = round(timestamp, 3)
+        return event
+
+def header_list(headers):
+    # HTTP.findHeaders output for a headers dict
+    return [{"name": name, "value": value} for name, value in headers.items()]
+
+def xss_fragments(uri):
+    # What HTTP.xss reports: the script fragments of the request
+    return re.findall(r"<script>.*?</script>", uri)
+
+class OdsRecordEncoder(EventEncoder):
+    """
+    Compiled serializer for the "ods" profile: the record the case-01
+    trigger scripts build on HTTP_RESPONSE and post to the Open Data
+    Stream, with no envelope and no timestamp.
+    """
+
+    def __init__(self, pool, server_ips, host=None):
+        super().__init__(pool, server_ips, host)
+        # HTTP.encryptionProtocol is null on plain HTTP
+        self.encryption = [b'"TLSv1.3"' if value == "HTTPS" else b"null" for value in pool.tables["protocol"]]
+        self.response_headers = [
+            b'[{"name":"Content-Type","value":"application/json"},{"name":"Content-Length","value":%b}]' % value
+            for value in self.content_length
+        ]
+
+    def encode(self, rows, times=None):
+        fmt = ODS_FORMAT
+        encryption, client_ip, server_ip = self.encryption, self.client_ip, self.server_ip
+        method, uri, status_code = self.method, self.uri, self.status_code
+        host_header, user_agent, content_type = self.host_header, self.user_agent, self.content_type
+        rtt, response_headers = self.rtt, self.response_headers
+
+        lines = []
+        append = lines.append
+        for row in rows:
+            if type(row) is dict:
+                append(json.dumps(self.reshape(row, None), separators=COMPACT).encode("utf-8"))
+                continue
+            (p, c, s, m, u, sc, h, ua, ct, us, d, cl) = row
+            headers = response_headers[cl]
+            append(fmt % (
+                encryption[p], client_ip[c], server_ip[s], method[m], uri[u],
+                host_header[h], user_agent[ua], content_type[ct],
+                headers, user_agent[ua], headers, status_code[sc], rtt[d],
+            ))
+        return lines
+
+    def reshape(self, event, timestamp):
+        response_headers = header_list(event["response_headers"])
+        record = {
+            "protocol": "TLSv1.3" if event["protocol"] == "HTTPS" else None,
+            "client_ip": event["client_ip"],
+            "server_ip": event["server_ip"],
+            "method": event["method"],
+            "uri": event["uri"],
+            "request_headers": header_list(event["request_headers"]),
+            "response_headers": response_headers,
+            "user_agent": event["request_headers"]["User-Agent"],
+            "content_type": response_headers,
+            "referrer": None,
+            "response_code": event["response_code"],
+            "duration": event["duration"],
+        }
+        xss = xss_fragments(event["uri"])
+        if xss:
+            record["xss"] = xss
+        return record
+
+class HttpRecordEncoder(EventEncoder):
+    """
+    Compiled serializer for the "record" profile: a full ExtraHop HTTP
+    record, as the trigger scripts post HTTP.commitRecord, with no
+    envelope and no timestamp.
+    """
+
+    def __init__(self, pool, server_ips, host=None):
+        super().__init__(pool, server_ips, host)
+        protocols = pool.tables["protocol"]
+        self.encryption = [b'"TLSv1.3"' if value == "HTTPS" else b"null" for value in protocols]
+        self.server_port = [b"443" if value == "HTTPS" else b"80" for value in protocols]
+        self.client_port = [str(port).encode() for port in range(*CLIENT_PORTS)]
+        self.response_size = [str(value).encode() for value in range(CONTENT_LENGTH_RANGE[1])]
+
+    def encode(self, rows, times=None):
+        fmt = RECORD_FORMAT
+        encryption, server_port, client_port = self.encryption, self.server_port, self.client_port
+        client_ip, server_ip = self.client_ip, self.server_ip
+        method, uri, status_code = self.method, self.uri, self.status_code
+        host_header, user_agent, content_type = self.host_header, self.user_agent, self.content_type
+        rtt, response_size = self.rtt, self.response_size
+        ports = len(client_port)
+
+        lines = []
+        append = lines.append
+        for row in rows:
+            if type(row) is dict:
+                append(json.dumps(self.reshape(row, None), separators=COMPACT).encode("utf-8"))
+                continue
+            (p, c, s, m, u, sc, h, ua, ct, us, d, cl) = row
+            # The row has no port column: mix two independent draws
+            append(fmt % (
+                client_ip[c], client_port[(cl * 7919 + d) % ports], server_ip[s], server_port[p], encryption[p],
+                method[m], uri[u], host_header[h], status_code[sc], user_agent[ua],
+                content_type[ct], response_size[cl], rtt[d],
+            ))
+        return lines
+
+    def reshape(self, event, timestamp):
+        https = event["protocol"] == "HTTPS"
+        size = int(event["response_headers"]["Content-Length"])
+        return {
+            "clientAddr": event["client_ip"],
+            "clientPort": CLIENT_PORTS[0] + (size * 7919 + event["duration"]) % (CLIENT_PORTS[1] - CLIENT_PORTS[0]),
+            "serverAddr": event["server_ip"],
+            "serverPort": 443 if https else 80,
+            "encryptionProtocol": "TLSv1.3" if https else None,
+            "method": event["method"],
+            "uri": event["uri"],
+            "host": event["request_headers"]["Host"],
+            "statusCode": event["response_code"],
+            "userAgent": event["request_headers"]["User-Agent"],
+            "referer": None,
+            "reqContentType": event["request_headers"]["Content-Type"],
+            "contentType": "application/json",
+            "rspSize": size,
+            "roundTripTime": event["duration"],
+            "isSQLi": "SQL injection" in event["event"]["message"],
+            "isXSS": bool(xss_fragments(event["uri"])),
+            "isPipelined": False,
+            "isRspAborted": False,
+        }
+
+# Output profiles, by the name used for `profile` in config.json
+PROFILES = {
+    "hec": EventEncoder,
+    "ods": OdsRecordEncoder,
+    "record": HttpRecordEncoder,
+}
+
+def open_encoder(config, pool, host=None):
+    """
+    Build the compiled serializer for `config["profile"]` (default "hec").
+
+    Raises:
+        ValueError: For an unknown profile.
+    """
+    profile = config.get("profile", "hec")
+    if profile not in PROFILES:
+        raise ValueError(f"Unsupported profile '{profile}'. Use one of: {', '.join(PROFILES)}.")
+    return PROFILES[profile](pool, config["server_ips"], host)
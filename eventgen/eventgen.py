@@ -3,27 +3,37 @@ import os
 import requests
 import random
 import time
-import math
-from datetime import datetime as dt, timezone, timedelta
+import numpy as np
+from datetime import datetime as dt, timezone
 from aws_ip_generator import simulate_ips_for_region, us_east_ranges, us_west_ranges
-from samplegen import getMaliciousEntry, getBeningEntries
+from samplegen import getMaliciousEntry
+from attacks import AttackScheduler, load_campaigns
+from ipsampler import random_public_ipv4
+from samplepool import cached_sample_pool
+from encoder import open_encoder
 from preflight import preflight_check
+from connection import verify_setting
+from pipeline import ByteBudget, Pipeline, ScheduleClock, TokenBucket, batcher_from_config
+from compression import normalize_encoding, payload_factory
+from shard import run_sharded, split_segments
+from sessions import sessions_from_config
+from stream import (ATTACK_STREAM, CHUNK_EVENTS, ESTIMATE_STREAM, SESSION_STREAM, EventStream, run_seed,
+                    stream_random, stream_rng)
+from filesink import open_sink, sink_payload_config
+from metrics import Metrics
+from shapes import describe_segments, load_shape, shape_segments
 
 # Simulate a public IP Address
-def get_public_ip():
-    # Avoid private/reserved IP ranges (basic version)
-    while True:
-        ip = ".".join(str(random.randint(1, 254)) for _ in range(4))
-        if not ip.startswith(("10.", "172.", "192.", "127.")):  # skip private/reserved ranges
-            return ip
-        else:
-            return None
+def get_public_ip(rand=random):
+    # Drawn from precompiled public IPv4 ranges; private and reserved
+    # space is never returned
+    return random_public_ipv4(rand)
 
 # Rare IP address by very random chance
-def maybe_generate_public_ip(chance=0.001):
+def maybe_generate_public_ip(chance=0.001, rand=random):
     # 0.001 = 0.1% chance
-    if random.random() < chance:
-        return get_public_ip()
+    if rand.random() < chance:
+        return get_public_ip(rand)
     else:
         return None
 
@@ -47,14 +57,22 @@ def load_config(file_path='config.json'):
     auth_token  = os.getenv('AUTH_TOKEN')
     config.update({"auth_token": auth_token})
 
-    # Simulate IPs for US East and US West
-    us_east_ips = simulate_ips_for_region(us_east_ranges)
-    us_west_ips = simulate_ips_for_region(us_west_ranges)
+    # Simulate IPs for US East and US West; a seeded run always gets
+    # the same servers
+    rand = random.Random(config.get("seed"))
+    us_east_ips = simulate_ips_for_region(us_east_ranges, rand=rand)
+    us_west_ips = simulate_ips_for_region(us_west_ranges, rand=rand)
     server_ips = us_east_ips + us_west_ips
     config.update({"server_ips": server_ips})
 
     return config
 
+# Encoded events sampled to estimate the event size
+ESTIMATE_EVENTS = 10000
+
+# Resolved once; os.uname() is a system call
+HOSTNAME = os.uname()[1]
+
 def generate_event_template():
     event_template = {
       "event" : {               
@@ -62,7 +80,7 @@ def generate_event_template():
         "severity": 99
       },
       "time" : 1,  
-      "host": os.uname()[1],
+      "host": HOSTNAME,
       "source" : "Python Generator",  
       "sourcetype" : "",   
       "index": "",        
@@ -70,7 +88,7 @@ def generate_event_template():
     }
     return event_template
 
-def generate_event(sample, config):
+def generate_event(sample, config, rand=random):
     event_template = generate_event_template()
     event = sample.copy()
 
@@ -79,7 +97,7 @@ def generate_event(sample, config):
     unix_time = date.timestamp()
 
     # Get random IP address
-    client_public_ip = maybe_generate_public_ip()
+    client_public_ip = maybe_generate_public_ip(rand=rand)
 
     # Format for the /event endpoint
     event_template["event"]["message"] = event["message"]
@@ -89,8 +107,10 @@ def generate_event(sample, config):
     event_template["time"] = unix_time
     event_template["sourcetype"] = "http-access-record"
 
-    event["server"]["ipaddr"] = random.choice(config["server_ips"])
-    event["round_trip_time"]  = random.randint(20, 500)
+    # Replace (rather than write into) the nested dict, which is shared
+    # with the sample this event was copied from
+    event["server"] = {"ipaddr": rand.choice(config["server_ips"])}
+    event["round_trip_time"]  = rand.randint(20, 500)
     
     # Check if the event is HTTP or HTTPS to capture transaction data
     # Create a dictionary with all relevant transaction data fields
@@ -120,8 +140,23 @@ def generate_event(sample, config):
 
     return event_template
 
-def dispatch_event(events, config):
-    # Send the JSON data to the webhook URL using an HTTP POST request
+def dispatch_event(events, config, dispatcher=None):
+    # Send the JSON data to the webhook URL using an HTTP POST request.
+    # Pass a long-lived Dispatcher to reuse its connection pool; without
+    # one the bundle is sent with a single blocking POST.
+    builder = payload_factory(config)()
+    for event in events:
+        builder.add(json.dumps(event).encode("utf-8"))
+    payload = builder.finish()
+
+    if dispatcher is not None:
+        dispatcher.submit(payload, len(events))
+        return
+
+    dispatch_payload(payload, config)
+
+def dispatch_payload(payload, config):
+    # Send an already serialized, newline-joined bundle to the webhook URL
 
     # Define the webhook URL where the JSON data will be sent
     webhook_url = config["webhook_url"]
@@ -131,12 +166,11 @@ def dispatch_event(events, config):
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {config["auth_token"]}'
     }
+    content_encoding = normalize_encoding(config.get("content_encoding"))
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
 
-    # for event in events:
-    #     print(event, "\n\n")
-
-    payload = "\n".join(json.dumps(event) for event in events)    
-    response = requests.post(webhook_url, headers=headers, data=payload)
+    response = requests.post(webhook_url, headers=headers, data=payload, verify=verify_setting(config))
 
     # Check if the request was successful
     if response.status_code != 200:
@@ -169,160 +203,261 @@ def calculate_average_event_size(events):
     average_size = total_size / len(events) if events else 0
     return average_size
 
-def generate_events_linear(config):
-    # Use the sample events to rehydrate new events in the future
-    # f = open(config["samples"])
-    events = getBeningEntries()
+def schedule_start(config, total_time_seconds):
+    """
+    Return the start of the run and, in backfill mode, the simulated start.
 
-    byte_limit = parse_size(config['output_size'])
-    total_time_seconds = parse_time_range(config["time_range"])
-    average_event_size = math.ceil(calculate_average_event_size(events))
-    estimated_events = round(byte_limit / average_event_size)
-    delay_per_event = (total_time_seconds / estimated_events) * 0.75 if estimated_events > 0 else 0
+    In backfill mode (`"backfill": true`) the whole time range is generated
+    as fast as possible with synthetic timestamps. It starts at
+    `backfill_start` (ISO 8601, UTC if no offset is given), or by default
+    so that the range ends now.
 
-    # Timing measurement
-    start_time = time.time()
-    last_print_time = start_time
-    elapsed_minutes = 0
-    elapsed_time = 0
-    elapsed_loop_time = 0
+    Returns:
+        tuple: (start Unix time, simulated start Unix time or None).
+    """
+    if not config.get("backfill"):
+        return time.time(), None
+
+    if config.get("backfill_start"):
+        start = dt.fromisoformat(config["backfill_start"])
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        start = start.timestamp()
+    else:
+        start = time.time() - total_time_seconds
+
+    print(f"Backfill from {dt.fromtimestamp(start, timezone.utc)} to {dt.fromtimestamp(start + total_time_seconds, timezone.utc)}")
+    return start, start
+
+def load_sample_pool(config):
+    # Columnar benign sample pool; each draw assembles a new entry
+    pool = cached_sample_pool(int(config.get("pool_size", 5000)), config.get("seed"), config.get("pool_cache_dir"))
+    print(f"Sample pool: {pool.unique_values():,} unique values")
+    return pool
+
+def print_progress(estimated_events, dispatcher):
+    # Build a pipeline progress callback for the once-a-minute status line
+    def progress(pipeline):
+        elapsed_minutes = (time.time() - pipeline.start_time) // 60
+        pct = (pipeline.generated / estimated_events) * 100 if estimated_events else 100
+        target = pipeline.target()
+        drift = ((pipeline.generated - target) / target * 100) if target else 0
+        budget = ""
+        if pipeline.budget:
+            budget = (f", {pipeline.generated_bytes / 1024**2:,.1f} of {pipeline.budget.budget / 1024**2:,.1f} MB "
+                      f"(rate x{pipeline.budget.factor:.3f})")
+        print(f"{pipeline.generated:,.6g} events out of {estimated_events:,.6g} -- {pct:.2f} % in {int(elapsed_minutes)} minute(s), "
+              f"schedule drift {drift:+.2f} %{budget}. {dispatcher.summary()}")
+    return progress
+
+def run_pipeline(config, segments, make_events, estimated_events, serialize=None, sim_start=None, byte_budget=None):
+    # Generation, serialization and dispatch run as separate stages; the
+    # token-bucket pacer in the generation stage keeps the schedule on
+    # target regardless of how long the other stages take
+    dispatcher = open_sink(config)
+    pipeline = Pipeline(
+        send = dispatcher.submit,
+        serialize = serialize,
+        batcher = batcher_from_config(config, payload_factory(sink_payload_config(config))),
+        progress = print_progress(estimated_events, dispatcher),
+        budget = ByteBudget(byte_budget) if byte_budget else None,
+    )
+    controller = getattr(dispatcher, "controller", None)
+    if controller:
+        # The controller sizes batches as well as the window
+        controller.attach(pipeline.batcher)
+    metrics = Metrics(config)
+    metrics.register(pipeline.metrics)
+    metrics.register(dispatcher.metrics)
+    try:
+        pipeline.run(segments, make_events, TokenBucket(0), sim_start)
+    finally:
+        dispatcher.close(config.get("drain_timeout"))
+        metrics.close()
+    print(f"Dispatch: {dispatcher.summary()}")
+    return pipeline
+
+def run_generator(config, segments, source, estimated_events, sim_start=None, byte_budget=None):
+    """
+    Run a schedule in this process, or across `shards` worker processes.
 
-    # Calculate a random delay within the first 10 minutes
-    jitter_minutes = random.randint(0, 9)
-    jitter_seconds = random.randint(0, 59)
-    attack_delay = jitter_minutes * 60 + jitter_seconds
-    attack_time = dt.now(timezone.utc) + timedelta(seconds=attack_delay)
+    Args:
+        config (dict): Configuration settings.
+        segments (list): (rate, count) pairs.
+        source (callable): source(shard_index, rng) -> (make_events, serialize).
+        estimated_events (int): Total events, for progress.
+        sim_start (float): Backfill start time, see Pipeline.run.
+        byte_budget (int): Serialized bytes to stop at, see ByteBudget.
 
-    # Number of events
-    event_count = 0
+    Returns:
+        dict: Totals with `generated`, `generated_bytes`, `sent_bytes`
+            and `start_time`.
+    """
+    shards = int(config.get("shards", 1))
+    if shards > 1:
+        return run_sharded(config, segments, source, estimated_events, shards, sim_start=sim_start,
+                           byte_budget=byte_budget)
 
-    # Loop control
-    total_bytes = 0
+    make_events, serialize = source(0, np.random.default_rng(config.get("seed")))
+    pipeline = run_pipeline(config, segments, make_events, estimated_events, serialize, sim_start, byte_budget)
+    return {"generated": pipeline.generated, "generated_bytes": pipeline.generated_bytes,
+            "sent_bytes": pipeline.sent_bytes, "start_time": pipeline.start_time}
 
-    event_bundle = []
+def plan_events(config):
+    """
+    Work out what a run consists of: its seed, sample pool, event count
+    and schedule. With a `seed` (and a fixed `backfill_start` when
+    backfilling), every call returns the same plan.
 
-    while event_count < estimated_events:
-      current_time = time.time()
-      sample = random.choice(events)
-    
-      event = generate_event(sample, config)
-
-      if dt.now(timezone.utc) > attack_time:
-          event = generate_event(getMaliciousEntry(), config)
-          # Calculate a random delay within the next 40 minutes to 1 hour
-          jitter_minutes = random.randint(40, 59) * 60
-          jitter_seconds = random.randint(0, 59)
-          attack_delay = jitter_minutes * 60 + jitter_seconds
-          attack_time = dt.now(timezone.utc) + timedelta(seconds=attack_delay)
-
-      event_bundle.append(event)
-      total_bytes += len(event)
-      event_count += 1
-      elapsed_time += elapsed_loop_time
-
-      if elapsed_time >= 1 or event_count == estimated_events:
-        dispatch_event(event_bundle, config)
-        event_bundle = []
-        elapsed_time = 0
-
-      if current_time - last_print_time >= 60 or event_count == estimated_events:
-        elapsed_time = current_time - start_time
-        elapsed_minutes = elapsed_time // 60
-        print(f"{event_count:,.6g} events out of {estimated_events:,.6g} -- {((event_count/estimated_events)*100):.2f} % in {int(elapsed_minutes)} minute(s).")
-        last_print_time = current_time
-
-      time.sleep(delay_per_event)
-      end_time = time.time()
-      elapsed_loop_time = end_time - current_time
+    Args:
+        config (dict): Configuration settings.
 
-def generate_events_wave(config):
-    # Load samples
-    events = getBeningEntries()
+    Returns:
+        dict: `root` SeedSequence, `pool`, `estimated_events`,
+            `byte_budget`, `segments`, `start`, `sim_start` and `duration`.
+    """
+    shape = config.get("shape", "wave")
+    root = run_seed(config.get("seed"))
+    pool = load_sample_pool(config)
 
-    # Config parameters
     byte_limit = parse_size(config['output_size'])
     total_time_seconds = parse_time_range(config["time_range"])
-    average_event_size = math.ceil(calculate_average_event_size(events))
+    start, sim_start = schedule_start(config, total_time_seconds)
+
+    # Estimate the event size on what is actually sent: a seeded sample
+    # of encoded events with timestamps from the range, so the estimate
+    # is reproducible. The byte budget corrects what is left over.
+    rng = stream_rng(root, ESTIMATE_STREAM)
+    encoder = open_encoder(config, pool, HOSTNAME)
+    source = encoder
+    if config.get("sessions"):
+        # A smaller population with the same tables of addresses and users
+        source = sessions_from_config(config, encoder, pool, rng, min(int(config["sessions"]), ESTIMATE_EVENTS))
+    times = (start + rng.random(ESTIMATE_EVENTS) * total_time_seconds).tolist()
+    lines = encoder.encode(source.draw(ESTIMATE_EVENTS, rng), times)
+    average_event_size = sum(map(len, lines)) / len(lines)
     estimated_events = round(byte_limit / average_event_size)
-    total_minutes = math.ceil(total_time_seconds / 60)
-
-    # Build sine multipliers over 2 full periods
-    multipliers = []
-    for i in range(total_minutes):
-        radians = (2 * math.pi * 2 * i) / total_minutes  # 2 full sine wave periods
-        value = (math.sin(radians) + 1) / 2              # Normalize to 0–1
-        scaled = 0.2 + (value * 0.8)                     # Scale to 0.2–1.0
-        multipliers.append(scaled)
-
-    # Normalize multipliers to match total event count
-    multiplier_sum = sum(multipliers)
-    normalized_multipliers = [m / multiplier_sum for m in multipliers]
-    events_per_minute = [round(estimated_events * m) for m in normalized_multipliers]
-
-    print("Total estimated events:", estimated_events)
-    print("Distribution per minute (sample):", events_per_minute[:10], "...")
-
-    event_count = 0
-    total_bytes = 0
-    start_time = time.time()
-    last_print_time = start_time
-
-    # First malicious attack scheduling
-    jitter_seconds = random.randint(300, 599) # Between 5–10 min
-    attack_time = dt.now(timezone.utc) + timedelta(seconds=jitter_seconds)
-    print("First Attack Time:",attack_time)
-
-    for minute_index, event_count_this_minute in enumerate(events_per_minute):
-        bundle = []
-        minute_start_time = time.time()
-        delay_between_events = 60 / event_count_this_minute if event_count_this_minute > 0 else 0
-
-        for _ in range(event_count_this_minute):
-            now = dt.now(timezone.utc)
-
-            if now > attack_time:
-                sample = getMaliciousEntry()
-                # Schedule next malicious attack
-                jitter_seconds = random.randint(2400, 3599)  # Between 40–60 min
-                attack_time = now + timedelta(seconds=jitter_seconds)
-                print("Next Attack Time:",attack_time)
-            else:
-                sample = random.choice(events)
-
-            event = generate_event(sample, config)
-            bundle.append(event)
-            total_bytes += len(json.dumps(event).encode("utf-8"))
-            event_count += 1
-
-            if delay_between_events > 0:
-                time.sleep(delay_between_events)
-
-        dispatch_event(bundle, config)
-
-        # Logging
-        now = time.time()
-        if now - last_print_time > 60:
-            elapsed_minutes = (now - start_time) / 60
-            pct = (event_count / estimated_events) * 100
-            print(f"{event_count:,.6g} events out of {estimated_events:,.6g} -- {pct:.2f}% in {int(elapsed_minutes)} minute(s).")
-            last_print_time = now
+    print(f"Total estimated events: {estimated_events} ({average_event_size:,.1f} bytes each)")
+
+    rate_curve = load_shape(config, start, total_time_seconds)
+    segments = shape_segments(rate_curve, total_time_seconds, estimated_events, config.get("shape_resolution"))
+    print(f"Shape {shape}: {describe_segments(segments)}")
+
+    return {"root": root, "pool": pool, "estimated_events": estimated_events, "byte_budget": byte_limit,
+            "segments": segments, "start": start, "sim_start": sim_start, "duration": total_time_seconds}
+
+def shard_segments(config, segments, shard):
+    # The share of the schedule a shard runs
+    shards = int(config.get("shards", 1))
+    return split_segments(segments, shards, shard) if shards > 1 else segments
+
+def plan_campaigns(config, plan):
+    """
+    Return the run's attack campaigns and the random source that drives
+    them, both derived from the run's seed.
+    """
+    rand = stream_random(plan["root"], ATTACK_STREAM)
+    # Attack campaigns run on the run's (or the simulated) clock
+    return load_campaigns(config, plan["start"], plan["duration"], rand), rand
+
+def open_stream(config, plan, shard=0, clock=None, log=print):
+    """
+    Return a shard's EventStream and the encoder that serializes it.
+
+    Args:
+        config (dict): Configuration settings.
+        plan (dict): From plan_events.
+        shard (int): Shard number.
+        clock (ScheduleClock): Simulated timestamps, see EventStream.
+        log (callable): Receives the attack campaign messages.
+
+    Returns:
+        tuple: (EventStream, EventEncoder).
+    """
+    pool = plan["pool"]
+    # Benign events are drawn as index rows and serialized by the
+    # encoder of the configured output profile
+    encoder = open_encoder(config, pool, HOSTNAME)
+    source = encoder
+    if config.get("sessions"):
+        # Each shard simulates its share of the clients
+        clients = max(1, int(config["sessions"]) // int(config.get("shards", 1)))
+        source = sessions_from_config(config, encoder, pool, stream_rng(plan["root"], SESSION_STREAM, shard), clients)
+
+    # Only the first shard injects attacks, so their frequency does
+    # not grow with the number of shards
+    attacks = None
+    if shard == 0:
+        campaigns, rand = plan_campaigns(config, plan)
+        attacks = AttackScheduler(campaigns, rand, log)
+
+    def make_attack(pattern, client_ip, rng):
+        entry = getMaliciousEntry(pool.entries(1, rng)[0], pattern, client_ip)
+        return generate_event(entry, config, random.Random(int(rng.integers(2**63))))
+
+    stream = EventStream(source, plan["root"], shard, config.get("chunk_events", CHUNK_EVENTS),
+                         attacks, make_attack, clock)
+    return stream, encoder
+
+def generate_events(config):
+    """
+    Generate `output_size` worth of events over `time_range`, following the
+    rate curve selected by `shape` (see shapes.py).
+
+    Args:
+        config (dict): Configuration settings.
+    """
+    plan = plan_events(config)
+    sim_start = plan["sim_start"]
+
+    campaigns, _ = plan_campaigns(config, plan)
+    print(f"{len(campaigns)} attack campaign(s), first attack at "
+          f"{dt.fromtimestamp(min(c.start for c in campaigns), timezone.utc) if campaigns else 'never'}")
+
+    def source(shard, rng):
+        # Events come from the shard's seeded, chunked stream; `rng` is
+        # not needed
+        clock = None
+        if sim_start is not None:
+            clock = ScheduleClock(shard_segments(config, plan["segments"], shard), sim_start)
+        stream, encoder = open_stream(config, plan, shard, clock)
+        return stream.take, encoder.encode
+
+    totals = run_generator(config, plan["segments"], source, plan["estimated_events"], sim_start,
+                           plan["byte_budget"])
 
     # Final log
-    total_elapsed = time.time() - start_time
-    print(f"Completed: {event_count:,} events in {total_elapsed:.2f} seconds ({total_elapsed/60:.2f} minutes)")
+    total_elapsed = time.time() - totals["start_time"]
+    off = (totals["generated_bytes"] - plan["byte_budget"]) / plan["byte_budget"] * 100
+    print(f"Completed: {totals['generated']:,} events ({totals['generated_bytes']:,} bytes, {off:+.2f} % of output_size) "
+          f"in {total_elapsed:.2f} seconds ({total_elapsed/60:.2f} minutes)")
+
+def generate_events_linear(config):
+    # Even distribution across the time range
+    generate_events(dict(config, shape="linear"))
+
+def generate_events_wave(config):
+    # Two periods of a sine wave across the time range
+    generate_events(dict(config, shape="wave"))
 
 def main():
     config = load_config()
 
-    if not preflight_check(
-        url = config["webhook_url"], 
-        auth_token = config["auth_token"]
-    ):
-        print("❌ Network conditions are not suitable. Exiting.")
-        exit(1)
-        
-    # generate_events_linear(config)
-    generate_events_wave(config)
+    # Writing to files needs no network
+    if config.get("output", "http") != "file":
+        connection = preflight_check(
+            url = config["webhook_url"], 
+            auth_token = config["auth_token"],
+            verify = verify_setting(config)
+        )
+        if not connection:
+            print("❌ Network conditions are not suitable. Exiting.")
+            exit(1)
+        # Dispatch reuses the checked address and TLS session
+        config["connection"] = connection
+
+    # The rate curve is chosen with "shape" in the config
+    generate_events(config)
 
 if __name__=="__main__":
     main()
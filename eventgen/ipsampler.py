@@ -0,0 +1,201 @@
+import ipaddress
+import random
+from functools import lru_cache
+import numpy as np
+
+# "a.b" for every 16-bit value, so an IPv4 address formats as two lookups
+_HALVES = [f"{i >> 8}.{i & 255}" for i in range(65536)]
+
+# Special-purpose IPv4 space (RFC 6890 and multicast/reserved), excluded
+# from the public address table
+RESERVED_IPV4 = [
+    "0.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8", "169.254.0.0/16",
+    "172.16.0.0/12", "192.0.0.0/24", "192.0.2.0/24", "192.88.99.0/24", "192.168.0.0/16",
+    "198.18.0.0/15", "198.51.100.0/24", "203.0.113.0/24", "224.0.0.0/4", "240.0.0.0/4",
+]
+
+def format_ipv4(value):
+    return _HALVES[value >> 16] + "." + _HALVES[value & 0xFFFF]
+
+def format_ip(value, version=4):
+    if version == 4:
+        return format_ipv4(value)
+    return ipaddress.IPv6Address(value).compressed
+
+class CidrTable:
+    """
+    A set of CIDR blocks compiled once into integer ranges.
+
+    Drawing an address is a block choice plus a random offset, O(1) in the
+    size of the block, instead of materializing `net.hosts()`. Network and
+    broadcast addresses are skipped for blocks larger than /31 (/127), as
+    `hosts()` does.
+
+    Args:
+        cidrs (list): CIDR strings, IPv4 and/or IPv6.
+        weights (list or str): Relative weight per block. None picks every
+            block equally often (like random.choice over the CIDRs); "size"
+            weights blocks by their number of addresses, which draws
+            uniformly over the whole address space of the table.
+    """
+
+    def __init__(self, cidrs, weights=None):
+        networks = [ipaddress.ip_network(cidr, strict=False) for cidr in cidrs]
+        if not networks:
+            raise ValueError("A CIDR table needs at least one block")
+
+        self.cidrs = [str(net) for net in networks]
+        self.versions = [net.version for net in networks]
+        self.starts = []
+        self.sizes = []
+        for net in networks:
+            first, size = int(net.network_address), net.num_addresses
+            if size > 2:
+                first, size = first + 1, size - 2
+            self.starts.append(first)
+            self.sizes.append(size)
+        self.ipv4_only = all(version == 4 for version in self.versions)
+
+        if weights == "size":
+            weights = self.sizes
+        if weights is None:
+            self.cumulative = None
+        else:
+            if len(weights) != len(networks):
+                raise ValueError("Give one weight per CIDR block")
+            self.cumulative = np.cumsum(np.asarray(weights, dtype=float))
+            self.cumulative /= self.cumulative[-1]
+            self.cumulative_list = self.cumulative.tolist()
+            self.blocks = range(len(networks))
+
+        if self.ipv4_only:
+            self.np_starts = np.asarray(self.starts, dtype=np.uint64)
+            self.np_sizes = np.asarray(self.sizes, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.cidrs)
+
+    def _block(self, rand):
+        if self.cumulative is None:
+            return rand.randrange(len(self.starts))
+        return rand.choices(self.blocks, cum_weights=self.cumulative_list)[0]
+
+    def sample(self, rand=random):
+        """
+        Draw one address with the `random` module (or a random.Random).
+
+        Returns:
+            str: The address.
+        """
+        block = 0 if len(self.starts) == 1 else self._block(rand)
+        return format_ip(self.starts[block] + rand.randrange(self.sizes[block]), self.versions[block])
+
+    def draw_ints(self, n, rng):
+        """
+        Draw `n` IPv4 addresses as integers in one vectorized pass.
+
+        Args:
+            n (int): Number of addresses.
+            rng (numpy.random.Generator): Random source.
+
+        Returns:
+            numpy.ndarray: uint64 addresses.
+        """
+        if not self.ipv4_only:
+            raise ValueError("draw_ints only supports IPv4 tables; use draw()")
+        if self.cumulative is None:
+            blocks = rng.integers(0, len(self.starts), size=n)
+        else:
+            blocks = np.searchsorted(self.cumulative, rng.random(n), side="right")
+            blocks = np.minimum(blocks, len(self.starts) - 1)
+        return self.np_starts[blocks] + rng.integers(0, self.np_sizes[blocks], dtype=np.uint64)
+
+    def draw(self, n, rng):
+        """
+        Draw `n` addresses as strings.
+
+        Args:
+            n (int): Number of addresses.
+            rng (numpy.random.Generator): Random source.
+
+        Returns:
+            list: Address strings.
+        """
+        if self.ipv4_only:
+            values = self.draw_ints(n, rng)
+            halves = _HALVES
+            return [halves[high] + "." + halves[low]
+                    for high, low in zip((values >> 16).tolist(), (values & 0xFFFF).tolist())]
+
+        # Mixed or IPv6 tables: offsets may exceed 64 bits
+        rand = random.Random(int(rng.integers(0, 2**63)))
+        return [self.sample(rand) for _ in range(n)]
+
+class HeavyHitters:
+    """
+    Zipf-skewed draws from a fixed population of addresses.
+
+    A few addresses account for most of the traffic, as with real clients
+    or scanners: the address of rank r is drawn with probability
+    proportional to 1 / r**skew.
+
+    Args:
+        table (CidrTable): Where the population is drawn from.
+        population (int): Number of distinct addresses.
+        skew (float): Zipf exponent; 0 is uniform, ~1 is typical web traffic.
+        rng (numpy.random.Generator): Random source, for the population
+            and for the draws.
+    """
+
+    def __init__(self, table, population=1000, skew=1.1, rng=None):
+        self.rng = rng or np.random.default_rng()
+        self.addresses = list(dict.fromkeys(table.draw(population, self.rng)))
+        ranks = np.arange(1, len(self.addresses) + 1, dtype=float)
+        self.cumulative = np.cumsum(ranks ** -float(skew))
+        self.cumulative /= self.cumulative[-1]
+        self.buffer = []
+
+    def draw(self, n):
+        """
+        Return `n` addresses.
+        """
+        picks = np.searchsorted(self.cumulative, self.rng.random(n), side="right")
+        addresses = self.addresses
+        last = len(addresses) - 1
+        return [addresses[min(pick, last)] for pick in picks.tolist()]
+
+    def __call__(self):
+        # One address per call, drawn in batches
+        if not self.buffer:
+            self.buffer = self.draw(4096)
+            self.buffer.reverse()
+        return self.buffer.pop()
+
+@lru_cache(maxsize=256)
+def cidr_table(cidrs, weights=None):
+    """
+    Return the compiled table for a tuple of CIDRs, compiling it only once.
+    """
+    return CidrTable(list(cidrs), weights if weights in (None, "size") else list(weights))
+
+@lru_cache(maxsize=None)
+def public_ipv4_table():
+    """
+    Return a table of all publicly routable IPv4 space, weighted by size.
+    """
+    public = [ipaddress.ip_network("0.0.0.0/0")]
+    for reserved in map(ipaddress.ip_network, RESERVED_IPV4):
+        remaining = []
+        for net in public:
+            if net.overlaps(reserved):
+                remaining.extend(net.address_exclude(reserved) if reserved.subnet_of(net) else [])
+            else:
+                remaining.append(net)
+        public = remaining
+    return CidrTable([str(net) for net in ipaddress.collapse_addresses(public)], weights="size")
+
+def random_public_ipv4(rand=random):
+    """
+    Return one random publicly routable IPv4 address.
+    """
+    return public_ipv4_table().sample(rand)
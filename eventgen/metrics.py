@@ -0,0 +1,258 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds, in seconds, of the dispatch latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, as Prometheus expects.
+
+    Args:
+        buckets (tuple): Increasing upper bounds; +Inf is implied.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, labels=None):
+        """
+        Return (suffix, labels, value) samples in exposition order.
+        """
+        labels = labels or {}
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append(("_bucket", dict(labels, le=le), cumulative))
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, count))
+        return samples
+
+def metric(name, kind, help, value=None, samples=None):
+    """
+    Build one metric family, as returned by collectors.
+
+    Args:
+        name (str): Metric name, without suffixes.
+        kind (str): "counter", "gauge" or "histogram".
+        help (str): One-line description.
+        value (float): Value of a metric without labels.
+        samples (list): (suffix, labels, value) samples instead of `value`.
+
+    Returns:
+        dict: The family.
+    """
+    if samples is None:
+        samples = [("", {}, value)]
+    return {"name": name, "type": kind, "help": help, "samples": samples}
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+class Registry:
+    """
+    Collects metric families from registered callbacks on demand.
+
+    Components keep their own counters; a collector turns them into metric
+    families when the registry is scraped, so nothing is recorded twice.
+
+    Args:
+        labels (dict): Constant labels added to every sample (e.g. shard).
+    """
+
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.collectors = []
+
+    def register(self, collect):
+        """
+        Add a collector: a callable returning a list of metric families.
+        """
+        self.collectors.append(collect)
+
+    def collect(self):
+        families = []
+        for collect in self.collectors:
+            families.extend(collect())
+        return families
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for family in self.collect():
+            lines.append(f"# HELP {family['name']} {family['help']}")
+            lines.append(f"# TYPE {family['name']} {family['type']}")
+            for suffix, labels, value in family["samples"]:
+                lines.append(f"{family['name']}{suffix}{format_labels(dict(self.labels, **labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Return every metric as a flat dict for the JSON stats line.
+
+        Labelled samples are keyed as name{label=value,...}; histogram
+        buckets are left out in favour of their _sum and _count.
+        """
+        values = dict(self.labels)
+        for family in self.collect():
+            for suffix, labels, value in family["samples"]:
+                if suffix == "_bucket":
+                    continue
+                key = family["name"] + suffix
+                if labels:
+                    key += "{" + ",".join(f"{name}={label}" for name, label in labels.items()) + "}"
+                values[key] = value
+        return values
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.server.registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.server.registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    Serves a Registry at /metrics (Prometheus) and /metrics.json.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        super().__init__((host, port), MetricsHandler)
+        self.registry = registry
+        self.thread = threading.Thread(target=self.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+class StatsReporter:
+    """
+    Writes the registry as one JSON line every `interval` seconds.
+
+    Each line also carries the per-second rate of every *_total counter
+    over the interval, under `rates`.
+
+    Args:
+        registry (Registry): Metrics to report.
+        interval (float): Seconds between lines.
+        path (str): File to append to; stdout if None.
+    """
+
+    def __init__(self, registry, interval, path=None):
+        self.registry = registry
+        self.interval = interval
+        self.path = path
+        self.previous = None
+        self.previous_time = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        now = time.monotonic()
+        values = self.registry.snapshot()
+        rates = {}
+        if self.previous is not None:
+            elapsed = now - self.previous_time
+            for key, value in values.items():
+                base = key.split("{", 1)[0]
+                if base.endswith("_total") and key in self.previous and elapsed > 0:
+                    rates[key] = (value - self.previous[key]) / elapsed
+        self.previous, self.previous_time = values, now
+
+        line = json.dumps({"time": time.time(), "metrics": values, "rates": rates})
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+        else:
+            print(line, file=sys.stdout, flush=True)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        # One last line with the final totals
+        self.report()
+
+class Metrics:
+    """
+    The metrics outputs enabled in the config, around one Registry.
+
+    Reads `metrics_port` (Prometheus endpoint, offset by `port_offset` so
+    shards don't collide), `metrics_interval` (seconds between JSON stats
+    lines) and `metrics_file` (where those lines go; stdout by default).
+    With neither set, nothing is started.
+    """
+
+    def __init__(self, config, labels=None, port_offset=0):
+        self.registry = Registry(labels)
+        self.server = None
+        self.reporter = None
+
+        port = config.get("metrics_port")
+        if port is not None:
+            self.server = MetricsServer(self.registry, int(port) + port_offset, config.get("metrics_host", "127.0.0.1"))
+            host, bound_port = self.server.server_address[:2]
+            print(f"[✓] Metrics at http://{host}:{bound_port}/metrics")
+
+        interval = config.get("metrics_interval")
+        if interval:
+            self.reporter = StatsReporter(self.registry, float(interval), config.get("metrics_file"))
+
+    def register(self, collect):
+        self.registry.register(collect)
+
+    def close(self):
+        if self.reporter is not None:
+            self.reporter.close()
+        if self.server is not None:
+            self.server.close()
@@ -0,0 +1,617 @@
+import bisect
+import json
+import queue
+import threading
+import time
+from compression import PayloadBuilder
+from metrics import metric
+
+# Placed on a queue to tell the next stage that no more items will follow
+_DONE = object()
+
+class TokenBucket:
+    """
+    Token-bucket pacer that releases events on an absolute schedule.
+
+    Tokens accrue at `rate` per second, up to `burst`. Refill is derived from
+    the monotonic clock rather than from accumulated sleeps, so the time spent
+    generating, encoding or sending events never pushes the schedule back.
+    A rate of 0 (or None) disables pacing altogether.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = 0.0
+        self.rate = 0.0
+        self.burst = 1.0
+        self.last = clock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """
+        Change the release rate without losing the tokens accrued so far.
+
+        Args:
+            rate (float): Events per second.
+            burst (float): Bucket depth; defaults to ~50 ms worth of events.
+        """
+        self._refill()
+        self.rate = max(float(rate or 0), 0.0)
+        self.burst = float(burst) if burst else max(1.0, self.rate * 0.05)
+        self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self):
+        now = self.clock()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, n=1):
+        """
+        Take `n` tokens, sleeping only when the bucket runs into debt.
+
+        Going into debt (instead of waiting for a full bucket) lets a single
+        call take more than `burst` tokens and keeps the sleep count low at
+        tens of thousands of events per second.
+        """
+        if not self.rate:
+            return
+        self._refill()
+        self.tokens -= n
+        if self.tokens < 0:
+            self.sleep(-self.tokens / self.rate)
+
+class Batcher:
+    """
+    Bundle serialized events, flushing on whichever limit is reached first.
+
+    Sizes are taken from the same bytes that are sent, newline separators
+    included, so no event is ever serialized a second time to be measured.
+
+    Args:
+        new_payload (callable): Starts an empty PayloadBuilder.
+        max_bytes (int): Uncompressed body size that triggers a flush.
+        max_events (int): Event count that triggers a flush.
+        max_age (float): Seconds after the first event that trigger a flush.
+    """
+
+    def __init__(self, new_payload=PayloadBuilder, max_bytes=1024**2, max_events=10000,
+                 max_age=1.0, clock=time.monotonic):
+        self.new_payload = new_payload
+        self.max_bytes = max_bytes
+        self.max_events = max_events
+        self.max_age = max_age
+        self.clock = clock
+        self.bundle = None
+        self.started = None
+
+    def add(self, line):
+        """
+        Add one serialized event.
+
+        Returns:
+            PayloadBuilder: A full bundle to send, or None.
+        """
+        ready = None
+        # Flush first if this event would push the body past max_bytes
+        if self.bundle and self.bundle.raw_bytes + len(line) + 1 > self.max_bytes:
+            ready = self.flush()
+
+        if self.bundle is None:
+            self.bundle = self.new_payload()
+            self.started = self.clock()
+        self.bundle.add(line)
+
+        if ready is None and (self.bundle.events >= self.max_events or self.bundle.raw_bytes >= self.max_bytes):
+            ready = self.flush()
+        return ready
+
+    def time_left(self):
+        """
+        Seconds until the pending bundle reaches max_age, or None if empty.
+        """
+        if self.bundle is None:
+            return None
+        return max(0.0, self.max_age - (self.clock() - self.started))
+
+    def expired(self):
+        return self.bundle is not None and self.time_left() <= 0
+
+    def flush(self):
+        """
+        Hand over the pending bundle, if any.
+
+        Returns:
+            PayloadBuilder: The pending bundle, or None.
+        """
+        bundle, self.bundle = self.bundle, None
+        return bundle
+
+def batcher_from_config(config, new_payload=PayloadBuilder):
+    """
+    Build a Batcher from the batch_max_* settings in config.json.
+
+    With `"emit": "record"` every event is posted on its own, the way an
+    Open Data Stream trigger sends them.
+    """
+    per_record = config.get("emit", "batch") == "record"
+    return Batcher(
+        new_payload = new_payload,
+        max_bytes = parse_batch_bytes(config.get("batch_max_bytes", 1024**2)),
+        max_events = 1 if per_record else int(config.get("batch_max_events", 10000)),
+        max_age = float(config.get("batch_max_age", 1.0)),
+    )
+
+def parse_batch_bytes(value):
+    # Accept either a byte count or a size string such as "512KB"
+    if isinstance(value, str):
+        units = {"KB": 1024, "MB": 1024**2, "GB": 1024**3}
+        unit = value[-2:].upper()
+        if unit in units:
+            return int(value[:-2]) * units[unit]
+        return int(value.rstrip("Bb"))
+    return int(value)
+
+def serialize_events(events, times=None):
+    """
+    Default serializer: json.dumps each event dict, applying `times` if given.
+    """
+    if times is not None:
+        for event, timestamp in zip(events, times):
+            event["time"] = timestamp
+    return [json.dumps(event).encode("utf-8") for event in events]
+
+def schedule_target(segments):
+    """
+    Return target_at(seconds): how many events a (rate, count) schedule
+    has released `seconds` after it started. Unpaced segments (rate 0)
+    count as released all at once.
+    """
+    starts = []
+    boundaries = []
+    elapsed = 0.0
+    total = 0
+    for rate, count in segments:
+        starts.append(elapsed)
+        boundaries.append((elapsed, total, rate, count))
+        elapsed += count / rate if rate else 0
+        total += count
+
+    def target_at(seconds):
+        # Last segment that has started by now; shaped schedules have many
+        index = bisect.bisect_right(starts, seconds) - 1
+        if index < 0:
+            return 0
+        begin, before, rate, count = boundaries[index]
+        return before + (min(count, (seconds - begin) * rate) if rate else count)
+
+    return target_at
+
+class ScheduleClock:
+    """
+    Simulated timestamps of a (rate, count) schedule, by event index.
+
+    Event i of a segment is stamped segment start + i / rate, computed
+    directly rather than accumulated, so an event gets the same timestamp
+    however the run was cut into chunks. That lets any range of a
+    backfill be regenerated on its own.
+
+    Args:
+        segments (list): (rate, count) pairs.
+        start (float): Unix time of the first event.
+    """
+
+    def __init__(self, segments, start):
+        self.firsts = []
+        self.starts = []
+        self.steps = []
+        index = 0
+        moment = start
+        for rate, count in segments:
+            self.firsts.append(index)
+            self.starts.append(moment)
+            self.steps.append(1 / rate if rate else 0)
+            moment += count / rate if rate else 0
+            index += count
+        self.start = start
+        self.total = index
+
+    def times(self, first, n):
+        """
+        Return the timestamps of events first .. first + n - 1.
+        """
+        if not self.firsts:
+            return [self.start] * n
+        firsts, starts, steps = self.firsts, self.starts, self.steps
+        # Zero-count segments share their first index with the next one;
+        # bisect_right picks the one that holds events
+        segment = max(0, bisect.bisect_right(firsts, first) - 1)
+        times = []
+        index, end = first, first + n
+        while index < end:
+            stop = min(firsts[segment + 1], end) if segment + 1 < len(firsts) else end
+            if stop > index:
+                begin, step, offset = starts[segment], steps[segment], firsts[segment]
+                times.extend([begin + (i - offset) * step for i in range(index, stop)])
+                index = stop
+            segment += 1
+        return times
+
+    def time_of(self, index):
+        return self.times(index, 1)[0]
+
+    def index_at(self, moment):
+        """
+        Return the index of the event stamped closest to `moment`.
+        """
+        if not self.firsts:
+            return 0
+        segment = max(0, bisect.bisect_right(self.starts, moment) - 1)
+        step = self.steps[segment]
+        offset = round((moment - self.starts[segment]) / step) if step else 0
+        last = (self.firsts[segment + 1] if segment + 1 < len(self.firsts) else self.total) - 1
+        return max(0, min(self.firsts[segment] + offset, last))
+
+class ByteBudget:
+    """
+    Steers a run to `budget` bytes of serialized events.
+
+    The schedule is planned from an estimate of the event size, which
+    drifts as the mix of events changes (attacks, long URIs). In real time,
+    the controller re-plans every `interval` seconds: the bytes still to go,
+    divided by the bytes per event measured so far, give the events still
+    needed, and their ratio to the events the schedule still holds becomes
+    the rate factor. Segments keep their duration and have their rate and
+    count scaled, so the run still ends with the time range. Backfills keep
+    their planned, reproducible schedule.
+
+    Either way the serialize stage stops the run at the budget, so it
+    never overshoots.
+
+    Args:
+        budget (int): Bytes of serialized events (newlines not counted).
+        interval (float): Seconds between re-plans.
+        min_factor, max_factor (float): Bounds of the rate factor.
+    """
+
+    def __init__(self, budget, interval=1.0, min_factor=0.25, max_factor=4.0):
+        self.budget = int(budget)
+        self.interval = interval
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.factor = 1.0
+        self.carry = 0.0
+
+    def update(self, pipeline, planned_left):
+        """
+        Re-plan from the pipeline's counters.
+
+        Args:
+            pipeline (Pipeline): The running pipeline.
+            planned_left (int): Events left in the schedule as planned.
+        """
+        if not pipeline.serialized_events or planned_left <= 0:
+            return
+        size = pipeline.generated_bytes / pipeline.serialized_events
+        # Events still queued before the serializer count at the average size
+        done = pipeline.generated_bytes + (pipeline.generated - pipeline.serialized_events) * size
+        needed = max(0.0, self.budget - done) / size
+        self.factor = min(self.max_factor, max(self.min_factor, needed / planned_left))
+
+    def scale(self, count):
+        # Scaled count, carrying the fractions so none are lost
+        scaled = count * self.factor + self.carry
+        count = int(scaled)
+        self.carry = scaled - count
+        return count
+
+class Pipeline:
+    """
+    Generate -> serialize -> dispatch stages joined by bounded queues.
+
+    Each stage runs on its own thread so that JSON encoding and the blocking
+    HTTP POST never add to the gap between two generated events. The bounded
+    queues provide backpressure: if dispatch falls behind, serialization and
+    then generation block instead of buffering without limit.
+
+    Events move between stages in chunks of up to `max_chunk`, sized so
+    that a chunk covers about `chunk_seconds` of the current rate. This keeps
+    queue and pacer overhead per chunk rather than per event.
+
+    Args:
+        send (callable): Receives a finished request body and its event count.
+        serialize (callable): serialize(events, times) turns a chunk of events
+            into a list of UTF-8 encoded JSON lines; `times` holds simulated
+            timestamps in backfill mode and is None otherwise.
+        batcher (Batcher): Decides when a bundle is ready to send.
+        queue_size (int): Capacity of each inter-stage queue, in chunks.
+        progress (callable): Called roughly once per `progress_interval`
+            seconds with the pipeline itself, and once more at the end.
+        budget (ByteBudget): Bytes to generate; the run stops there.
+    """
+
+    def __init__(self, send, serialize=None, batcher=None, queue_size=64,
+                 progress=None, progress_interval=60, max_chunk=256, chunk_seconds=0.01, budget=None):
+        self.send = send
+        self.budget = budget
+        self.serialize = serialize or serialize_events
+        self.batcher = batcher or Batcher()
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.max_chunk = max_chunk
+        self.chunk_seconds = chunk_seconds
+
+        self.serialize_queue = queue.Queue(maxsize=queue_size)
+        self.dispatch_queue = queue.Queue(maxsize=queue_size)
+
+        self.generated = 0
+        self.generated_bytes = 0
+        self.serialized_events = 0
+        # Events generated past the byte budget and never serialized
+        self.discarded = 0
+        self.budget_reached = False
+        self.sent_events = 0
+        self.sent_bytes = 0
+        self.start_time = None
+
+        # Seconds each stage spent working, and blocked on a full queue
+        self.busy = {"generate": 0.0, "serialize": 0.0, "batch": 0.0, "send": 0.0}
+        self.blocked = {"generate": 0.0, "serialize": 0.0}
+        self.target_rate = 0
+        self._target_at = None
+        self._schedule_start = None
+        self._error = None
+        self._stop = threading.Event()
+
+    def run(self, segments, make_events, pacer=None, sim_start=None):
+        """
+        Run the pipeline until every scheduled event has been dispatched.
+
+        Args:
+            segments (iterable): (rate, count) pairs; `count` events are
+                released at `rate` events per second before moving on.
+            make_events (callable): make_events(n, now) returns a list of
+                the next `n` events; `now` is the current (or simulated)
+                Unix time.
+            pacer (TokenBucket): Optional pacer, created on demand.
+            sim_start (float): Backfill mode. Events are produced as fast as
+                possible and stamped with simulated times that start at
+                this Unix time and follow the schedule.
+        """
+        segments = list(segments)
+        self.start_time = time.time()
+        pacer = pacer or TokenBucket(0)
+        if sim_start is None:
+            self._target_at = schedule_target(segments)
+            self._schedule_start = time.monotonic()
+
+        workers = [
+            threading.Thread(target=self._guard, args=(self._serialize_stage,), daemon=True),
+            threading.Thread(target=self._guard, args=(self._dispatch_stage,), daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        self._guard(self._generate_stage, segments, make_events, pacer, sim_start)
+
+        for worker in workers:
+            worker.join()
+        self.generated -= self.discarded
+
+        if self._error:
+            raise self._error
+
+        if self.progress:
+            self.progress(self)
+
+    def _guard(self, stage, *args):
+        # Record the first failure and stop every stage, so a broken
+        # dispatcher cannot leave the generator blocked on a full queue
+        try:
+            stage(*args)
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("Pipeline stopped")
+
+    def _get(self, q, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        raise RuntimeError("Pipeline stopped")
+
+    def chunk_size(self, rate):
+        if not rate:
+            return self.max_chunk
+        return max(1, min(self.max_chunk, int(rate * self.chunk_seconds)))
+
+    def _generate_stage(self, segments, make_events, pacer, sim_start):
+        last_print_time = time.time()
+        clock = None if sim_start is None else ScheduleClock(segments, sim_start)
+        # Rate control runs in real time only; see ByteBudget
+        budget = self.budget if clock is None else None
+        planned_left = sum(count for _, count in segments)
+        next_update = time.monotonic()
+        held = 0.0
+        try:
+            for rate, count in segments:
+                if self.budget_reached:
+                    break
+                if budget is not None and rate:
+                    if time.monotonic() >= next_update:
+                        budget.update(self, planned_left)
+                        next_update = time.monotonic() + budget.interval
+                    planned_left -= count
+                    # A segment scaled down to no events passes its time on
+                    held += count / rate
+                    count = budget.scale(count)
+                    if not count:
+                        continue
+                    rate, held = count / held, 0.0
+                self.target_rate = rate
+                if clock is None:
+                    pacer.set_rate(rate)
+                    chunk = self.chunk_size(rate)
+                else:
+                    chunk = self.max_chunk
+                remaining = count
+                while remaining > 0 and not self.budget_reached:
+                    n = min(chunk, remaining)
+                    if clock is None:
+                        pacer.acquire(n)
+                        now, times = time.time(), None
+                    else:
+                        times = clock.times(self.generated, n)
+                        now = times[0]
+                    began = time.perf_counter()
+                    events = make_events(n, now)
+                    made = time.perf_counter()
+                    self._put(self.serialize_queue, (events, times))
+                    self.busy["generate"] += made - began
+                    self.blocked["generate"] += time.perf_counter() - made
+                    self.generated += n
+                    remaining -= n
+
+                    if self.progress:
+                        now = time.time()
+                        if now - last_print_time >= self.progress_interval:
+                            self.progress(self)
+                            last_print_time = now
+        finally:
+            if not self._stop.is_set():
+                self._put(self.serialize_queue, _DONE)
+
+    def _serialize_stage(self):
+        while True:
+            item = self._get(self.serialize_queue)
+            if item is _DONE:
+                self._put(self.dispatch_queue, _DONE)
+                return
+            events, times = item
+            if self.budget_reached:
+                self.discarded += len(events)
+                continue
+            began = time.perf_counter()
+            lines = self.serialize(events, times)
+            size = sum(map(len, lines))
+            if self.budget is not None and self.generated_bytes + size > self.budget.budget:
+                lines, size = self._trim(lines)
+            self.generated_bytes += size
+            self.serialized_events += len(lines)
+            serialized = time.perf_counter()
+            self._put(self.dispatch_queue, lines)
+            self.busy["serialize"] += serialized - began
+            self.blocked["serialize"] += time.perf_counter() - serialized
+
+    def _trim(self, lines):
+        # Keep the lines that fit in the budget and stop the run there
+        room = self.budget.budget - self.generated_bytes
+        kept = 0
+        for line in lines:
+            if len(line) > room:
+                break
+            room -= len(line)
+            kept += 1
+        self.discarded += len(lines) - kept
+        self.budget_reached = True
+        lines = lines[:kept]
+        return lines, sum(map(len, lines))
+
+    def _dispatch_stage(self):
+        batcher = self.batcher
+
+        while True:
+            try:
+                lines = self._get(self.dispatch_queue, batcher.time_left())
+            except queue.Empty:
+                lines = None
+
+            if lines is _DONE:
+                bundle = batcher.flush()
+                if bundle:
+                    self._flush(bundle)
+                return
+
+            if lines is not None:
+                began = time.perf_counter()
+                sending = self.busy["send"]
+                for line in lines:
+                    bundle = batcher.add(line)
+                    if bundle:
+                        self._flush(bundle)
+                # Time spent in send() is counted by _flush
+                self.busy["batch"] += time.perf_counter() - began - (self.busy["send"] - sending)
+
+            if batcher.expired():
+                self._flush(batcher.flush())
+
+    def _flush(self, bundle):
+        payload = bundle.finish()
+        began = time.perf_counter()
+        self.send(payload, bundle.events)
+        self.busy["send"] += time.perf_counter() - began
+        self.sent_events += bundle.events
+        self.sent_bytes += bundle.raw_bytes
+
+    def target(self):
+        """
+        Events the schedule calls for by now; equal to `generated` in
+        backfill mode, where there is no real-time schedule.
+        """
+        if self._target_at is None:
+            return self.generated
+        return self._target_at(time.monotonic() - self._schedule_start)
+
+    def metrics(self):
+        """
+        Collector for a metrics Registry.
+
+        Busy and blocked seconds per stage show where a run that falls
+        behind schedule loses its time: a stage that is busy close to 100%
+        of the wall clock is the bottleneck, and a stage blocked on a full
+        queue is waiting for the one after it. `send` includes the time the
+        dispatcher holds the pipeline back while its backlog is full.
+        """
+        target = self.target()
+        drift = (self.generated - target) / target if target else 0
+        return [
+            metric("eventgen_events_generated_total", "counter", "Events generated.", self.generated),
+            metric("eventgen_bytes_generated_total", "counter", "Serialized event bytes.", self.generated_bytes),
+            metric("eventgen_events_sent_total", "counter", "Events handed to the sink in bundles.", self.sent_events),
+            metric("eventgen_bytes_sent_total", "counter", "Uncompressed bytes handed to the sink.", self.sent_bytes),
+            metric("eventgen_events_scheduled", "gauge", "Events the schedule calls for by now.", round(target)),
+            metric("eventgen_schedule_drift_ratio", "gauge",
+                   "(generated - scheduled) / scheduled; negative when behind.", drift),
+            metric("eventgen_target_rate", "gauge", "Scheduled events per second right now.", self.target_rate),
+            metric("eventgen_byte_budget", "gauge", "Serialized bytes the run stops at; 0 if unlimited.",
+                   self.budget.budget if self.budget else 0),
+            metric("eventgen_rate_factor", "gauge", "Byte-budget controller's factor on the scheduled rate.",
+                   self.budget.factor if self.budget else 1.0),
+            metric("eventgen_queue_depth", "gauge", "Chunks waiting between stages.", samples=[
+                ("", {"queue": "serialize"}, self.serialize_queue.qsize()),
+                ("", {"queue": "dispatch"}, self.dispatch_queue.qsize()),
+            ]),
+            metric("eventgen_queue_capacity", "gauge", "Capacity of each inter-stage queue, in chunks.",
+                   self.serialize_queue.maxsize),
+            metric("eventgen_stage_busy_seconds_total", "counter", "Seconds each stage spent working.",
+                   samples=[("", {"stage": stage}, seconds) for stage, seconds in self.busy.items()]),
+            metric("eventgen_stage_blocked_seconds_total", "counter",
+                   "Seconds each stage spent blocked on a full downstream queue.",
+                   samples=[("", {"stage": stage}, seconds) for stage, seconds in self.blocked.items()]),
+        ]
@@ -1,11 +1,11 @@
 import socket
-import ssl
 import requests
 import ipaddress
 import dns.resolver
 import json
 import os
 from urllib.parse import urlparse
+from connection import ConnectionContext, ResumableContext, verify_setting
 
 def resolve_public_ip(hostname, nameserver='8.8.8.8'):
     resolver = dns.resolver.Resolver()
@@ -26,58 +26,103 @@ def is_public_ip(ip):
     except ValueError:
         return False
 
-def preflight_check(url, auth_token='', port=443):
+def is_loopback(hostname):
+    """Return True if the host is localhost or a loopback address."""
+    if hostname == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(hostname).is_loopback
+    except ValueError:
+        return False
+
+def check_http(url, auth_token='', connection=None, verify=True):
+    headers = {
+        "Authorization": f"Bearer {auth_token}",
+        'Content-Type': 'application/json'
+    }
+
+    # Through the pinned address when there is one, so the check covers
+    # the connection dispatch will use (and hands it a TLS ticket)
+    if connection is None:
+        r = requests.head(url, headers=headers, timeout=5, allow_redirects=True, verify=verify)
+    else:
+        with connection.session() as session:
+            r = session.head(connection.pin(url), headers=headers, timeout=5, verify=verify)
+
+    # 401, 405 mean:
+    # The server is real
+    # The endpoint exists
+    # But it doesn't allow the HEAD method — only POST (or maybe GET) is accepted
+
+    if r.status_code in (200, 202, 204, 301, 302, 401, 405):
+        print(f"[✓] HTTP request succeeded with status {r.status_code}")
+        return True
+    else:
+        print(f"[✗] Unexpected HTTP status code: {r.status_code}")
+        return False
+
+def preflight_check(url, auth_token='', port=443, verify=True):
+    """
+    Check that the endpoint is reachable over a public route.
+
+    Args:
+        url (str): The endpoint URL.
+        auth_token (str): Token for the HTTP check.
+        port (int): Port for the TLS check if the URL has none.
+        verify (bool or str): Certificate checks, as requests' `verify`
+            (see connection.verify_setting).
+
+    Returns:
+        ConnectionContext: The resolved address and TLS session, for the
+            dispatcher to reuse; None if a check failed.
+    """
     parsed = urlparse(url)
     hostname = parsed.hostname
+    port = parsed.port or port
+
+    # A local receiver (see receiver.py) has no public DNS record or TLS;
+    # only check that it answers
+    if is_loopback(hostname):
+        print(f"[✓] Loopback target {hostname}, skipping DNS and TLS checks")
+        try:
+            address = socket.gethostbyname(hostname) if hostname == "localhost" else hostname
+            connection = ConnectionContext(url, address)
+            return connection if check_http(url, auth_token, connection, verify) else None
+        except Exception as e:
+            print(f"[✗] Preflight check failed: {e}")
+            return None
 
     resolved_ip = resolve_public_ip(hostname)
     if not resolved_ip:
-        return False
+        return None
 
     if not is_public_ip(resolved_ip):
         print(f"[✗] Resolved IP {resolved_ip} is not public. VPN or DNS override may be active.")
-        return False
+        return None
     
     try:
         # Step 1: DNS resolution
         if not is_public_ip(resolved_ip):
             print(f"[✗] IP {resolved_ip} is not public. Possible VPN or proxy issue.")
-            return False
-
-        # Step 2: TLS Handshake Test
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        
-        with socket.create_connection((resolved_ip, port), timeout=5) as sock:
-            with context.wrap_socket(sock, server_hostname=hostname) as ssock:
-                cert = ssock.getpeercert()
-                print(f"[✓] TLS handshake succeeded with {hostname}")
+            return None
+
+        # Step 2: TLS Handshake Test. The certificate is checked as
+        # dispatch will check it, and the session is kept for resumption
+        context = None
+        if parsed.scheme == "https":
+            context = ResumableContext(verify)
+            with socket.create_connection((resolved_ip, port), timeout=5) as sock:
+                with context.wrap_socket(sock, server_hostname=hostname) as ssock:
+                    print(f"[✓] TLS handshake succeeded with {hostname} ({ssock.version()})")
         
-        # Step 3: HTTP GET test (use HEAD for minimal data)
-
-        headers = {
-            "Authorization": f"Bearer {auth_token}",
-            'Content-Type': 'application/json'
-        }
-
-        r = requests.head(url, headers=headers, timeout=5, allow_redirects=True)
-
-        # 401, 405 mean:
-        # The server is real
-        # The endpoint exists
-        # But it doesn't allow the HEAD method — only POST (or maybe GET) is accepted
-
-        if r.status_code in (200, 202, 204, 301, 302, 401, 405):
-            print(f"[✓] HTTP request succeeded with status {r.status_code}")
-            return True
-        else:
-            print(f"[✗] Unexpected HTTP status code: {r.status_code}")
-            return False
+        # Step 3: HTTP GET test (use HEAD for minimal data), on the
+        # resolved address
+        connection = ConnectionContext(url, resolved_ip, context)
+        return connection if check_http(url, auth_token, connection, verify) else None
 
     except Exception as e:
         print(f"[✗] Preflight check failed: {e}")
-        return False
+        return None
 
 # Load configuration from config.json
 def load_config(file_path='config.json'):
@@ -103,7 +148,8 @@ def main():
     config = load_config()
     if not preflight_check(
         url = config["webhook_url"], 
-        auth_token = config["auth_token"]
+        auth_token = config["auth_token"],
+        verify = verify_setting(config)
     ):
         print("❌ Network conditions are not suitable. Exiting.")
         exit(1)
@@ -0,0 +1,349 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from compression import zstandard
+from dispatcher import percentile
+
+RAW_PATH = "/services/collector/raw"
+EVENT_PATHS = ("/services/collector/event", "/services/collector")
+HEALTH_PATH = "/services/collector/health"
+
+class ReceiverStats:
+    """
+    Thread-safe counters for a Receiver.
+
+    Batch sizes are kept per reporting interval, so the distribution printed
+    by `report()` describes recent traffic rather than the whole run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.events = 0
+        self.batches = 0
+        self.wire_bytes = 0
+        self.bytes = 0
+        self.statuses = {}
+        self.resets = 0
+        self.interval_start = self.start
+        self.interval_events = 0
+        self.interval_bytes = 0
+        self.batch_sizes = []
+
+    def record(self, status, events=0, wire_bytes=0, raw_bytes=0):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 200:
+                self.events += events
+                self.batches += 1
+                self.wire_bytes += wire_bytes
+                self.bytes += raw_bytes
+                self.interval_events += events
+                self.interval_bytes += wire_bytes
+                self.batch_sizes.append(events)
+
+    def record_reset(self):
+        with self.lock:
+            self.resets += 1
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start, 1e-9)
+            return {
+                "events": self.events,
+                "batches": self.batches,
+                "wire_bytes": self.wire_bytes,
+                "bytes": self.bytes,
+                "events_per_sec": self.events / elapsed,
+                "wire_bytes_per_sec": self.wire_bytes / elapsed,
+                "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+                "resets": self.resets,
+                "elapsed": elapsed,
+            }
+
+    def report(self):
+        """
+        Return a one-line summary of the interval since the previous call.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(now - self.interval_start, 1e-9)
+            sizes = sorted(self.batch_sizes)
+            events, wire_bytes = self.interval_events, self.interval_bytes
+            statuses = ", ".join(f"{status}: {count:,}" for status, count in sorted(self.statuses.items()))
+            self.interval_start = now
+            self.interval_events = self.interval_bytes = 0
+            self.batch_sizes = []
+
+        line = (f"{events / elapsed:,.0f} events/s, {wire_bytes / elapsed / 1024**2:,.2f} MB/s, "
+                f"{len(sizes):,} batch(es)")
+        if sizes:
+            line += (f", events per batch p50 {percentile(sizes, 50):,.0f} p90 {percentile(sizes, 90):,.0f} "
+                     f"p99 {percentile(sizes, 99):,.0f} max {sizes[-1]:,}")
+        return f"{line}. Responses {statuses or 'none'}, {self.resets:,} reset(s)"
+
+def decode_body(wire, encoding):
+    """
+    Decompress a request body sent with Content-Encoding `encoding`.
+
+    Raises:
+        ValueError: If the encoding is not supported.
+        OSError, EOFError: If the body is corrupt.
+    """
+    encoding = (encoding or "").lower()
+    if encoding == "gzip":
+        return gzip.decompress(wire)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd bodies require the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(wire)
+    if encoding not in ("", "identity"):
+        raise ValueError(f"Unsupported Content-Encoding '{encoding}'")
+    return wire
+
+def count_events(body, raw):
+    """
+    Count the events in a decoded request body.
+
+    The raw endpoint takes one event per line. The event endpoint takes
+    concatenated JSON objects, each of which is parsed as HEC would.
+
+    Raises:
+        ValueError: If an event-endpoint body is not valid JSON.
+    """
+    if raw:
+        return len([line for line in body.split(b"\n") if line.strip()])
+
+    text = body.decode("utf-8")
+    decoder = json.JSONDecoder()
+    position = 0
+    count = 0
+    end = len(text)
+    while True:
+        while position < end and text[position].isspace():
+            position += 1
+        if position == end:
+            return count
+        _, position = decoder.raw_decode(text, position)
+        count += 1
+
+class Receiver(ThreadingHTTPServer):
+    """
+    Local stand-in for the HEC ingest endpoint.
+
+    Accepts POSTs to /services/collector/raw and /services/collector/event
+    with `Authorization: Bearer <token>` (or `Splunk <token>`), gzip or zstd
+    bodies, and keeps throughput stats. Latency, 429/503 responses and
+    connection resets can be injected to exercise the dispatcher's retry
+    and spool paths.
+
+    Args:
+        address (tuple): (host, port) to listen on; port 0 picks a free one.
+        token (str): Accepted token; None accepts any request.
+        latency (float): Added delay per request, in seconds.
+        latency_jitter (float): Uniform extra delay, up to this many seconds.
+        error_429 (float): Fraction of requests answered with 429.
+        error_503 (float): Fraction of requests answered with 503.
+        reset (float): Fraction of connections closed without a response.
+        retry_after (int): Retry-After seconds sent with 429/503 responses.
+        seed (int): Seed for the fault injection.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, token=None, latency=0.0, latency_jitter=0.0, error_429=0.0, error_503=0.0,
+                 reset=0.0, retry_after=None, seed=None):
+        super().__init__(address, ReceiverHandler)
+        self.token = token
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_429 = error_429
+        self.error_503 = error_503
+        self.reset = reset
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.stats = ReceiverStats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{RAW_PATH}"
+
+    def draw_fault(self):
+        """
+        Decide how to answer one request.
+
+        Returns:
+            tuple: (delay in seconds, "reset" / 429 / 503 / None).
+        """
+        with self.random_lock:
+            delay = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+            roll = self.random.random()
+        if roll < self.reset:
+            return delay, "reset"
+        roll -= self.reset
+        if roll < self.error_429:
+            return delay, 429
+        roll -= self.error_429
+        if roll < self.error_503:
+            return delay, 503
+        return delay, None
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; with Nagle on, every
+    # response would wait out the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, text, code, headers=None):
+        body = json.dumps({"text": text, "code": code}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if self.server.token is None:
+            return True
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme not in ("Bearer", "Splunk") or not token:
+            self.respond(401, "Token is required", 2)
+            self.server.stats.record(401)
+            return False
+        if token != self.server.token:
+            self.respond(403, "Invalid token", 4)
+            self.server.stats.record(403)
+            return False
+        return True
+
+    def path_only(self):
+        return self.path.split("?", 1)[0].rstrip("/")
+
+    def do_GET(self):
+        path = self.path_only()
+        if path == HEALTH_PATH:
+            self.respond(200, "HEC is healthy", 17)
+        elif path == "/stats":
+            body = json.dumps(self.server.stats.snapshot()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == RAW_PATH or path in EVENT_PATHS:
+            self.respond(405, "Method not allowed", 405)
+        else:
+            self.respond(404, "The requested URL was not found on this server.", 404)
+
+    def do_HEAD(self):
+        # Preflight probes with HEAD: answer like the real endpoint
+        path = self.path_only()
+        status = 405 if path == RAW_PATH or path in EVENT_PATHS else 404
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        path = self.path_only()
+        length = int(self.headers.get("Content-Length", 0))
+        wire = self.rfile.read(length)
+
+        if path != RAW_PATH and path not in EVENT_PATHS:
+            self.respond(404, "The requested URL was not found on this server.", 404)
+            self.server.stats.record(404)
+            return
+        if not self.authorized():
+            return
+
+        delay, fault = self.server.draw_fault()
+        if delay:
+            time.sleep(delay)
+        if fault == "reset":
+            # SO_LINGER 0 makes close() send an RST instead of a FIN
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            self.server.stats.record_reset()
+            return
+        if fault is not None:
+            headers = {"Retry-After": str(self.server.retry_after)} if self.server.retry_after is not None else None
+            if fault == 429:
+                self.respond(429, "Too many requests", 9, headers)
+            else:
+                self.respond(503, "Server is busy", 9, headers)
+            self.server.stats.record(fault)
+            return
+
+        try:
+            body = decode_body(wire, self.headers.get("Content-Encoding"))
+            events = count_events(body, path == RAW_PATH)
+        except (OSError, EOFError, ValueError) as e:
+            self.respond(400, f"Invalid data format: {e}", 6)
+            self.server.stats.record(400)
+            return
+
+        if not events:
+            self.respond(400, "No data", 5)
+            self.server.stats.record(400)
+            return
+
+        self.respond(200, "Success", 0)
+        self.server.stats.record(200, events, len(wire), len(body))
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HEC-compatible receiver for load testing eventgen.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--token", default=os.getenv("AUTH_TOKEN"),
+                        help="Accepted token (default: $AUTH_TOKEN; any token if unset)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Added delay per request, in milliseconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Uniform extra delay, in milliseconds")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-503", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--reset", type=float, default=0.0, help="Fraction of connections reset without a response")
+    parser.add_argument("--retry-after", type=int, help="Retry-After seconds sent with 429/503")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between stats lines")
+    parser.add_argument("--seed", type=int, help="Seed for the fault injection")
+    args = parser.parse_args()
+
+    server = Receiver(
+        (args.host, args.port),
+        token = args.token,
+        latency = args.latency / 1000,
+        latency_jitter = args.latency_jitter / 1000,
+        error_429 = args.error_429,
+        error_503 = args.error_503,
+        reset = args.reset,
+        retry_after = args.retry_after,
+        seed = args.seed,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[✓] Listening on {server.url} (and {EVENT_PATHS[0]})")
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            print(server.stats.report(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps(server.stats.snapshot()))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import contextlib
+import sys
+from datetime import datetime as dt, timezone
+from pipeline import ScheduleClock
+
+def parse_chunks(spec):
+    """
+    Parse a chunk list such as "12", "10-20" or "3,7,40-41".
+
+    Returns:
+        list: Sorted, distinct chunk indexes.
+    """
+    chunks = set()
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        chunks.update(range(int(first), int(last or first) + 1))
+    return sorted(chunks)
+
+def parse_moment(value):
+    # Unix time, or ISO 8601 (UTC unless an offset is given)
+    try:
+        return float(value)
+    except ValueError:
+        moment = dt.fromisoformat(value.replace("Z", "+00:00"))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+def regenerate(config, chunks, shard=0, log=print):
+    """
+    Regenerate chunks of a run from its config alone.
+
+    The plan (pool, event count, schedule) is rebuilt from the seed, the
+    attack checks of the chunks before the first one are replayed, and
+    each chunk is drawn from its own stream and stamped from the schedule.
+    For a seeded backfill with a fixed `backfill_start`, the lines are
+    byte-identical to the original run.
+
+    Args:
+        config (dict): The run's configuration.
+        chunks (callable or list): Chunk indexes, or a callable receiving
+            the ScheduleClock and chunk size and returning them.
+        shard (int): Shard the chunks belong to.
+        log (callable): Receives progress messages.
+
+    Yields:
+        tuple: (chunk index, index of its first event, list of lines).
+    """
+    from eventgen import open_stream, plan_events, shard_segments
+
+    with contextlib.redirect_stdout(sys.stderr):
+        plan = plan_events(config)
+    clock = ScheduleClock(shard_segments(config, plan["segments"], shard), plan["start"])
+    stream, encoder = open_stream(config, plan, shard, clock, log)
+    size = stream.chunk_events
+    if callable(chunks):
+        chunks = chunks(clock, size)
+
+    for index in sorted(set(chunks)):
+        first = index * size
+        if first >= clock.total:
+            raise ValueError(f"Chunk {index} is past the end of shard {shard} "
+                             f"({clock.total:,} events, {-(-clock.total // size):,} chunks)")
+        # The run stopped at the last scheduled event
+        count = min(size, clock.total - first)
+        stream.seek(index)
+        rows = stream.take(size)[:count]
+        yield index, first, encoder.encode(rows, clock.times(first, count))
+
+def main():
+    from eventgen import load_config
+
+    parser = argparse.ArgumentParser(description="Regenerate chunks of a seeded run, e.g. the events of a batch that failed to ingest.")
+    parser.add_argument("chunks", nargs="?", help="Chunk indexes: \"12\", \"10-20\" or \"3,7,40-41\"")
+    parser.add_argument("--at", action="append", default=[],
+                        help="Regenerate the chunk holding the event stamped at this time (Unix or ISO 8601); repeatable")
+    parser.add_argument("--shard", type=int, default=0, help="Shard the chunks belong to (default 0)")
+    parser.add_argument("--config", default="config.json", help="Config file of the original run")
+    parser.add_argument("--output", help="Write the events here instead of stdout")
+    args = parser.parse_args()
+    if not args.chunks and not args.at:
+        parser.error("give chunk indexes or --at")
+
+    config = load_config(args.config)
+    if config.get("seed") is None:
+        print("[!] No seed in the config: the chunks will not match any earlier run", file=sys.stderr)
+    if not config.get("backfill") or not config.get("backfill_start"):
+        print("[!] Not a backfill with a fixed backfill_start: timestamps (and attack positions) "
+              "will differ from the original run", file=sys.stderr)
+
+    def chunks(clock, size):
+        selected = parse_chunks(args.chunks) if args.chunks else []
+        selected += [clock.index_at(parse_moment(moment)) // size for moment in args.at]
+        return selected
+
+    log = lambda message: print(message, file=sys.stderr)
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for index, first, lines in regenerate(config, chunks, args.shard, log):
+            out.write(b"\n".join(lines) + b"\n")
+            log(f"[✓] Chunk {index}: events {first:,}..{first + len(lines) - 1:,}")
+    finally:
+        if args.output:
+            out.close()
+
+if __name__=="__main__":
+    main()
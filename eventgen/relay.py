@@ -0,0 +1,273 @@
+import argparse
+import os
+import threading
+import time
+import traceback
+from http.server import ThreadingHTTPServer
+from compression import payload_factory
+from dispatcher import Dispatcher
+from metrics import Metrics, metric
+from pipeline import batcher_from_config, parse_batch_bytes
+from receiver import EVENT_PATHS, RAW_PATH, ReceiverHandler, ReceiverStats, decode_body
+
+class Relay(ThreadingHTTPServer):
+    """
+    Open Data Stream target that coalesces single-record posts into batches.
+
+    The trigger scripts post one record per HTTP transaction. The relay
+    acknowledges each post as soon as its records are buffered, and feeds
+    them to a Batcher, so the ingest endpoint sees one request per
+    `batch_max_bytes` / `batch_max_events` / `batch_max_age` bundle rather
+    than one per record. Bundles are compressed and delivered by a
+    Dispatcher, with its spool, retries and backoff.
+
+    Buffered records (in the open bundle and in bundles waiting for the
+    dispatcher) are capped at `buffer_bytes`. A post that does not fit
+    waits up to `block_seconds` for room, then gets a 503 with Retry-After,
+    so a slow endpoint pushes back on the sensor instead of growing memory.
+
+    If handing a bundle to the dispatcher fails, the error is logged, the
+    relay stops accepting posts and `stopped` is set, so the caller can
+    shut it down rather than refuse every later post.
+
+    Args:
+        address (tuple): (host, port) to listen on; port 0 picks a free one.
+        config (dict): Upstream settings (webhook_url, auth_token, batching,
+            content_encoding, spool, ...).
+        token (str): Token the ODS target must send; None accepts any.
+        buffer_bytes (int): Most record bytes held before posts are refused.
+        block_seconds (float): How long a post may wait for room.
+        retry_after (int): Retry-After seconds sent with 503 responses.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, config, token=None, buffer_bytes=64 * 1024**2, block_seconds=5.0, retry_after=1):
+        super().__init__(address, RelayHandler)
+        self.token = token
+        self.buffer_bytes = buffer_bytes
+        self.block_seconds = block_seconds
+        self.retry_after = retry_after
+        self.stats = ReceiverStats()
+
+        self.dispatcher = Dispatcher(config)
+        self.batcher = batcher_from_config(config, payload_factory(config))
+        controller = getattr(self.dispatcher, "controller", None)
+        if controller:
+            controller.attach(self.batcher)
+
+        self.cond = threading.Condition()
+        self.ready = []
+        self.buffered = 0
+        self.records = 0
+        self.rejected = 0
+        self.closing = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.sender = threading.Thread(target=self._send_loop, name="relay-sender", daemon=True)
+        self.sender.start()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{RAW_PATH}"
+
+    def accept(self, records):
+        """
+        Buffer the records of one post.
+
+        Args:
+            records (list): Serialized records (bytes, without newline).
+
+        Returns:
+            bool: False if there was no room within `block_seconds`.
+        """
+        # Every record costs its length plus a newline separator
+        size = sum(len(record) + 1 for record in records)
+        deadline = time.monotonic() + self.block_seconds
+        with self.cond:
+            if self.closing:
+                self.rejected += 1
+                return False
+            while self.buffered and self.buffered + size > self.buffer_bytes:
+                left = deadline - time.monotonic()
+                if left <= 0 or self.closing:
+                    self.rejected += 1
+                    return False
+                self.cond.wait(left)
+
+            self.buffered += size
+            self.records += len(records)
+            for record in records:
+                bundle = self.batcher.add(record)
+                if bundle is not None:
+                    self.ready.append(bundle)
+            if self.ready:
+                self.cond.notify_all()
+        return True
+
+    def _send_loop(self):
+        try:
+            self._send_bundles()
+        except Exception as e:
+            traceback.print_exc()
+            print(f"[✗] Relay sender stopped: {e}", flush=True)
+            with self.cond:
+                self.error = e
+                self.closing = True
+                self.cond.notify_all()
+        finally:
+            self.stopped.set()
+
+    def _send_bundles(self):
+        # Hands full (or aged-out) bundles to the dispatcher; submit blocks
+        # while the dispatcher's backlog is full, and the buffer fills up
+        while True:
+            with self.cond:
+                while not self.ready:
+                    if self.batcher.expired() or (self.closing and self.batcher.bundle is not None):
+                        self.ready.append(self.batcher.flush())
+                    elif self.closing:
+                        return
+                    else:
+                        self.cond.wait(self.batcher.time_left() or 0.5)
+                bundles, self.ready = self.ready, []
+
+            for bundle in bundles:
+                self.dispatcher.submit(bundle.finish(), bundle.events)
+                with self.cond:
+                    self.buffered -= bundle.raw_bytes + 1
+                    self.cond.notify_all()
+
+    def close(self, drain_timeout=None):
+        """
+        Stop accepting posts, send what is buffered and drain the dispatcher.
+        """
+        self.shutdown()
+        self.server_close()
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.sender.join()
+        self.dispatcher.close(drain_timeout)
+
+    def metrics(self):
+        """
+        Collector for a metrics Registry.
+        """
+        with self.cond:
+            values = (self.records, self.rejected, self.buffered)
+        records, rejected, buffered = values
+        return [
+            metric("eventgen_relay_records_total", "counter", "Records accepted from the ODS target.", records),
+            metric("eventgen_relay_rejected_total", "counter", "Posts refused because the buffer was full.", rejected),
+            metric("eventgen_relay_buffer_bytes", "gauge", "Record bytes not yet handed to the dispatcher.", buffered),
+        ]
+
+    def summary(self):
+        with self.cond:
+            records, rejected, buffered = self.records, self.rejected, self.buffered
+        batches = self.dispatcher.stats()["batches"]
+        ratio = f", {records / batches:,.0f} record(s) per batch" if batches else ""
+        return (f"{records:,} record(s) in, {rejected:,} refused, {buffered / 1024**2:,.1f} MB buffered{ratio}. "
+                f"Dispatch: {self.dispatcher.summary()}")
+
+class RelayHandler(ReceiverHandler):
+    # Health checks, /stats, HEAD and token checks are the receiver's
+
+    def do_POST(self):
+        path = self.path_only()
+        length = int(self.headers.get("Content-Length", 0))
+        wire = self.rfile.read(length)
+
+        if path != RAW_PATH and path not in EVENT_PATHS:
+            self.respond(404, "The requested URL was not found on this server.", 404)
+            self.server.stats.record(404)
+            return
+        if not self.authorized():
+            return
+
+        try:
+            body = decode_body(wire, self.headers.get("Content-Encoding"))
+        except (OSError, EOFError, ValueError) as e:
+            self.respond(400, f"Invalid data format: {e}", 6)
+            self.server.stats.record(400)
+            return
+
+        # A trigger posts one JSON record; anything newline-delimited is
+        # taken one record per line
+        records = [line.strip() for line in body.split(b"\n") if line.strip()]
+        if not records:
+            self.respond(400, "No data", 5)
+            self.server.stats.record(400)
+            return
+
+        if not self.server.accept(records):
+            self.respond(503, "Server is busy", 9, {"Retry-After": str(self.server.retry_after)})
+            self.server.stats.record(503)
+            return
+
+        self.respond(200, "Success", 0)
+        self.server.stats.record(200, len(records), len(wire), len(body))
+
+def main():
+    from eventgen import load_config
+    from connection import verify_setting
+    from preflight import preflight_check
+
+    parser = argparse.ArgumentParser(
+        description="Coalesce per-record Open Data Stream posts into batches for the ingest endpoint.")
+    parser.add_argument("--config", default="config.json", help="Config file with the target settings")
+    parser.add_argument("--url", help="Override webhook_url")
+    parser.add_argument("--host", help="Address to listen on (default: relay_host, or 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="Port to listen on (default: relay_port, or 8089)")
+    parser.add_argument("--token", default=os.getenv("RELAY_TOKEN"),
+                        help="Token the ODS target must send (default: $RELAY_TOKEN; any token if unset)")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.url:
+        config["webhook_url"] = args.url
+
+    connection = preflight_check(
+        url = config["webhook_url"],
+        auth_token = config["auth_token"],
+        verify = verify_setting(config)
+    )
+    if not connection:
+        print("❌ Network conditions are not suitable. Exiting.")
+        exit(1)
+    config["connection"] = connection
+
+    relay = Relay(
+        (args.host or config.get("relay_host", "127.0.0.1"), args.port or int(config.get("relay_port", 8089))),
+        config,
+        token = args.token,
+        buffer_bytes = parse_batch_bytes(config.get("relay_buffer_bytes", 64 * 1024**2)),
+        block_seconds = float(config.get("relay_block_seconds", 5.0)),
+        retry_after = int(config.get("relay_retry_after", 1)),
+    )
+    metrics = Metrics(config)
+    metrics.register(relay.metrics)
+    metrics.register(relay.dispatcher.metrics)
+    threading.Thread(target=relay.serve_forever, daemon=True).start()
+    print(f"[✓] Relaying {relay.url} (and {EVENT_PATHS[0]}) to {config['webhook_url']}")
+
+    try:
+        # Runs until interrupted, or until the sender fails
+        while not relay.stopped.wait(args.interval):
+            print(relay.summary(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        relay.close(config.get("drain_timeout"))
+        metrics.close()
+        print(relay.summary())
+    if relay.error:
+        exit(1)
+
+if __name__=="__main__":
+    main()
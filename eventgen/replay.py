@@ -0,0 +1,197 @@
+import argparse
+import glob
+import heapq
+import itertools
+import mmap
+import os
+import re
+import time
+import zlib
+from operator import itemgetter
+from compression import zstandard, payload_factory
+from dispatcher import Dispatcher
+from pipeline import batcher_from_config
+
+# The envelope's "time" field, read without parsing the whole event
+TIME_FIELD = re.compile(rb'"time": ?(-?[0-9][0-9.eE+-]*)')
+# Sort key of events without a time
+NO_TIME = float("-inf")
+
+def segment_paths(paths):
+    """
+    Expand files, directories and globs into a sorted list of segments.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for suffix in ("*.ndjson", "*.ndjson.gz", "*.ndjson.zst"):
+                found += glob.glob(os.path.join(path, "**", suffix), recursive=True)
+        else:
+            found += glob.glob(path) or [path]
+    return sorted(found)
+
+def read_lines(path, chunk_size=4 * 1024**2):
+    """
+    Yield the events (bytes, without newline) of one NDJSON segment.
+
+    The file is memory-mapped read-only. Compressed segments are inflated
+    from the mapping in `chunk_size` pieces, so memory use stays bounded.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if path.endswith(".ndjson"):
+                start = 0
+                end = len(data)
+                while start < end:
+                    newline = data.find(b"\n", start)
+                    if newline < 0:
+                        newline = end
+                    if newline > start:
+                        yield data[start:newline]
+                    start = newline + 1
+                return
+
+            if path.endswith(".gz"):
+                decompressor = zlib.decompressobj(31)
+            else:
+                decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+            tail = b""
+            for offset in range(0, len(data), chunk_size):
+                block = tail + decompressor.decompress(data[offset:offset + chunk_size])
+                lines = block.split(b"\n")
+                tail = lines.pop()
+                for line in lines:
+                    if line:
+                        yield line
+            if tail:
+                yield tail
+
+def event_time(line):
+    match = TIME_FIELD.search(line)
+    return float(match.group(1)) if match else None
+
+def timed_lines(paths):
+    """
+    Yield (time, event) pairs of segments that follow each other in time.
+
+    An event without a "time" field takes the time of the one before it,
+    or NO_TIME at the start.
+    """
+    timestamp = NO_TIME
+    for path in paths:
+        for line in read_lines(path):
+            found = event_time(line)
+            if found is not None:
+                timestamp = found
+            yield timestamp, line
+
+def merged_lines(paths):
+    """
+    Yield (time, event) pairs of all segments in event-time order.
+
+    The segments of one directory (one shard of a run) follow each other
+    in file-name order, while every shard spans the whole time range, so
+    the directories are merged by event time.
+    """
+    directories = {}
+    for path in paths:
+        directories.setdefault(os.path.dirname(path), []).append(path)
+    return heapq.merge(*(timed_lines(group) for group in directories.values()), key=itemgetter(0))
+
+def replay(paths, config, speed=1.0, progress_interval=60):
+    """
+    Re-send recorded segments to `config["webhook_url"]`.
+
+    Args:
+        paths (list): Segment files or directories written by FileSink.
+        config (dict): Target settings (webhook_url, auth_token, batching,
+            content_encoding, ...).
+        speed (float): 1.0 keeps the original spacing between events,
+            2.0 replays twice as fast, and 0 sends as fast as possible.
+
+    Returns:
+        dict: Dispatcher stats.
+
+    Raises:
+        ValueError: If `speed` is set but the events carry no "time" field
+            (the ods and record profiles), so they cannot be paced.
+    """
+    paths = segment_paths(paths)
+    if speed:
+        events = merged_lines(paths)
+        first = next(events, None)
+        if first is not None and first[0] == NO_TIME:
+            raise ValueError("The events carry no \"time\" field, so they cannot be replayed with their "
+                             "original spacing. Use --speed 0 to send them as fast as possible.")
+        if first is not None:
+            events = itertools.chain([first], events)
+    else:
+        events = ((None, line) for path in paths for line in read_lines(path))
+
+    dispatcher = Dispatcher(config)
+    batcher = batcher_from_config(config, payload_factory(config))
+    first_event_time = None
+    start = time.monotonic()
+    last_print_time = start
+    count = 0
+
+    def send(bundle):
+        if bundle is not None:
+            dispatcher.submit(bundle.finish(), bundle.events)
+
+    try:
+        for timestamp, line in events:
+            if speed:
+                if first_event_time is None:
+                    first_event_time = timestamp
+                due = start + (timestamp - first_event_time) / speed
+                ahead = due - time.monotonic()
+                if ahead > 0.005:
+                    # Don't hold back a bundle while waiting
+                    if batcher.expired() or ahead >= (batcher.time_left() or 0):
+                        send(batcher.flush())
+                    time.sleep(ahead)
+
+            send(batcher.add(line))
+            if batcher.expired():
+                send(batcher.flush())
+            count += 1
+
+            now = time.monotonic()
+            if now - last_print_time >= progress_interval:
+                print(f"{count:,} events replayed in {int((now - start) // 60)} minute(s). {dispatcher.summary()}")
+                last_print_time = now
+
+        send(batcher.flush())
+    finally:
+        dispatcher.close(config.get("drain_timeout"))
+
+    elapsed = time.monotonic() - start
+    print(f"Replayed {count:,} events in {elapsed:.2f} seconds. {dispatcher.summary()}")
+    return dispatcher.stats()
+
+def main():
+    from eventgen import load_config
+
+    parser = argparse.ArgumentParser(description="Replay NDJSON segments written with \"output\": \"file\".")
+    parser.add_argument("paths", nargs="+", help="Segment files, directories or globs")
+    parser.add_argument("--config", default="config.json", help="Config file with the target settings")
+    parser.add_argument("--url", help="Override webhook_url")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed multiplier; 1 keeps the original timing, 0 sends as fast as possible")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.url:
+        config["webhook_url"] = args.url
+    try:
+        replay(args.paths, config, speed=args.speed)
+    except ValueError as e:
+        print(f"[✗] {e}")
+        exit(1)
+
+if __name__=="__main__":
+    main()
@@ -1,11 +1,14 @@
 import random
 import time
 import json
-from faker import Faker
-import ipaddress
 from functools import lru_cache
+from ipsampler import cidr_table
 
-fake = Faker()
+@lru_cache(maxsize=None)
+def get_fake():
+    # Faker is slow to import and construct, so only load it on first use
+    from faker import Faker
+    return Faker()
 
 # Define malicious patterns
 malicious_patterns = [
@@ -22,6 +25,12 @@ malicious_patterns = [
     ("/?cmd=rm+-rf+/", "GET", 400, 5, "Command injection probing for remote shell execution."),
 ]
 
+# Value choices for benign entries
+benign_methods = ["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD"]
+benign_status_codes = [200, 201, 202, 204, 206, 301, 302, 303, 304, 307, 308, 408, 429, 500, 501, 502, 503, 504]
+protocols = ["HTTP", "HTTPS"]
+request_content_types = ["application/json", "application/x-www-form-urlencoded", "multipart/form-data"]
+
 # Define CIDRs for high-risk countries
 high_risk_cidrs = [
     '5.8.0.0/16',         # Russia
@@ -36,12 +45,12 @@ high_risk_cidrs = [
 ]
 
 def get_biased_malicious_ip():
-    return random_ip_from_cidr(random.choice(high_risk_cidrs))
+    # Each country block is picked equally often, then any host within it
+    return cidr_table(tuple(high_risk_cidrs)).sample()
 
 def random_ip_from_cidr(cidr):
-    net = ipaddress.IPv4Network(cidr)
-    # Skip network and broadcast addresses
-    return str(random.choice(list(net.hosts())))
+    # Skips network and broadcast addresses, like net.hosts()
+    return cidr_table((cidr,)).sample()
 
 @lru_cache(maxsize=None)
 def generate_ip_pool(size=100, include_ipv6=False):
@@ -52,7 +61,7 @@ def generate_ip_pool(size=100, include_ipv6=False):
     :param include_ipv6: Whether to include IPv6 addresses in the pool (default False).
     :return: List of IP addresses.
     """
-    fake = Faker()
+    fake = get_fake()
     if include_ipv6:
         return [fake.ipv4() if i % 2 == 0 else fake.ipv6() for i in range(size)]
     else:
@@ -60,14 +69,15 @@ def generate_ip_pool(size=100, include_ipv6=False):
 
 # Function to generate a single log entry (malicious or benign)
 def generate_log_entry(malicious=False, pattern = {}):
+    fake = get_fake()
     if malicious:
         uri, method, status, severity, message = pattern
         client_ip = get_biased_malicious_ip()
 
     else:
         uri = "/" + fake.uri_path()
-        method = random.choice(["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD"])
-        status = random.choice([200, 201, 202, 204, 206, 301, 302, 303, 304, 307, 308, 408, 429, 500, 501, 502, 503, 504])
+        method = random.choice(benign_methods)
+        status = random.choice(benign_status_codes)
         client_ip = random.choice(generate_ip_pool())
         severity = 1
         message = "Common incoming request."
@@ -76,7 +86,7 @@ def generate_log_entry(malicious=False, pattern = {}):
         "message": message,
         "severity": severity,
         "time": round(time.time(), 6),
-        "protocol": random.choice(["HTTP", "HTTPS"]),
+        "protocol": random.choice(protocols),
         "client": {"ipaddr": client_ip},
         "server": {"ipaddr": fake.ipv4_public()},
         "method": method,
@@ -86,7 +96,7 @@ def generate_log_entry(malicious=False, pattern = {}):
         "request_header": {
             "Host": fake.hostname(),
             "User-Agent": fake.user_agent(),
-            "Content-Type": random.choice(["application/json", "application/x-www-form-urlencoded", "multipart/form-data"])
+            "Content-Type": random.choice(request_content_types)
         },
         "response_header": {
             "Content-Type": "application/json",
@@ -96,8 +106,30 @@ def generate_log_entry(malicious=False, pattern = {}):
         "user": fake.user_name()
     }
 
-def getMaliciousEntry():
-    return generate_log_entry(malicious=True, pattern=random.choice(malicious_patterns))
+def getMaliciousEntry(base=None, pattern=None, client_ip=None):
+    """
+    Return a malicious log entry.
+
+    :param base: Optional benign entry (e.g. from the sample pool) to turn
+        into an attack; avoids calling Faker for the remaining fields.
+    :param pattern: Entry of malicious_patterns; random if not given.
+    :param client_ip: Source address; a high-risk country IP if not given.
+    """
+    pattern = pattern or random.choice(malicious_patterns)
+    if base is None:
+        return generate_log_entry(malicious=True, pattern=pattern)
+
+    uri, method, status, severity, message = pattern
+    entry = dict(base)
+    entry.update({
+        "message": message,
+        "severity": severity,
+        "client": {"ipaddr": client_ip or get_biased_malicious_ip()},
+        "method": method,
+        "uri": uri,
+        "status_code": status,
+    })
+    return entry
 
 def getBeningEntries(max = 1000):
     log_entries = [generate_log_entry(malicious=False) for _ in range(max)]
@@ -0,0 +1,289 @@
+import json
+import mmap
+import os
+import struct
+import time
+import numpy as np
+from samplegen import benign_methods, benign_status_codes, protocols, request_content_types
+
+# Columns drawn from interned string tables, with the number of unique
+# values generated per column as a fraction of the pool size
+FAKER_COLUMNS = {
+    "uri": 1.0,
+    "user": 1.0,
+    "host": 0.5,
+    "server_ip": 0.25,
+    "user_agent": 0.2,
+    "client_ip": 0.02,
+}
+
+# Bump whenever the cache layout or the columns above change
+CACHE_VERSION = 1
+CACHE_MAGIC = b"EGPOOL"
+# Magic, format version and length of the JSON header that follows
+CACHE_PREAMBLE = struct.Struct("<6sII")
+
+class MappedStrings:
+    """
+    Read-only string table backed by a memory-mapped cache file.
+
+    Strings are stored back to back as UTF-8 with a uint32 offsets array;
+    each one is decoded on first access and then kept.
+    """
+
+    def __init__(self, buffer, offsets, data_start):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.data_start = data_start
+        self.decoded = [None] * (len(offsets) - 1)
+
+    def __len__(self):
+        return len(self.decoded)
+
+    def __getitem__(self, index):
+        value = self.decoded[index]
+        if value is None:
+            start = self.data_start + int(self.offsets[index])
+            end = self.data_start + int(self.offsets[index + 1])
+            value = self.decoded[index] = str(self.buffer[start:end], "utf-8")
+        return value
+
+class SamplePool:
+    """
+    Columnar pool of benign sample values.
+
+    Every field is an independent column: a table of interned strings plus
+    NumPy index arrays drawn in bulk. An entry is assembled by taking one
+    index per column, so a pool built from a few thousand Faker calls yields
+    billions of distinct combinations while memory stays proportional to
+    the number of unique values.
+
+    Args:
+        tables (dict): Column name -> list of unique values.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def draw(self, n, rng):
+        """
+        Draw `n` rows of per-column indices (or values for numeric columns).
+
+        Args:
+            n (int): Number of rows.
+            rng (numpy.random.Generator): Random source.
+
+        Returns:
+            dict: Column name -> NumPy array of length `n`.
+        """
+        columns = {name: rng.integers(0, len(table), size=n, dtype=np.int32)
+                   for name, table in self.tables.items()}
+        columns["round_trip_time"] = rng.integers(50, 501, size=n, dtype=np.int32)
+        columns["content_length"] = rng.integers(0, 10001, size=n, dtype=np.int32)
+        return columns
+
+    def entries(self, n, rng):
+        """
+        Assemble `n` sample entries shaped like `samplegen.generate_log_entry`.
+
+        Returns:
+            list: New, independent entry dicts.
+        """
+        t = self.tables
+        now = round(time.time(), 6)
+        columns = {name: column.tolist() for name, column in self.draw(n, rng).items()}
+        return [
+            {
+                "message": "Common incoming request.",
+                "severity": 1,
+                "time": now,
+                "protocol": t["protocol"][protocol],
+                "client": {"ipaddr": t["client_ip"][client_ip]},
+                "server": {"ipaddr": t["server_ip"][server_ip]},
+                "method": t["method"][method],
+                "uri": t["uri"][uri],
+                "status_code": t["status_code"][status_code],
+                "round_trip_time": round_trip_time,
+                "request_header": {
+                    "Host": t["host"][host],
+                    "User-Agent": t["user_agent"][user_agent],
+                    "Content-Type": t["content_type"][content_type]
+                },
+                "response_header": {
+                    "Content-Type": "application/json",
+                    "Content-Length": str(content_length)
+                },
+                "response_content_type": "application/json",
+                "user": t["user"][user]
+            }
+            for (protocol, client_ip, server_ip, method, uri, status_code, round_trip_time,
+                 host, user_agent, content_type, content_length, user) in zip(
+                columns["protocol"], columns["client_ip"], columns["server_ip"], columns["method"],
+                columns["uri"], columns["status_code"], columns["round_trip_time"], columns["host"],
+                columns["user_agent"], columns["content_type"], columns["content_length"], columns["user"])
+        ]
+
+    def sampler(self, rng=None, batch=4096):
+        """
+        Return a callable producing one new entry per call.
+
+        Entries are assembled `batch` at a time so the per-call cost is a
+        list pop rather than a round of random draws.
+        """
+        rng = rng or np.random.default_rng()
+        buffer = []
+
+        def next_sample():
+            if not buffer:
+                buffer.extend(reversed(self.entries(batch, rng)))
+            return buffer.pop()
+
+        return next_sample
+
+    def unique_values(self):
+        return sum(len(table) for table in self.tables.values())
+
+def intern_unique(values):
+    # Keep first-seen order so a seeded build is reproducible
+    return list(dict.fromkeys(values))
+
+def build_sample_pool(size=5000, seed=None):
+    """
+    Build a SamplePool with roughly `size` unique values per wide column.
+
+    Args:
+        size (int): Unique URIs and users; other columns scale from it.
+        seed (int): Seed for Faker, for a reproducible pool.
+
+    Returns:
+        SamplePool: The pool.
+    """
+    from faker import Faker
+
+    fake = Faker()
+    if seed is not None:
+        fake.seed_instance(seed)
+
+    generators = {
+        "uri": lambda: "/" + fake.uri_path(),
+        "user": fake.user_name,
+        "host": fake.hostname,
+        "server_ip": fake.ipv4_public,
+        "user_agent": fake.user_agent,
+        "client_ip": fake.ipv4,
+    }
+
+    tables = {}
+    for name, fraction in FAKER_COLUMNS.items():
+        count = max(1, int(size * fraction))
+        tables[name] = intern_unique(generators[name]() for _ in range(count))
+
+    tables.update(constant_tables())
+    return SamplePool(tables)
+
+def constant_tables():
+    # Small fixed vocabularies; never cached since they live in the code
+    return {
+        "protocol": list(protocols),
+        "method": list(benign_methods),
+        "status_code": list(benign_status_codes),
+        "content_type": list(request_content_types),
+    }
+
+def cache_path(cache_dir, size, seed):
+    seed_key = "unseeded" if seed is None else str(seed)
+    return os.path.join(cache_dir, f"pool-v{CACHE_VERSION}-{size}-{seed_key}.bin")
+
+def save_sample_pool(pool, path, size, seed):
+    """
+    Write the Faker-generated columns of `pool` to a versioned cache file.
+
+    The file holds a JSON header describing each column, then per column a
+    uint32 offsets array and the concatenated UTF-8 strings. It is written
+    to a temporary name and renamed so readers never see a partial file.
+    """
+    columns = []
+    blobs = []
+    position = 0
+    for name in FAKER_COLUMNS:
+        encoded = [value.encode("utf-8") for value in pool.tables[name]]
+        offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = b"".join(encoded)
+        columns.append({"name": name, "count": len(encoded), "offsets": position,
+                        "data": position + offsets.nbytes, "length": len(data)})
+        blobs += [offsets.tobytes(), data]
+        position += offsets.nbytes + len(data)
+
+    header = json.dumps({"size": size, "seed": seed, "columns": columns,
+                         "fractions": FAKER_COLUMNS}).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CACHE_PREAMBLE.pack(CACHE_MAGIC, CACHE_VERSION, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+def load_sample_pool(path, size, seed):
+    """
+    Memory-map a cache file written by save_sample_pool.
+
+    Returns:
+        SamplePool: The pool, or None if the file is missing, from another
+            format version, or was built for a different size or seed.
+    """
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    try:
+        magic, version, header_length = CACHE_PREAMBLE.unpack_from(buffer, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        header = json.loads(buffer[CACHE_PREAMBLE.size:CACHE_PREAMBLE.size + header_length])
+        if header["size"] != size or header["seed"] != seed or header["fractions"] != FAKER_COLUMNS:
+            return None
+    except (struct.error, ValueError, KeyError):
+        return None
+
+    base = CACHE_PREAMBLE.size + header_length
+    tables = {}
+    for column in header["columns"]:
+        offsets = np.frombuffer(buffer, dtype="<u4", count=column["count"] + 1,
+                                offset=base + column["offsets"])
+        tables[column["name"]] = MappedStrings(buffer, offsets, base + column["data"])
+    tables.update(constant_tables())
+    return SamplePool(tables)
+
+def cached_sample_pool(size=5000, seed=None, cache_dir=None):
+    """
+    Load the sample pool from cache, building and saving it on a miss.
+
+    Faker is only imported when the pool has to be rebuilt.
+
+    Args:
+        size (int): Pool size, see build_sample_pool.
+        seed (int): Faker seed; part of the cache key.
+        cache_dir (str): Cache location; defaults to ~/.cache/eventgen.
+
+    Returns:
+        SamplePool: The pool.
+    """
+    cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "eventgen")
+    path = cache_path(cache_dir, size, seed)
+
+    pool = load_sample_pool(path, size, seed)
+    if pool is not None:
+        return pool
+
+    pool = build_sample_pool(size, seed)
+    try:
+        save_sample_pool(pool, path, size, seed)
+    except OSError as e:
+        print(f"[!] Could not write sample pool cache {path}: {e}")
+    return pool
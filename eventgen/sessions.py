@@ -0,0 +1,266 @@
+import json
+from collections import deque
+import numpy as np
+from encoder import CONTENT_LENGTH_RANGE, RTT_RANGE
+from ipsampler import format_ipv4, public_ipv4_table
+
+# Slots in the timing wheel; a power of two, so a slot's list is at
+# `slot & WHEEL_MASK`
+WHEEL_SLOTS = 1 << 16
+WHEEL_MASK = WHEEL_SLOTS - 1
+# Session cycles (session plus idle gap) one turn of the wheel spans, so
+# few wake-ups land beyond it
+WHEEL_CYCLES = 4
+# A followed link leads at most this many entries further in the URI table
+LINK_SPREAD = 8
+# Requests per session are capped to fit the int16 counter
+MAX_CLICKS = 10000
+# A client is rescheduled only after the batch its request is in, so a
+# batch of timed requests spans at most this share of a think time
+BATCH_SPAN = 0.125
+
+class SessionEngine:
+    """
+    A population of simulated clients that browse in sessions.
+
+    Every client keeps a sticky IP address, user, user agent, request
+    content type and protocol, and the site and page it is on. A session is
+    a run of requests separated by think times; a followed link leads to a
+    nearby page of the URI table, otherwise the client jumps to a random
+    one. When the session ends, the client goes idle and later comes back
+    on a fresh site. So each IP and user shows up in bursts, with a steady
+    user agent and a plausible path, at the cardinality of the population.
+
+    State lives in one NumPy array per attribute (about 20 bytes per
+    client), and the client IPs and users are pre-encoded JSON fragments
+    that replace the pool's tables in the encoder. Due clients are taken
+    from a timing wheel: WHEEL_SLOTS lists of client ids, one per `tick`
+    seconds, with an overflow list for wake-ups beyond one turn of the
+    wheel. Taking and rescheduling a client is O(1), and every other step
+    is vectorized per batch.
+
+    The wheel runs on the timestamps of the events it is asked for: the
+    first timed `draw` pins slot 0 to its first timestamp, each event is
+    sent by a client due by its slot, and the client's next request is
+    scheduled from the event's timestamp. So think times and idle gaps
+    show up in the output as they were drawn. The pipeline's schedule still
+    sets the event rate: when it asks for fewer events than the clients
+    are due to send, clients wait their turn in due order, and their gaps
+    stretch; when it asks for more, the next clients due are taken early.
+    Size `clients` to the rate (about rate * cycle / clicks, where a cycle
+    is a session plus an idle gap) to keep both small.
+
+    `draw` takes the arguments of EventEncoder.draw, plus the timestamps,
+    and returns the same rows, so the engine can stand in for the encoder
+    in an EventStream, and every output profile serializes it.
+
+    Args:
+        encoder (EventEncoder): Serializer of the rows; its client IP and
+            user tables are replaced.
+        pool (SamplePool): Source of the user names.
+        clients (int): Size of the population.
+        rng (numpy.random.Generator): Draws the population.
+        users (int): Distinct users; defaults to half the clients, as
+            users often have more than one device.
+        clicks (float): Mean requests per session.
+        think (float): Mean seconds between requests in a session.
+        idle (float): Mean seconds between sessions.
+        follow (float): Chance that the next request follows a link.
+    """
+
+    # Draws depend on the previous ones; see EventStream.seek
+    stateful = True
+
+    def __init__(self, encoder, pool, clients, rng, users=None, clicks=10, think=20.0, idle=1800.0, follow=0.8):
+        self.encoder = encoder
+        self.clients = int(clients)
+        if self.clients < 1:
+            raise ValueError("A session engine needs at least one client")
+        self.clicks = max(float(clicks), 1.0)
+        self.think = float(think)
+        self.idle = float(idle)
+        self.follow = follow
+        n = self.clients
+
+        # Sticky identity: one public address per client, and a user drawn
+        # from a table larger than the pool's by suffixing its names
+        addresses = public_ipv4_table().draw_ints(n, rng).tolist()
+        encoder.client_ip = [b'"' + format_ipv4(address).encode() + b'"' for address in addresses]
+        names = pool.tables["user"]
+        users = int(users or max(1, n // 2))
+        encoder.user = [
+            json.dumps(names[i] if i < len(names) else f"{names[i % len(names)]}{i // len(names)}").encode("utf-8")
+            for i in range(users)
+        ]
+
+        self.user = rng.integers(0, users, size=n, dtype=np.int32)
+        self.agent = rng.integers(0, len(encoder.user_agent), size=n, dtype=np.int32)
+        self.content_type = rng.integers(0, len(encoder.content_type), size=n, dtype=np.int8)
+        self.protocol = rng.integers(0, len(encoder.protocol), size=n, dtype=np.int8)
+        self.host = rng.integers(0, len(encoder.host_header), size=n, dtype=np.int32)
+        self.uri = rng.integers(0, len(encoder.uri), size=n, dtype=np.int32)
+        self.left = self._session_lengths(n, rng)
+
+        # Size the tick so a turn of the wheel spans WHEEL_CYCLES cycles,
+        # but never longer than a think time
+        cycle = self.clicks * self.think + self.idle
+        self.tick = min(self.think, WHEEL_CYCLES * cycle / WHEEL_SLOTS) or 1.0
+        # Unix time of slot 0, set by the first timed draw
+        self.origin = None
+        # Next slot to take clients from, and the due clients taken from
+        # the slots before it but not sent yet
+        self.cursor = 0
+        self.slots = [[] for _ in range(WHEEL_SLOTS)]
+        self.overflow = []
+        self.pending = deque()
+        # Start in the steady state: the share of the clients that is mid-
+        # session at any time is browsing, the rest are idle. Both waits are
+        # exponential, so what is left of them is too.
+        browsing = rng.random(n) < self.clicks * self.think / cycle
+        due = np.where(browsing, rng.exponential(self.think, size=n), rng.exponential(self.idle, size=n))
+        self._schedule(np.arange(n), due)
+
+    def _session_lengths(self, n, rng):
+        return np.minimum(rng.geometric(1 / self.clicks, size=n), MAX_CLICKS).astype(np.int16)
+
+    def _schedule(self, ids, due):
+        # Due times to slots; nothing goes into a slot already taken
+        slots = np.maximum((due / self.tick).astype(np.int64), self.cursor).tolist()
+        horizon = self.cursor + WHEEL_SLOTS
+        wheel, overflow = self.slots, self.overflow
+        for client, slot in zip(ids.tolist(), slots):
+            if slot < horizon:
+                wheel[slot & WHEEL_MASK].append(client)
+            else:
+                overflow.append((slot, client))
+
+    def _wrap(self):
+        # A new turn of the wheel: move the wake-ups that now fit into it
+        horizon = self.cursor + WHEEL_SLOTS
+        later = []
+        for slot, client in self.overflow:
+            if slot < horizon:
+                self.slots[slot & WHEEL_MASK].append(client)
+            else:
+                later.append((slot, client))
+        self.overflow = later
+
+    def _take(self, ends):
+        # One client per event, in due order: every client due by the
+        # event's slot is moved to `pending` first. If none is left, the
+        # next client due is taken early, but the wheel is not turned past
+        # the event, so it keeps to the events' time.
+        pending, wheel = self.pending, self.slots
+        ids = []
+        ahead = self.cursor
+        for end in ends:
+            while self.cursor <= end:
+                slot = wheel[self.cursor & WHEEL_MASK]
+                if slot:
+                    pending.extend(slot)
+                    slot.clear()
+                self.cursor += 1
+                if not self.cursor & WHEEL_MASK:
+                    self._wrap()
+            if pending:
+                ids.append(pending.popleft())
+                continue
+            # Slots before `ahead` were emptied earlier in this batch
+            ahead = max(ahead, self.cursor)
+            horizon = self.cursor + WHEEL_SLOTS
+            while ahead < horizon and not wheel[ahead & WHEEL_MASK]:
+                ahead += 1
+            if ahead < horizon:
+                ids.append(wheel[ahead & WHEEL_MASK].pop())
+            else:
+                self.overflow.sort()
+                ids.append(self.overflow.pop(0)[1])
+        return ids
+
+    def draw(self, n, rng, times=None):
+        """
+        Return the next `n` requests of the population.
+
+        Args:
+            n (int): Number of rows.
+            rng (numpy.random.Generator): Random source.
+            times (list): Non-decreasing timestamps of the rows. Without
+                them, the wheel is turned just far enough to find `n`
+                due clients.
+
+        Returns:
+            list: Row tuples, see EventEncoder.encode.
+        """
+        if times is not None:
+            if self.origin is None:
+                self.origin = times[0]
+            moments = np.asarray(times, dtype=np.float64) - self.origin
+        rows = []
+        # A client is rescheduled only after its request, so one step
+        # takes at most every client once
+        while len(rows) < n:
+            first = len(rows)
+            k = min(n - first, self.clients)
+            if times is None:
+                rows += self._step(k, None, rng)
+                continue
+            end = int(np.searchsorted(moments, moments[first] + self.think * BATCH_SPAN, side="right"))
+            k = max(1, min(k, end - first))
+            rows += self._step(k, moments[first:first + k], rng)
+        return rows
+
+    def _step(self, k, moments, rng):
+        encoder = self.encoder
+        if moments is None:
+            # Turn the wheel to the next client due
+            while not self.pending and not self.slots[self.cursor & WHEEL_MASK]:
+                self.cursor += 1
+                if not self.cursor & WHEEL_MASK:
+                    self._wrap()
+            ids = np.array(self._take([self.cursor] * k), dtype=np.int64)
+            now = self.cursor * self.tick
+        else:
+            ids = np.array(self._take((moments / self.tick).astype(np.int64).tolist()), dtype=np.int64)
+            now = moments
+        host, uri, uris = self.host[ids], self.uri[ids], len(encoder.uri)
+
+        # Servers are tied to sites
+        rows = list(zip(
+            self.protocol[ids].tolist(), ids.tolist(), (host % len(encoder.server_ip)).tolist(),
+            rng.integers(0, len(encoder.method), size=k, dtype=np.int32).tolist(), uri.tolist(),
+            rng.integers(0, len(encoder.status_code), size=k, dtype=np.int32).tolist(), host.tolist(),
+            self.agent[ids].tolist(), self.content_type[ids].tolist(), self.user[ids].tolist(),
+            rng.integers(*RTT_RANGE, size=k, dtype=np.int32).tolist(),
+            rng.integers(*CONTENT_LENGTH_RANGE, size=k, dtype=np.int32).tolist(),
+        ))
+
+        # Move every client on: to the next page of its session, or, when
+        # the session is over, to a fresh site after an idle gap
+        left = self.left[ids] - 1
+        ended = left <= 0
+        jump = rng.integers(0, uris, size=k)
+        follow = rng.random(k) < self.follow
+        linked = (uri + rng.integers(1, LINK_SPREAD + 1, size=k)) % uris
+        self.uri[ids] = np.where(follow & ~ended, linked, jump)
+        self.host[ids] = np.where(ended, rng.integers(0, len(encoder.host_header), size=k), host)
+        self.left[ids] = np.where(ended, self._session_lengths(k, rng), left)
+        wait = np.where(ended, rng.exponential(self.idle, size=k), rng.exponential(self.think, size=k))
+        self._schedule(ids, now + wait)
+        return rows
+
+def sessions_from_config(config, encoder, pool, rng, clients=None):
+    """
+    Build the SessionEngine for the session_* settings.
+
+    Args:
+        clients (int): Population; defaults to `sessions`.
+    """
+    return SessionEngine(
+        encoder, pool,
+        clients = clients or int(config["sessions"]),
+        rng = rng,
+        users = config.get("session_users"),
+        clicks = float(config.get("session_clicks", 10)),
+        think = float(config.get("session_think", 20.0)),
+        idle = float(config.get("session_idle", 1800.0)),
+    )
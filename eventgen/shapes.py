@@ -0,0 +1,214 @@
+import csv
+import math
+from datetime import datetime as dt
+import numpy as np
+
+# Most steps a curve is cut into, so long time ranges stay cheap to schedule
+MAX_STEPS = 36000
+# Finest step, in seconds
+MIN_RESOLUTION = 0.1
+
+def linear_shape(options, start, duration):
+    # Constant rate
+    return lambda t: np.ones_like(t)
+
+def sine_shape(options, start, duration):
+    """
+    `periods` full sine periods over the range, scaled to `min`..1.
+    The defaults reproduce the original wave mode.
+    """
+    periods = float(options.get("periods", 2))
+    low = float(options.get("min", 0.2))
+    return lambda t: low + (np.sin(2 * math.pi * periods * t / duration) + 1) / 2 * (1 - low)
+
+def diurnal_shape(options, start, duration):
+    """
+    Daily cycle on the wall clock: peaks at `peak_hour` (UTC) and drops
+    to `min` overnight. A second harmonic flattens the night and sharpens
+    the working-day peak.
+    """
+    peak_hour = float(options.get("peak_hour", 14))
+    low = float(options.get("min", 0.2))
+    # Range of 0.75 cos(x) + 0.25 cos(2x)
+    bottom, top = -0.53125, 1.0
+
+    def rate(t):
+        phase = 2 * math.pi * ((start + t) / 3600 - peak_hour) / 24
+        value = 0.75 * np.cos(phase) + 0.25 * np.cos(2 * phase)
+        return low + (value - bottom) / (top - bottom) * (1 - low)
+
+    return rate
+
+def burst_shape(options, start, duration):
+    """
+    Constant base rate with spikes of `factor` times the base, lasting
+    `length` seconds, every `every` seconds (first one after `offset`).
+    """
+    every = float(options.get("every", 600))
+    length = float(options.get("length", 30))
+    factor = float(options.get("factor", 5))
+    offset = float(options.get("offset", every / 2))
+
+    def rate(t):
+        in_burst = ((t - offset) % every < length) & (t >= offset)
+        return np.where(in_burst, factor, 1.0)
+
+    return rate
+
+def ramp_shape(options, start, duration):
+    # Straight line from `from` to `to` times the peak rate
+    begin = float(options.get("from", 0.1))
+    end = float(options.get("to", 1.0))
+    return lambda t: begin + (end - begin) * t / duration
+
+def step_shape(options, start, duration):
+    """
+    Piecewise-constant `levels`, each held for an equal share of the range
+    or for the relative `weights` given.
+    """
+    levels = np.asarray(options.get("levels", [1, 2, 4, 2]), dtype=float)
+    weights = np.asarray(options.get("weights", [1] * len(levels)), dtype=float)
+    if len(weights) != len(levels):
+        raise ValueError("step shape: `weights` must have one entry per level")
+    edges = np.cumsum(weights) / weights.sum() * duration
+    return lambda t: levels[np.minimum(np.searchsorted(edges, t, side="right"), len(levels) - 1)]
+
+def read_rate_csv(path):
+    """
+    Read a recorded rate trace: rows of (time, rate).
+
+    `time` is seconds (any origin, e.g. Unix time) or an ISO 8601 timestamp;
+    `rate` is events per second, or any quantity proportional to it. A header
+    row is skipped.
+
+    Returns:
+        tuple: (times, rates) NumPy arrays, sorted by time.
+    """
+    times = []
+    rates = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            try:
+                rate = float(row[1])
+            except ValueError:
+                if not times:
+                    continue  # Header
+                raise ValueError(f"{path}: bad rate {row[1]!r}")
+            try:
+                moment = float(row[0])
+            except ValueError:
+                moment = dt.fromisoformat(row[0].strip().replace("Z", "+00:00")).timestamp()
+            times.append(moment)
+            rates.append(rate)
+
+    if len(times) < 2:
+        raise ValueError(f"{path}: a rate trace needs at least two rows")
+    order = np.argsort(times, kind="stable")
+    return np.asarray(times)[order], np.asarray(rates)[order]
+
+def csv_shape(options, start, duration):
+    """
+    Recorded trace from `path`, stretched to the time range and linearly
+    interpolated between samples.
+    """
+    if "path" not in options:
+        raise ValueError("csv shape: set shape_options.path to the rate trace")
+    times, rates = read_rate_csv(options["path"])
+    positions = (times - times[0]) / (times[-1] - times[0]) * duration
+    return lambda t: np.interp(t, positions, rates)
+
+SHAPES = {
+    "linear": linear_shape,
+    "sine": sine_shape,
+    "wave": sine_shape,
+    "diurnal": diurnal_shape,
+    "burst": burst_shape,
+    "ramp": ramp_shape,
+    "step": step_shape,
+    "csv": csv_shape,
+}
+
+def load_shape(config, start, duration):
+    """
+    Return the relative rate curve selected by `shape` and `shape_options`.
+
+    Args:
+        config (dict): Configuration settings.
+        start (float): Unix time the range starts at (simulated in backfill).
+        duration (float): Length of the range in seconds.
+
+    Returns:
+        callable: rate(t) for a NumPy array of offsets in seconds; only
+            the proportions between values matter.
+    """
+    name = config.get("shape", "wave")
+    if name not in SHAPES:
+        raise ValueError(f"Unknown shape {name!r}; use one of: {', '.join(SHAPES)}")
+    return SHAPES[name](config.get("shape_options") or {}, start, duration)
+
+def shape_segments(rate, duration, total_events, resolution=None):
+    """
+    Schedule `total_events` along a rate curve by cumulative-rate inversion.
+
+    The curve is integrated over steps of `resolution` seconds and scaled so
+    that its integral is exactly `total_events`. Each step then releases the
+    events whose cumulative index falls inside it, at a constant rate. The
+    cumulative count is rounded (not each step), so no events are lost to
+    rounding and the total always matches. Steps that would release no
+    event are merged into the next one, and trailing ones into the last,
+    so the schedule always spans the whole range.
+
+    Args:
+        rate (callable): Relative rate curve, see load_shape.
+        duration (float): Length of the range in seconds.
+        total_events (int): Events to schedule.
+        resolution (float): Step length in seconds; defaults to the finest
+            step that keeps the range within MAX_STEPS steps.
+
+    Returns:
+        list: (rate, count) segments for Pipeline.run.
+    """
+    if total_events <= 0 or duration <= 0:
+        return []
+    resolution = float(resolution or max(MIN_RESOLUTION, duration / MAX_STEPS))
+    steps = max(1, math.ceil(duration / resolution))
+    edges = np.minimum(np.arange(steps + 1) * resolution, duration)
+    widths = np.diff(edges)
+
+    values = np.asarray(rate((edges[:-1] + edges[1:]) / 2), dtype=float)
+    values = np.broadcast_to(values, widths.shape)
+    if np.any(values < 0) or not np.all(np.isfinite(values)):
+        raise ValueError("Rate curve must be finite and non-negative")
+    area = np.cumsum(values * widths)
+    if area[-1] <= 0:
+        raise ValueError("Rate curve is zero over the whole range")
+
+    cumulative = np.floor(area / area[-1] * total_events + 0.5).astype(np.int64)
+    cumulative[-1] = total_events
+    counts = np.diff(cumulative, prepend=0)
+
+    segments = []
+    pending = 0.0
+    for width, count in zip(widths.tolist(), counts.tolist()):
+        pending += width
+        if count:
+            segments.append((count / pending, count))
+            pending = 0.0
+    if pending:
+        rate, count = segments[-1]
+        segments[-1] = (count / (count / rate + pending), count)
+    return segments
+
+def describe_segments(segments):
+    """
+    Return a short summary of a schedule for the startup output.
+    """
+    if not segments:
+        return "0 events, nothing to schedule"
+    rates = [rate for rate, _ in segments]
+    total = sum(count for _, count in segments)
+    seconds = sum(count / rate for rate, count in segments if rate)
+    return (f"{total:,} events over {seconds / 60:,.1f} minute(s) in {len(segments):,} step(s), "
+            f"rate {min(rates):,.1f}..{max(rates):,.1f} events/s")
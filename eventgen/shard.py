@@ -0,0 +1,188 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+import numpy as np
+from compression import payload_factory
+from filesink import open_sink, sink_payload_config
+from metrics import Metrics
+from pipeline import ByteBudget, Pipeline, TokenBucket, batcher_from_config, schedule_target
+
+# Per-shard counters published to the coordinator
+GENERATED, GENERATED_BYTES, SENT_BYTES, DELIVERED, FAILED, WINDOW, BATCH_BYTES = range(7)
+COUNTERS = 7
+
+def split_segments(segments, shards, index):
+    """
+    Return shard `index`'s share of a (rate, count) schedule.
+
+    Each segment's rate is divided evenly; its count is split so the shares
+    add up exactly, with the remainder rotated across shards per segment.
+
+    Args:
+        segments (list): (rate, count) pairs for the whole run.
+        shards (int): Number of shards.
+        index (int): Shard number, from 0.
+
+    Returns:
+        list: (rate, count) pairs for this shard.
+    """
+    share = []
+    for position, (rate, count) in enumerate(segments):
+        base, extra = divmod(count, shards)
+        gets_extra = (index - position) % shards < extra
+        share.append((rate / shards if rate else rate, base + (1 if gets_extra else 0)))
+    return share
+
+def shard_config(config, index):
+    # Each shard needs its own spool and output directories
+    config = dict(config)
+    if config.get("spool_dir"):
+        config["spool_dir"] = os.path.join(config["spool_dir"], f"shard-{index}")
+    config["file_dir"] = os.path.join(config.get("file_dir", "output"), f"shard-{index}")
+    return config
+
+def _shard_main(config, index, shards, segments, source, seed_seq, barrier, counters, sim_start, byte_budget):
+    config = shard_config(config, index)
+    try:
+        # Independent streams for NumPy and for the `random` module, which
+        # a forked child would otherwise share with its siblings
+        rng = np.random.default_rng(seed_seq)
+        random.seed(int(seed_seq.generate_state(1)[0]))
+
+        make_events, serialize = source(index, rng)
+        dispatcher = open_sink(config)
+        # Each shard serves its own metrics, on metrics_port + shard index
+        metrics = Metrics(config, labels={"shard": str(index)}, port_offset=index)
+    except BaseException:
+        # Release the coordinator and the other shards waiting to start
+        barrier.abort()
+        raise
+    offset = index * COUNTERS
+
+    def publish(pipeline):
+        stats = dispatcher.stats()
+        counters[offset + GENERATED] = pipeline.generated
+        counters[offset + GENERATED_BYTES] = pipeline.generated_bytes
+        counters[offset + SENT_BYTES] = pipeline.sent_bytes
+        counters[offset + DELIVERED] = stats["events"]
+        counters[offset + FAILED] = stats["failed"]
+        if controller:
+            counters[offset + WINDOW] = controller.window
+            counters[offset + BATCH_BYTES] = controller.batch_bytes
+
+    pipeline = Pipeline(
+        send = dispatcher.submit,
+        serialize = serialize,
+        batcher = batcher_from_config(config, payload_factory(sink_payload_config(config))),
+        progress = publish,
+        progress_interval = 1,
+        # Each shard steers to its share of the budget
+        budget = ByteBudget(byte_budget / shards) if byte_budget else None,
+    )
+    controller = getattr(dispatcher, "controller", None)
+    if controller:
+        controller.attach(pipeline.batcher)
+    metrics.register(pipeline.metrics)
+    metrics.register(dispatcher.metrics)
+
+    # Start every shard's pacer from the same instant
+    barrier.wait()
+    try:
+        pipeline.run(split_segments(segments, shards, index), make_events, TokenBucket(0), sim_start)
+    finally:
+        dispatcher.close(config.get("drain_timeout"))
+        metrics.close()
+        publish(pipeline)
+
+def run_sharded(config, segments, source, estimated_events, shards, progress_interval=60, sim_start=None,
+                byte_budget=None):
+    """
+    Run the generator across `shards` worker processes.
+
+    The schedule is split evenly: every shard releases its share of each
+    segment at 1/shards of the rate, from a common start, through its own
+    pipeline and dispatcher. Each shard gets an independent RNG stream
+    spawned from one SeedSequence. The coordinator combines the shards'
+    counters into one progress line and reports the drift from the global
+    schedule.
+
+    Args:
+        config (dict): Generator configuration.
+        segments (list): (rate, count) pairs for the whole run.
+        source (callable): source(shard_index, rng) -> (make_events, serialize),
+            called inside each worker.
+        estimated_events (int): Total events, for progress.
+        shards (int): Number of worker processes.
+        sim_start (float): Backfill start time; shards then interleave
+            their events over the same simulated range.
+        byte_budget (int): Serialized bytes to stop at, split evenly.
+
+    Returns:
+        dict: Combined totals.
+    """
+    # Workers are forked so they inherit the (memory-mapped) sample pool;
+    # fork happens before this process starts any threads
+    context = multiprocessing.get_context("fork")
+    counters = context.Array("d", shards * COUNTERS, lock=False)
+    barrier = context.Barrier(shards + 1)
+    seeds = np.random.SeedSequence(config.get("seed")).spawn(shards)
+
+    workers = [
+        context.Process(target=_shard_main, name=f"shard-{index}",
+                        args=(config, index, shards, segments, source, seeds[index], barrier, counters, sim_start,
+                              byte_budget))
+        for index in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        for worker in workers:
+            worker.join()
+        raise RuntimeError("A generator shard failed to start")
+    start_time = time.time()
+    print(f"Started {shards} generator shard(s)")
+
+    # Cumulative target per second, to report schedule drift
+    target_at = schedule_target(segments)
+
+    def totals():
+        sums = [0.0] * COUNTERS
+        for index in range(shards):
+            for field in range(COUNTERS):
+                sums[field] += counters[index * COUNTERS + field]
+        return sums
+
+    def report():
+        elapsed = time.time() - start_time
+        generated, generated_bytes, sent_bytes, delivered, failed, window, batch_bytes = totals()
+        # Drift from the real-time schedule is meaningless when backfilling
+        target = target_at(elapsed) if sim_start is None else 0
+        drift = ((generated - target) / target * 100) if target else 0
+        pct = (generated / estimated_events) * 100 if estimated_events else 100
+        print(f"{generated:,.6g} events out of {estimated_events:,.6g} -- {pct:.2f} % in {int(elapsed // 60)} minute(s). "
+              f"{shards} shard(s), {sent_bytes / 1024**2:,.1f} MB sent, {delivered:,.0f} delivered, "
+              f"{failed:,.0f} failed batch(es), schedule drift {drift:+.2f} %"
+              + (f", AIMD window {window:.1f} batch {batch_bytes / shards / 1024**2:.2f} MB avg" if window else ""))
+
+    last_print_time = start_time
+    while any(worker.is_alive() for worker in workers):
+        time.sleep(1)
+        for worker in workers:
+            if worker.exitcode not in (None, 0):
+                for other in workers:
+                    if other.is_alive():
+                        other.terminate()
+                raise RuntimeError(f"Generator {worker.name} exited with code {worker.exitcode}")
+        if time.time() - last_print_time >= progress_interval:
+            report()
+            last_print_time = time.time()
+
+    report()
+    generated, generated_bytes, sent_bytes, delivered, failed, _, _ = totals()
+    return {"generated": int(generated), "generated_bytes": int(generated_bytes), "sent_bytes": int(sent_bytes),
+            "delivered": int(delivered), "failed": int(failed), "start_time": start_time}
@@ -0,0 +1,209 @@
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+# Record header: payload length, CRC32 of the payload, event count and a
+# Content-Encoding code, followed by the payload itself
+HEADER = struct.Struct("<IIIB")
+# Ack files hold the 8-byte offsets of delivered records
+ACK = struct.Struct("<Q")
+
+ENCODINGS = {None: 0, "gzip": 1, "zstd": 2}
+ENCODING_NAMES = {code: name for name, code in ENCODINGS.items()}
+
+# A spooled batch. `payload` is only set for in-memory spools.
+Record = namedtuple("Record", "segment offset length events content_encoding payload")
+
+class MemorySpool:
+    """
+    Non-durable spool that keeps unacknowledged batches in memory.
+
+    Used when no `spool_dir` is configured; failed batches are still
+    retried, but are lost if the process exits.
+    """
+
+    durable = False
+
+    def __init__(self):
+        self.pending_bytes = 0
+        self.lock = threading.Lock()
+
+    def append(self, payload, event_count, content_encoding=None):
+        with self.lock:
+            self.pending_bytes += len(payload)
+        return Record(0, 0, len(payload), event_count, content_encoding, payload)
+
+    def read(self, record):
+        return record.payload
+
+    def ack(self, record):
+        with self.lock:
+            self.pending_bytes -= record.length
+
+    def pending(self):
+        return []
+
+    def close(self):
+        pass
+
+class Spool:
+    """
+    Durable write-ahead spool of unacknowledged batches.
+
+    Batches are appended to numbered segment files before they are sent.
+    Delivered batches are acknowledged by appending their offset to the
+    segment's `.ack` file; once every record of a sealed segment has been
+    acknowledged, both files are removed. Opening an existing directory
+    recovers every unacknowledged batch, so a restarted generator resumes
+    delivery where the previous one stopped.
+
+    Args:
+        directory (str): Where segment files are kept.
+        segment_bytes (int): Size at which a new segment is started.
+        fsync (bool): fsync every append, trading throughput for
+            durability across power loss rather than just process exit.
+    """
+
+    durable = True
+
+    def __init__(self, directory, segment_bytes=64 * 1024**2, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+
+        # segment number -> [read fd, records outstanding]
+        self.segments = {}
+        self.pending_bytes = 0
+        self._recovered = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+        self.current = max(self.segments, default=0) + 1
+        self._open_segment(self.current)
+
+    def _path(self, segment, suffix=".seg"):
+        return os.path.join(self.directory, f"{segment:012d}{suffix}")
+
+    def _open_segment(self, segment):
+        self.write_fd = os.open(self._path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.write_offset = os.fstat(self.write_fd).st_size
+        self.segments[segment] = [os.open(self._path(segment), os.O_RDONLY), 0]
+
+    def _recover(self):
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+        for segment in numbers:
+            acked = set()
+            if os.path.exists(self._path(segment, ".ack")):
+                with open(self._path(segment, ".ack"), "rb") as f:
+                    data = f.read()
+                usable = len(data) - len(data) % ACK.size
+                acked = {offset for (offset,) in ACK.iter_unpack(data[:usable])}
+
+            records = []
+            with open(self._path(segment), "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                length, crc, events, code = HEADER.unpack_from(data, offset)
+                start = offset + HEADER.size
+                payload = data[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    # Torn write at the tail of a crashed run; drop the rest
+                    print(f"[!] Spool segment {segment} truncated at offset {offset}")
+                    break
+                if offset not in acked:
+                    records.append(Record(segment, offset, length, events, ENCODING_NAMES.get(code), None))
+                offset = start + length
+
+            if records:
+                self.segments[segment] = [os.open(self._path(segment), os.O_RDONLY), len(records)]
+                self.pending_bytes += sum(record.length for record in records)
+                self._recovered.extend(records)
+            else:
+                self._remove(segment)
+
+        if self._recovered:
+            print(f"[✓] Recovered {len(self._recovered):,} unsent batch(es) from spool {self.directory}")
+
+    def _remove(self, segment):
+        for suffix in (".seg", ".ack"):
+            try:
+                os.remove(self._path(segment, suffix))
+            except FileNotFoundError:
+                pass
+
+    def append(self, payload, event_count, content_encoding=None):
+        """
+        Durably record a batch before it is sent.
+
+        Returns:
+            Record: Handle used to read and acknowledge the batch.
+        """
+        header = HEADER.pack(len(payload), zlib.crc32(payload), event_count, ENCODINGS[content_encoding])
+        with self.lock:
+            if self.write_offset and self.write_offset + len(header) + len(payload) > self.segment_bytes:
+                os.close(self.write_fd)
+                self.current += 1
+                self._open_segment(self.current)
+
+            offset = self.write_offset
+            os.write(self.write_fd, header + payload)
+            if self.fsync:
+                os.fsync(self.write_fd)
+            self.write_offset += len(header) + len(payload)
+            self.segments[self.current][1] += 1
+            self.pending_bytes += len(payload)
+            return Record(self.current, offset, len(payload), event_count, content_encoding, None)
+
+    def read(self, record):
+        fd = self.segments[record.segment][0]
+        return os.pread(fd, record.length, record.offset + HEADER.size)
+
+    def ack(self, record):
+        """
+        Mark a batch as delivered, removing its segment when fully acknowledged.
+        """
+        with self.lock:
+            with open(self._path(record.segment, ".ack"), "ab") as f:
+                f.write(ACK.pack(record.offset))
+            self.pending_bytes -= record.length
+
+            entry = self.segments[record.segment]
+            entry[1] -= 1
+            if entry[1] == 0 and record.segment != self.current:
+                os.close(entry[0])
+                del self.segments[record.segment]
+                self._remove(record.segment)
+
+    def pending(self):
+        """
+        Return the batches recovered from a previous run, oldest first.
+        """
+        records, self._recovered = self._recovered, []
+        return records
+
+    def close(self):
+        with self.lock:
+            os.close(self.write_fd)
+            for segment, (fd, outstanding) in list(self.segments.items()):
+                os.close(fd)
+                if outstanding == 0:
+                    self._remove(segment)
+            self.segments = {}
+
+def open_spool(config):
+    """
+    Return a durable Spool when `spool_dir` is configured, else a MemorySpool.
+    """
+    directory = config.get("spool_dir")
+    if not directory:
+        return MemorySpool()
+    return Spool(
+        directory,
+        segment_bytes = int(config.get("spool_segment_bytes", 64 * 1024**2)),
+        fsync = bool(config.get("spool_fsync", False)),
+    )
@@ -0,0 +1,162 @@
+import random
+import numpy as np
+
+# Events per chunk of the stream (`chunk_events`)
+CHUNK_EVENTS = 256
+
+# First element of each spawn key, so streams of different kinds never
+# share a key: chunks are (CHUNK_STREAM, shard, chunk)
+CHUNK_STREAM = 0xC4
+ESTIMATE_STREAM = 0xE5
+ATTACK_STREAM = 0xA7
+SESSION_STREAM = 0x5E
+
+def run_seed(seed=None):
+    """
+    Return the SeedSequence every random stream of a run derives from.
+
+    With a `seed` the run is reproducible; without one, fresh entropy is
+    drawn once, so shards still get distinct, non-overlapping streams.
+    """
+    return np.random.SeedSequence(seed)
+
+def stream_rng(root, *key):
+    """
+    Return a NumPy Generator for the sub-stream `key` of `root`.
+
+    Streams are derived from (entropy, key) alone, in O(1), so chunk
+    1,000,000 costs the same to seed as chunk 0.
+    """
+    return np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=key))
+
+def stream_random(root, *key):
+    # A random.Random for code written against the `random` module
+    return random.Random(int(stream_rng(root, *key).integers(2**63)))
+
+class EventStream:
+    """
+    A shard's events, cut into fixed-size chunks that can each be
+    regenerated on their own.
+
+    Chunk k is drawn from its own RNG stream, derived from (seed, shard, k),
+    so its rows do not depend on anything generated before it. Attacks, and
+    the clients of a SessionEngine, are the state carried across chunks. With a simulated clock,
+    the scheduler is checked once per chunk, at the time of the chunk's
+    first event, and `seek` replays those checks (without drawing any
+    events) to bring a fresh scheduler to any chunk. In real time the
+    timestamps cannot be reproduced anyway, so attacks are checked on
+    every `take` instead, against the pacer's clock. A stateful row source
+    (a SessionEngine) is brought forward the same way, by drawing the rows
+    of every skipped chunk, so `seek` costs as much as drawing them.
+
+    A stateful source is handed the timestamps of the rows it draws: the
+    clock's, or in real time the pacer's `now`. In real time it draws
+    exactly the rows of each `take`, so none of them are held back in a
+    chunk and sent later than they were drawn for.
+
+    Args:
+        encoder (EventEncoder): Draws benign rows; or a SessionEngine.
+        root (numpy.random.SeedSequence): From run_seed.
+        shard (int): Shard number, part of every chunk's key.
+        chunk_events (int): Events per chunk.
+        attacks (AttackScheduler): Attack campaigns, or None.
+        make_attack (callable): make_attack(pattern, client_ip, rng)
+            returns one attack event dict.
+        clock (ScheduleClock): Simulated timestamps (backfill).
+    """
+
+    def __init__(self, encoder, root, shard=0, chunk_events=CHUNK_EVENTS, attacks=None,
+                 make_attack=None, clock=None):
+        self.encoder = encoder
+        self.root = root
+        self.shard = shard
+        self.chunk_events = int(chunk_events)
+        self.attacks = attacks
+        self.make_attack = make_attack
+        self.clock = clock
+        self.stateful = getattr(encoder, "stateful", False)
+        self.rng = stream_rng(root, ATTACK_STREAM, shard)
+        self.next_chunk = 0
+        self.current = []
+        self.offset = 0
+
+    def chunk_time(self, index):
+        return self.clock.time_of(index * self.chunk_events)
+
+    def draw(self, index, rng):
+        # The rows of chunk `index`; a stateful source keeps time, so it
+        # also gets their timestamps
+        if not self.stateful:
+            return self.encoder.draw(self.chunk_events, rng)
+        times = self.clock.times(index * self.chunk_events, self.chunk_events) if self.clock else None
+        return self.encoder.draw(self.chunk_events, rng, times)
+
+    def inject(self, events, moment, rng):
+        # Due attacks replace benign events at random positions, so the
+        # event count is unchanged
+        due = self.attacks.due(moment, len(events))
+        if due:
+            positions = rng.choice(len(events), size=len(due), replace=False).tolist()
+            for position, (campaign, pattern, client_ip) in zip(positions, due):
+                events[position] = self.make_attack(pattern, client_ip, rng)
+
+    def chunk(self, index):
+        """
+        Draw chunk `index`.
+
+        With a clock, only the first call per chunk index may inject
+        attacks; call the chunks in order, or `seek` first.
+
+        Returns:
+            list: Encoder rows, with attack event dicts mixed in.
+        """
+        rng = stream_rng(self.root, CHUNK_STREAM, self.shard, index)
+        events = self.draw(index, rng)
+        if self.attacks is not None and self.clock is not None:
+            self.inject(events, self.chunk_time(index), rng)
+        return events
+
+    def seek(self, index):
+        """
+        Position the stream at the start of chunk `index`, replaying the
+        attack checks (and stateful draws) of the chunks before it.
+        """
+        for skipped in range(self.next_chunk, index):
+            if self.stateful:
+                self.draw(skipped, stream_rng(self.root, CHUNK_STREAM, self.shard, skipped))
+            if self.attacks is not None and self.clock is not None:
+                self.attacks.due(self.chunk_time(skipped), self.chunk_events)
+        self.next_chunk = index
+        self.current = []
+        self.offset = 0
+
+    def take(self, n, now=None):
+        """
+        Return the next `n` events; the make_events callable of a Pipeline.
+        """
+        if self.stateful and self.clock is None:
+            # Every take is its own chunk, drawn at `now`
+            rng = stream_rng(self.root, CHUNK_STREAM, self.shard, self.next_chunk)
+            events = self.encoder.draw(n, rng, None if now is None else [now] * n)
+            self.next_chunk += 1
+        elif n == self.chunk_events and self.offset >= len(self.current):
+            # Chunk-aligned request: hand the chunk over without copying
+            self.current, self.offset = [], 0
+            events = self.chunk(self.next_chunk)
+            self.next_chunk += 1
+        else:
+            events = []
+            remaining = n
+            while remaining > 0:
+                if self.offset >= len(self.current):
+                    self.current = self.chunk(self.next_chunk)
+                    self.next_chunk += 1
+                    self.offset = 0
+                part = self.current[self.offset:self.offset + remaining]
+                events.extend(part)
+                self.offset += len(part)
+                remaining -= len(part)
+
+        if self.attacks is not None and self.clock is None:
+            self.inject(events, now, self.rng)
+        return events
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules are flat scripts that import each other by name, as when run
+# from eventgen/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+import time
+import pytest
+from dispatcher import AimdController
+from pipeline import Batcher
+
+def fast(controller, n=1, latency=0.01, size=1024):
+    for _ in range(n):
+        controller.on_response(time.perf_counter(), latency, size, False)
+
+def test_window_and_batch_grow_by_one_per_round_trip():
+    controller = AimdController(window=4, batch_bytes=1024**2, increase_bytes=64 * 1024)
+    # A full window of responses adds about one batch in flight and
+    # `increase_bytes` to the batch size
+    fast(controller, 4)
+    assert controller.window == pytest.approx(5, abs=0.1)
+    assert controller.batch_bytes == pytest.approx(1024**2 + 64 * 1024, rel=0.05)
+
+def test_congestion_cuts_once_per_round_trip():
+    controller = AimdController(window=16, batch_bytes=1024**2, decrease=0.5)
+    sent = time.perf_counter()
+    controller.on_response(sent, 0.01, 1024, True)
+    assert controller.window == 8
+    assert controller.batch_bytes == 512 * 1024
+    # Sent before the cut: says nothing about the new window
+    controller.on_response(sent, 0.01, 1024, True)
+    assert (controller.window, controller.cuts) == (8, 1)
+    controller.on_response(time.perf_counter(), 0.01, 1024, True)
+    assert (controller.window, controller.cuts) == (4, 2)
+
+def test_bounds():
+    controller = AimdController(window=2, max_window=3, batch_bytes=128 * 1024,
+                                min_batch_bytes=64 * 1024, max_batch_bytes=256 * 1024)
+    fast(controller, 100)
+    assert controller.window == 3
+    assert controller.batch_bytes == 256 * 1024
+    for _ in range(10):
+        controller.on_response(time.perf_counter(), 0.01, 1024, True)
+    assert controller.window == 1
+    assert controller.batch_bytes == 64 * 1024
+
+def test_slow_response_counts_as_congestion():
+    controller = AimdController(window=8, latency_factor=3.0)
+    fast(controller, 16, latency=0.02)
+    window = controller.window
+    controller.on_response(time.perf_counter(), 0.5, 1024, False)
+    assert controller.window == pytest.approx(window / 2)
+
+def test_larger_batches_alone_are_not_congestion():
+    controller = AimdController(window=8)
+    # Latency proportional to size: 10 ms per 64 KB
+    fast(controller, 16, latency=0.01, size=64 * 1024)
+    controller.on_response(time.perf_counter(), 0.08, 512 * 1024, False)
+    assert controller.cuts == 0
+
+def test_attached_batchers_follow_the_batch_size():
+    controller = AimdController(batch_bytes=1024**2)
+    batcher = Batcher()
+    controller.attach(batcher)
+    assert batcher.max_bytes == 1024**2
+    controller.on_response(time.perf_counter(), 0.01, 1024, True)
+    assert batcher.max_bytes == 512 * 1024
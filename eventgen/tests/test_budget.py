@@ -0,0 +1,30 @@
+import pytest
+from pipeline import Batcher, ByteBudget, Pipeline, TokenBucket
+
+def run(budget, event_size, planned, seconds=2.0):
+    sent = []
+    line = b"x" * event_size
+    pipeline = Pipeline(
+        send = lambda payload, count: sent.append(count),
+        serialize = lambda events, times: [line] * len(events),
+        batcher = Batcher(),
+        budget = ByteBudget(budget, interval=0.05),
+    )
+    # Ten equal steps over `seconds`
+    steps = 10
+    segments = [(planned / seconds, planned // steps)] * steps
+    pipeline.run(segments, lambda n, now: [None] * n, TokenBucket(0))
+    return pipeline
+
+@pytest.mark.parametrize("event_size", [80, 100, 130])
+def test_lands_within_one_percent(event_size):
+    # Planned for 100-byte events
+    budget = 1_000_000
+    pipeline = run(budget, event_size, planned=budget // 100, seconds=0.5)
+    assert pipeline.generated_bytes <= budget
+    assert pipeline.generated_bytes == pytest.approx(budget, rel=0.01)
+
+def test_scale_carries_fractions():
+    budget = ByteBudget(1000)
+    budget.factor = 0.5
+    assert sum(budget.scale(3) for _ in range(10)) == 15
@@ -0,0 +1,19 @@
+import time
+from email.utils import formatdate
+import pytest
+from dispatcher import parse_retry_after
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0),
+    ("0.5", 0.5),
+    ("-3", 0.0),
+    (None, None),
+    ("", None),
+    ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+def test_parse_retry_after_http_date():
+    assert 25 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
@@ -0,0 +1,32 @@
+import ipaddress
+import random
+import numpy as np
+import pytest
+from ipsampler import CidrTable, format_ipv4, public_ipv4_table
+
+def test_format_ipv4():
+    assert format_ipv4(int(ipaddress.IPv4Address("203.0.113.7"))) == "203.0.113.7"
+
+def test_draws_stay_in_their_blocks():
+    table = CidrTable(["10.1.0.0/16", "192.0.2.0/30", "198.51.100.7/32"])
+    networks = [ipaddress.ip_network(cidr) for cidr in table.cidrs]
+    for address in table.draw(2000, np.random.default_rng(1)) + [table.sample(random.Random(1)) for _ in range(200)]:
+        ip = ipaddress.ip_address(address)
+        assert any(ip in net for net in networks)
+        # Network and broadcast addresses are skipped
+        assert address not in ("10.1.0.0", "10.1.255.255", "192.0.2.0", "192.0.2.3")
+
+def test_size_weights_draw_uniformly_over_the_table():
+    table = CidrTable(["10.0.0.0/8", "192.168.0.0/24"], weights="size")
+    addresses = table.draw(10000, np.random.default_rng(2))
+    assert sum(address.startswith("192.168.") for address in addresses) < 10
+
+def test_ipv6():
+    table = CidrTable(["2001:db8::/64"])
+    assert ipaddress.ip_address(table.draw(1, np.random.default_rng(3))[0]) in ipaddress.ip_network("2001:db8::/64")
+    with pytest.raises(ValueError):
+        table.draw_ints(1, np.random.default_rng(3))
+
+def test_public_table_has_no_reserved_space():
+    for address in public_ipv4_table().draw(5000, np.random.default_rng(4)):
+        assert ipaddress.ip_address(address).is_global
@@ -0,0 +1,38 @@
+import gzip
+import json
+import pytest
+from replay import event_time, merged_lines, replay, segment_paths
+
+def write_segment(path, times, **fields):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [json.dumps(dict(fields, time=t)) if t is not None else json.dumps(fields) for t in times]
+    data = ("\n".join(lines) + "\n").encode()
+    if path.suffix == ".gz":
+        data = gzip.compress(data)
+    path.write_bytes(data)
+
+def test_event_time():
+    assert event_time(b'{"event": {}, "time": 1767225600.25, "host": "h"}') == 1767225600.25
+    assert event_time(b'{"time":12,"x":1}') == 12.0
+    assert event_time(b'{"clientAddr": "1.2.3.4"}') is None
+
+def test_shards_are_merged_by_event_time(tmp_path):
+    # Every shard spans the whole range, in two segments each
+    write_segment(tmp_path / "shard-0" / "events-1.ndjson", [0, 2, 4], shard=0)
+    write_segment(tmp_path / "shard-0" / "events-2.ndjson.gz", [6, 8], shard=0)
+    write_segment(tmp_path / "shard-1" / "events-1.ndjson", [1, 3, 5, 7, 9], shard=1)
+
+    paths = segment_paths([str(tmp_path)])
+    assert len(paths) == 3
+    times = [timestamp for timestamp, _ in merged_lines(paths)]
+    assert times == list(range(10))
+
+def test_untimed_events_keep_the_previous_time(tmp_path):
+    write_segment(tmp_path / "a" / "events-1.ndjson", [5, None, 6])
+    assert [timestamp for timestamp, _ in merged_lines(segment_paths([str(tmp_path)]))] == [5, 5, 6]
+
+def test_untimed_segments_are_refused_unless_unpaced(tmp_path):
+    write_segment(tmp_path / "events-1.ndjson", [None, None], clientAddr="1.2.3.4")
+    config = {"webhook_url": "http://127.0.0.1:9/services/collector/raw", "auth_token": "x"}
+    with pytest.raises(ValueError):
+        replay([str(tmp_path)], config, speed=1.0)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from encoder import open_encoder
+from samplepool import build_sample_pool
+from sessions import SessionEngine
+
+@pytest.fixture(scope="module")
+def pool():
+    return build_sample_pool(200, seed=1)
+
+def engine(pool, clients, seed=1, **options):
+    encoder = open_encoder({"server_ips": ["10.0.0.1", "10.0.0.2"]}, pool, "test")
+    return SessionEngine(encoder, pool, clients, np.random.default_rng(seed), **options)
+
+def gaps(engine, rate, seconds, seed=2):
+    rng = np.random.default_rng(seed)
+    last, found = {}, []
+    for first in range(0, int(rate * seconds), 256):
+        times = ((first + np.arange(256)) / rate).tolist()
+        for row, moment in zip(engine.draw(256, rng, times), times):
+            client = row[1]
+            if client in last:
+                found.append(moment - last[client])
+            last[client] = moment
+    return np.array(found)
+
+def test_clients_keep_their_identity(pool):
+    sessions = engine(pool, 50)
+    seen = {}
+    for row in sessions.draw(2000, np.random.default_rng(2)):
+        # Client, user agent, content type, protocol and user
+        identity = (row[7], row[8], row[0], row[9])
+        assert seen.setdefault(row[1], identity) == identity
+    assert len(seen) == 50
+
+def test_draws_are_reproducible(pool):
+    first = engine(pool, 100).draw(1000, np.random.default_rng(2), list(range(1000)))
+    again = engine(pool, 100).draw(1000, np.random.default_rng(2), list(range(1000)))
+    assert first == again
+
+def test_gaps_follow_think_and_idle_times(pool):
+    # A population sized to the rate: 2,000 clients at 10 clicks per
+    # 2,000 s cycle send 10 requests per second
+    found = gaps(engine(pool, 2000), rate=10, seconds=6 * 3600)
+    think, idle = found[found < 300], found[found >= 300]
+    assert len(think) / len(found) == pytest.approx(0.9, abs=0.03)
+    assert think.mean() == pytest.approx(20, rel=0.3)
+    assert idle.mean() == pytest.approx(1800, rel=0.15)
+
+def test_untimed_draws(pool):
+    sessions = engine(pool, 10)
+    assert len(sessions.draw(25, np.random.default_rng(2))) == 25
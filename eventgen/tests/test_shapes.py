@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from shapes import describe_segments, shape_segments
+
+def duration(segments):
+    return sum(count / rate for rate, count in segments if rate)
+
+@pytest.mark.parametrize("curve", [
+    lambda t: np.ones_like(t),
+    lambda t: 1 + np.sin(t / 50),
+    lambda t: t,
+    lambda t: np.where(t < 300, 0.0, 1.0),
+])
+def test_totals_match(curve):
+    segments = shape_segments(curve, 3600, 123457)
+    assert sum(count for _, count in segments) == 123457
+    assert all(count > 0 and rate > 0 for rate, count in segments)
+    assert duration(segments) == pytest.approx(3600)
+
+def test_counts_follow_the_curve():
+    # Twice the rate in the second half
+    segments = shape_segments(lambda t: np.where(t < 50, 1.0, 2.0), 100, 3000, resolution=1)
+    assert [rate for rate, _ in segments[:50]] == pytest.approx([20] * 50)
+    assert [rate for rate, _ in segments[50:]] == pytest.approx([40] * 50)
+
+def test_trailing_idle_keeps_the_range():
+    # Nothing in the last 10 minutes: the run still spans the whole hour
+    segments = shape_segments(lambda t: np.where(t < 3000, 1.0, 0.0), 3600, 5000)
+    assert sum(count for _, count in segments) == 5000
+    assert duration(segments) == pytest.approx(3600)
+
+def test_invalid_curves():
+    with pytest.raises(ValueError):
+        shape_segments(lambda t: np.zeros_like(t), 60, 100)
+    with pytest.raises(ValueError):
+        shape_segments(lambda t: -np.ones_like(t), 60, 100)
+
+def test_empty_schedule():
+    assert shape_segments(lambda t: np.ones_like(t), 60, 0) == []
+    assert describe_segments([]).startswith("0 events")
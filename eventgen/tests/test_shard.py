@@ -0,0 +1,21 @@
+import pytest
+from shard import shard_config, split_segments
+
+@pytest.mark.parametrize("shards", [1, 2, 3, 7])
+def test_shares_add_up(shards):
+    segments = [(100.0, 1001), (0, 0), (50.0, 5), (20.0, 2)]
+    shares = [split_segments(segments, shards, index) for index in range(shards)]
+    for position, (rate, count) in enumerate(segments):
+        assert sum(share[position][1] for share in shares) == count
+        assert sum(share[position][0] for share in shares) == pytest.approx(rate)
+
+def test_remainders_rotate_across_shards():
+    segments = [(1.0, 1)] * 6
+    counts = [sum(count for _, count in split_segments(segments, 3, index)) for index in range(3)]
+    assert counts == [2, 2, 2]
+
+def test_each_shard_gets_its_own_spool():
+    config = {"spool_dir": "/var/spool/eventgen"}
+    assert shard_config(config, 2)["spool_dir"] == "/var/spool/eventgen/shard-2"
+    assert config["spool_dir"] == "/var/spool/eventgen"
+    assert "spool_dir" not in shard_config({}, 0)
@@ -0,0 +1,61 @@
+import os
+from spool import MemorySpool, Spool
+
+def reopen(spool):
+    # A crash: the files stay as they are, nothing is closed or cleaned up
+    return Spool(spool.directory, spool.segment_bytes)
+
+def test_unacked_batches_are_recovered_after_a_crash(tmp_path):
+    spool = Spool(str(tmp_path))
+    records = [spool.append(b"batch %d" % i, i + 1, "gzip" if i == 1 else None) for i in range(3)]
+    spool.ack(records[0])
+
+    recovered = reopen(spool)
+    pending = recovered.pending()
+    assert [recovered.read(record) for record in pending] == [b"batch 1", b"batch 2"]
+    assert [(record.events, record.content_encoding) for record in pending] == [(2, "gzip"), (3, None)]
+    assert recovered.pending_bytes == len(b"batch 1") + len(b"batch 2")
+    # Handed over once
+    assert recovered.pending() == []
+
+def test_acks_survive_a_second_crash(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(3):
+        spool.append(b"batch %d" % i, 1)
+
+    recovered = reopen(spool)
+    first, *rest = recovered.pending()
+    recovered.ack(first)
+
+    again = reopen(recovered)
+    assert [again.read(record) for record in again.pending()] == [b"batch 1", b"batch 2"]
+
+def test_fully_acknowledged_segments_are_removed(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    records = [spool.append(b"x" * 40, 1) for _ in range(3)]
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".seg")]) == 3
+    for record in records:
+        spool.ack(record)
+    spool.close()
+
+    assert os.listdir(tmp_path) == []
+    assert reopen(spool).pending() == []
+
+def test_torn_tail_is_dropped(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.append(b"complete", 1)
+    record = spool.append(b"torn", 1)
+    with open(spool._path(record.segment), "r+b") as f:
+        f.truncate(os.path.getsize(f.name) - 2)
+
+    recovered = reopen(spool)
+    assert [recovered.read(record) for record in recovered.pending()] == [b"complete"]
+
+def test_memory_spool_tracks_pending_bytes():
+    spool = MemorySpool()
+    record = spool.append(b"payload", 3)
+    assert spool.read(record) == b"payload"
+    assert spool.pending_bytes == 7
+    spool.ack(record)
+    assert spool.pending_bytes == 0
+    assert spool.pending() == []
@@ -0,0 +1,37 @@
+import pytest
+from encoder import EventEncoder
+from samplepool import build_sample_pool
+from stream import CHUNK_STREAM, EventStream, run_seed, stream_rng
+
+@pytest.fixture(scope="module")
+def encoder():
+    return EventEncoder(build_sample_pool(200, seed=1), ["10.0.0.1", "10.0.0.2"], "test")
+
+def test_stream_rng_depends_on_seed_and_key_only():
+    root = run_seed(42)
+    first = stream_rng(root, CHUNK_STREAM, 0, 7).integers(0, 2**32, size=8)
+    again = stream_rng(run_seed(42), CHUNK_STREAM, 0, 7).integers(0, 2**32, size=8)
+    assert first.tolist() == again.tolist()
+    for key in ((CHUNK_STREAM, 0, 8), (CHUNK_STREAM, 1, 7)):
+        assert stream_rng(root, *key).integers(0, 2**32, size=8).tolist() != first.tolist()
+    assert run_seed(43).entropy != root.entropy
+
+def test_unseeded_runs_differ():
+    assert run_seed().entropy != run_seed().entropy
+
+def test_chunks_regenerate_alone(encoder):
+    root = run_seed(7)
+    stream = EventStream(encoder, root, chunk_events=64)
+    # Uneven takes cross chunk boundaries
+    events = []
+    for n in (10, 64, 100, 1, 81):
+        events += stream.take(n)
+
+    for index in range(len(events) // 64):
+        alone = EventStream(encoder, run_seed(7), chunk_events=64)
+        alone.seek(index)
+        assert alone.chunk(index) == events[index * 64:(index + 1) * 64]
+
+def test_shards_draw_different_events(encoder):
+    root = run_seed(7)
+    assert EventStream(encoder, root, shard=0).take(64) != EventStream(encoder, root, shard=1).take(64)